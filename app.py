@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import os
 import re
 import base64
@@ -8,9 +7,12 @@ from io import BytesIO
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.svm import SVC
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from PIL import Image
+from disease_inference import (available_model_choices, cascade_stats, classify_image, classify_tiled,
+                               get_prediction_cache, lowres_stats, start_model_watcher)
+from leaf_gate import NotALeafImage
+from tiling import decode_bounded, draw_tile_map
+from upload_guard import UploadRejected
+from precautions import precautions_dict, precautions_dict_kn
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -42,38 +44,6 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
-# === Configurations ===
-IMG_SIZE = (224, 224)
-DATA_DIR = r"E:\plant detection\new"  # Your dataset path
-CLASS_NAMES = sorted(os.listdir(DATA_DIR))
-
-MODEL_OPTIONS = {
-    "VGG16": "plant_disease_vgg16_e10.keras",
-    "VGG19": "plant_disease_vgg19_e10.keras"
-}
-
-# English precautions
-precautions_dict = {
-    "early_blight": "Remove infected leaves, apply copper-based fungicide, and avoid overhead watering.",
-    "late_blight": "Destroy infected plants, use certified seeds, and apply recommended fungicide promptly.",
-    "leaf_mold": "Ensure good air circulation, remove affected foliage, and apply appropriate fungicides.",
-    "septoria_leaf_spot": "Avoid wet foliage, remove infected leaves, and use crop rotation.",
-    "bacterial_spot": "Use resistant varieties, avoid splashing water, and treat with copper spray.",
-    "powdery_mildew": "Increase airflow, use neem oil or sulfur spray, and keep foliage dry.",
-    "rust": "Remove infected leaves, water at the base, and apply sulfur or other fungicides.",
-}
-
-# Kannada precautions (manually translated)
-precautions_dict_kn = {
-    "early_blight": "ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ, ತಾಮ್ರ-ಆಧಾರಿತ ಫಂಗಿಸೈಡ್ ಅನ್ನು ಅನ್ವಯಿಸಿ ಮತ್ತು ಮೇಲಿನ ನೀರಾವರಿಯನ್ನು ತಪ್ಪಿಸಿ.",
-    "late_blight": "ಸೋಂಕು ಹರಡಿದ ಸಸ್ಯಗಳನ್ನು ನಾಶಪಡಿಸಿ, ಪ್ರಮಾಣೀಕೃತ ಬೀಜಗಳನ್ನು ಬಳಸಿ ಮತ್ತು ಶಿಫಾರಸು ಮಾಡಿದ ಫಂಗಿಸೈಡ್ ಅನ್ನು ತಕ್ಷಣ ಅನ್ವಯಿಸಿ.",
-    "leaf_mold": "ಉತ್ತಮ ಗಾಳಿ ಸಂಚಾರವನ್ನು ಖಚಿತಪಡಿಸಿ, ಪೀಡಿತ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ ಮತ್ತು ಸೂಕ್ತವಾದ ಫಂಗಿಸೈಡ್ಗಳನ್ನು ಅನ್ವಯಿಸಿ.",
-    "septoria_leaf_spot": "ನೆನೆದ ಎಲೆಗಳನ್ನು ತಪ್ಪಿಸಿ, ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ ಮತ್ತು ಬೆಳೆ ತಿರುಗಾಟವನ್ನು ಬಳಸಿ.",
-    "bacterial_spot": "ನಿರೋಧಕ ಪ್ರಭೇದಗಳನ್ನು ಬಳಸಿ, ನೀರನ್ನು ಚಿಮ್ಮುವುದನ್ನು ತಪ್ಪಿಸಿ ಮತ್ತು ತಾಮ್ರ ಸ್ಪ್ರೇನೊಂದಿಗೆ ಚಿಕಿತ್ಸೆ ನೀಡಿ.",
-    "powdery_mildew": "ಗಾಳಿಯ ಹರಿವನ್ನು ಹೆಚ್ಚಿಸಿ, ನೀಂ ಎಣ್ಣೆ ಅಥವಾ ಸಲ್ಫರ್ ಸ್ಪ್ರೇ ಬಳಸಿ ಮತ್ತು ಎಲೆಗಳನ್ನು ಒಣಗಿರಿಸಿ.",
-    "rust": "ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ, ಬೇಸಿಗೆಯಲ್ಲಿ ನೀರು ಹಾಕಿ ಮತ್ತು ಸಲ್ಫರ್ ಅಥವಾ ಇತರ ಫಂಗಿಸೈಡ್ಗಳನ್ನು ಅನ್ವಯಿಸಿ.",
-}
-
 # Kannada translations for UI elements and disease names
 translations_kn = {
     "Crop Prediction": "ಬೆಳೆ ಊಹೆ",
@@ -84,6 +54,14 @@ translations_kn = {
     "Submit Crop Prediction": "ಬೆಳೆ ಊಹೆಯನ್ನು ಸಲ್ಲಿಸಿ",
     "Choose Model": "ಮಾದರಿಯನ್ನು ಆಯ್ಕೆಮಾಡಿ",
     "Upload Leaf Image": "ಎಲೆಯ ಚಿತ್ರವನ್ನು ಅಪ್ಲೋಡ್ ಮಾಡಿ",
+    "🤔 The model is not sure about this result. Retake the photo in good light, or try careful analysis.": "🤔 ಈ ಫಲಿತಾಂಶದ ಬಗ್ಗೆ ಮಾದರಿಗೆ ಖಚಿತತೆ ಇಲ್ಲ. ಉತ್ತಮ ಬೆಳಕಿನಲ್ಲಿ ಮತ್ತೆ ಫೋಟೋ ತೆಗೆಯಿರಿ ಅಥವಾ ಎಚ್ಚರಿಕೆಯ ವಿಶ್ಲೇಷಣೆ ಪ್ರಯತ್ನಿಸಿ.",
+    "⚠️ This leaf looks unlike anything the model was trained on (pepper, potato and tomato only). Treat the result with caution.": "⚠️ ಈ ಎಲೆ ಮಾದರಿಗೆ ತರಬೇತಿ ನೀಡಿದ ಬೆಳೆಗಳಂತೆ (ಮೆಣಸು, ಆಲೂಗಡ್ಡೆ ಮತ್ತು ಟೊಮ್ಯಾಟೊ ಮಾತ್ರ) ಕಾಣುತ್ತಿಲ್ಲ. ಫಲಿತಾಂಶವನ್ನು ಎಚ್ಚರಿಕೆಯಿಂದ ಪರಿಗಣಿಸಿ.",
+    "🔎 Similar labelled cases": "🔎 ಹೋಲುವ ಲೇಬಲ್ ಮಾಡಿದ ಪ್ರಕರಣಗಳು",
+    "🚫 This image is too large or not a supported photo. Please upload a JPEG or PNG under 10 MB.": "🚫 ಈ ಚಿತ್ರ ತುಂಬಾ ದೊಡ್ಡದಾಗಿದೆ ಅಥವಾ ಬೆಂಬಲಿತ ಫೋಟೋ ಅಲ್ಲ. ದಯವಿಟ್ಟು 10 MB ಗಿಂತ ಕಡಿಮೆ ಇರುವ JPEG ಅಥವಾ PNG ಅಪ್‌ಲೋಡ್ ಮಾಡಿ.",
+    "Careful analysis for unclear photos (slower)": "ಅಸ್ಪಷ್ಟ ಚಿತ್ರಗಳಿಗೆ ಎಚ್ಚರಿಕೆಯ ವಿಶ್ಲೇಷಣೆ (ನಿಧಾನ)",
+    "Field photo with many leaves (tiled analysis)": "ಅನೇಕ ಎಲೆಗಳಿರುವ ಹೊಲದ ಚಿತ್ರ (ಟೈಲ್ ವಿಶ್ಲೇಷಣೆ)",
+    "Green: healthy tiles · Red: diseased tiles": "ಹಸಿರು: ಆರೋಗ್ಯಕರ ಭಾಗಗಳು · ಕೆಂಪು: ರೋಗಪೀಡಿತ ಭಾಗಗಳು",
+    "🚫 This doesn't look like a plant leaf photo. Please upload a clear image of a single leaf.": "🚫 ಇದು ಸಸ್ಯದ ಎಲೆಯ ಚಿತ್ರದಂತೆ ಕಾಣುತ್ತಿಲ್ಲ. ದಯವಿಟ್ಟು ಒಂದು ಎಲೆಯ ಸ್ಪಷ್ಟ ಚಿತ್ರವನ್ನು ಅಪ್ಲೋಡ್ ಮಾಡಿ.",
     "Prediction Result": "ಊಹೆ ಫಲಿತಾಂಶ",
     "Predicted Class:": "ಊಹಿಸಿದ ವರ್ಗ:",
     "Confidence:": "ನಂಬಿಕೆ:",
@@ -293,23 +271,20 @@ with col2:
     if st.button(translate_text("🩺 Plant Leaf Detection", language)):
         st.session_state.selected_page = "plant"
 
-# === Load model ===
-@st.cache_resource
-def load_selected_model(model_name):
-    return load_model(MODEL_OPTIONS[model_name])
+# === Disease prediction ===
+# Streamlit reruns this script on every widget interaction, so predictions go
+# through the shared cache instead of re-scoring the same upload on each click.
+start_model_watcher()  # idempotent across reruns and sessions
+SIMILAR_CASES = 4  # labelled look-alikes shown as evidence when the model has a similar-case index
+PREVIEW_SIDE = 1024  # the upload is shown from a bounded decode, never at full resolution
 
-def preprocess_image(uploaded_file):
-    img = Image.open(uploaded_file).convert('RGB')
-    img = img.resize(IMG_SIZE)
-    img_array = image.img_to_array(img) / 255.0
-    return np.expand_dims(img_array, axis=0), img
 
-def predict_disease(model, img_array):
-    predictions = model.predict(img_array)
-    predicted_index = np.argmax(predictions)
-    predicted_class = CLASS_NAMES[predicted_index]
-    confidence = np.max(predictions) * 100
-    return predicted_class, confidence
+def classify_upload(model_name, uploaded_file, tiled=False, careful=False):
+    """Predict the disease for an upload, reusing a cached result for identical bytes and model"""
+    if tiled:
+        return classify_tiled(model_name, uploaded_file.getvalue(), cache=get_prediction_cache())
+    return classify_image(model_name, uploaded_file.getvalue(), cache=get_prediction_cache(),
+                          similar_k=SIMILAR_CASES, tta="full" if careful else None)
 
 # === Voice Output Functions ===
 def text_to_speech(text):
@@ -495,21 +470,68 @@ if st.session_state.selected_page == "crop":
 elif st.session_state.selected_page == "plant":
     st.markdown(f"## {'🩺 Plant Leaf Disease Detection' if language == 'English' else '🩺 ಸಸ್ಯ ಎಲೆ ರೋಗ ಪತ್ತೆ'}")
 
-    selected_model_name = st.selectbox(translate_text("Choose Model", language), list(MODEL_OPTIONS.keys()))
+    selected_model_name = st.selectbox(translate_text("Choose Model", language), available_model_choices())
     uploaded_file = st.file_uploader(translate_text("Upload Leaf Image", language), type=["jpg", "jpeg", "png"])
+    tiled = st.checkbox(translate_text("Field photo with many leaves (tiled analysis)", language))
+    careful = st.checkbox(translate_text("Careful analysis for unclear photos (slower)", language))
     username = st.text_input(translate_text("Enter your registered username:"), key="plant_username")
 
     if uploaded_file:
-        st.image(uploaded_file, caption=translate_text("Uploaded Leaf Image", language), use_container_width=True)
-
-        model = load_selected_model(selected_model_name)
-        img_array, img = preprocess_image(uploaded_file)
-        predicted_class, confidence = predict_disease(model, img_array)
+        try:
+            preview = decode_bounded(BytesIO(uploaded_file.getvalue()), PREVIEW_SIDE)
+        except (UploadRejected, OSError):
+            st.warning(translate_text("🚫 This image is too large or not a supported photo. Please upload a JPEG or PNG under 10 MB.", language))
+            st.stop()
+        st.image(preview, caption=translate_text("Uploaded Leaf Image", language), use_container_width=True)
+
+        try:
+            prediction = classify_upload(selected_model_name, uploaded_file, tiled, careful)
+        except UploadRejected:
+            st.warning(translate_text("🚫 This image is too large or not a supported photo. Please upload a JPEG or PNG under 10 MB.", language))
+            st.stop()
+        except NotALeafImage:
+            st.warning(translate_text("🚫 This doesn't look like a plant leaf photo. Please upload a clear image of a single leaf.", language))
+            st.stop()
+        except OSError:  # a truncated or corrupt photo that the preview could still show
+            st.warning(translate_text("🚫 Could not decode this image. Please upload a complete JPEG or PNG photo.", language))
+            st.stop()
+        predicted_class, confidence = prediction["class"], prediction["confidence"]
         display_class = get_kannada_disease_name(predicted_class) if language == "ಕನ್ನಡ" else predicted_class.replace("_", " ")
 
         st.subheader(translate_text("🔍 Prediction Result", language))
         st.write(f"**{translate_text('Predicted Class:', language)}** {display_class}")
         st.write(f"**{translate_text('Confidence:', language)}** {confidence:.2f}%")
+        if "per_model" in prediction:
+            for name, member in prediction["per_model"].items():
+                member_class = get_kannada_disease_name(member["class"]) if language == "ಕನ್ನಡ" else member["class"].replace("_", " ")
+                st.write(f"- {name}: {member_class} ({member['confidence']:.2f}%)")
+        if prediction.get("ood", {}).get("out_of_distribution"):
+            st.warning(translate_text("⚠️ This leaf looks unlike anything the model was trained on (pepper, potato and tomato only). Treat the result with caution.", language))
+        elif prediction.get("uncertain"):
+            st.info(translate_text("🤔 The model is not sure about this result. Retake the photo in good light, or try careful analysis.", language))
+        similar = [case for case in prediction.get("similar", []) if os.path.exists(case["path"])]
+        if similar:
+            with st.expander(translate_text("🔎 Similar labelled cases", language)):
+                st.image([case["path"] for case in similar],
+                         caption=[f"{case['class'].replace('_', ' ')} ({case['score']:.2f})" for case in similar],
+                         width=150)
+        if "tiles" in prediction:
+            st.image(draw_tile_map(decode_bounded(BytesIO(uploaded_file.getvalue())), prediction["tiles"]),
+                     caption=translate_text("Green: healthy tiles · Red: diseased tiles", language),
+                     use_container_width=True)
+            st.caption(f"{prediction['tiles_scored']} tiles scored, {prediction['tiles_skipped']} empty tiles skipped · "
+                       f"{prediction['disease_share'] * 100:.0f}% of scored tiles show disease")
+        if "stage" in prediction:
+            summary = cascade_stats.summary()
+            st.caption(f"Decided by the {prediction['stage']} stage · escalation rate "
+                       f"{summary['escalation_rate'] * 100:.0f}% over {summary['images']} images")
+        if "resolution" in prediction:
+            summary = lowres_stats.summary()
+            st.caption(f"Answered at {prediction['resolution']} px · full-resolution re-runs "
+                       f"{summary['escalation_rate'] * 100:.0f}% over {summary['images']} images")
+        cache_stats = get_prediction_cache().stats()
+        st.caption(f"Prediction cache hit rate: {cache_stats['hit_rate'] * 100:.0f}% "
+                   f"({cache_stats['hits']} hits / {cache_stats['misses']} misses)")
 
         if "healthy" in predicted_class.lower():
             if language == "English":
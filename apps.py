@@ -19,6 +19,7 @@ import secrets
 
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     redirect,
@@ -26,6 +27,7 @@ from flask import (
     url_for,
     flash,
     session,
+    stream_with_context,
 )
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -38,8 +40,30 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Optional: your frontend helpers (ensure they exist)
-from frontend import load_model, predict_disease, preprocess_image, load_selected_model
+# Disease inference helpers (no UI, no import-time model or dataset access)
+from disease_inference import (
+    DEFAULT_MODEL,
+    MODEL_CHOICES,
+    MODEL_OPTIONS,
+    available_model_choices,
+    classify_image,
+    classify_tiled,
+    get_prediction_cache,
+    get_stream_scorer,
+    load_selected_bundle,
+    model_class_names,
+    start_model_watcher,
+    top_k_predictions,
+)
+from leaf_gate import NotALeafImage
+from model_bundle import BundleError
+from shared_store import SharedStore
+from stream_inference import STREAM_TARGET_FPS
+from tf_threads import apply_serving_config
+from tta import TTA_MODES
+from upload_guard import MAX_UPLOAD_BYTES, UploadRejected
+from precautions import get_precaution
+from PIL import Image
 
 # Load environment
 load_dotenv()
@@ -69,10 +93,6 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
-password_reset_tokens = {}
-
-email_verification_codes = {}
-
 # Add this right after your environment variables are loaded
 print("=== CURRENT EMAIL CONFIGURATION ===")
 print(f"EMAIL_ADDRESS: {EMAIL_ADDRESS}")
@@ -111,8 +131,19 @@ gemini_client = genai.GenerativeModel("gemini-2.0-flash")
 # Thread pool for background tasks
 executor = ThreadPoolExecutor(max_workers=2)
 
-# Simple in-memory voice cache (voice_id -> base64 audio). For production, replace with persistent store.
-voice_cache = {}
+# State that spans requests lives in SQLite, so it is found whichever worker process serves the
+# follow-up request (prefork_server.py): OTPs, verification codes and voice_id -> base64 audio
+password_reset_tokens = SharedStore(DB_NAME, 'password_reset')
+email_verification_codes = SharedStore(DB_NAME, 'email_verification')
+voice_cache = SharedStore(DB_NAME, 'voice')
+VOICE_CACHE_SECONDS = 3600
+CODE_VALID_SECONDS = 600  # OTPs and verification codes expire 10 minutes after they are sent
+
+def prune_shared_stores():
+    """Drop expired codes and old voice clips; called whenever one of the stores is written"""
+    password_reset_tokens.prune(CODE_VALID_SECONDS)
+    email_verification_codes.prune(CODE_VALID_SECONDS)
+    voice_cache.prune(VOICE_CACHE_SECONDS)
 
 def init_sqlite_db():
     conn = sqlite3.connect(DB_NAME)
@@ -146,14 +177,6 @@ def init_sqlite_db():
 # Initialize the database
 init_sqlite_db()
 
-# Disease config
-DATA_DIR = r"E:\plant detection\new"
-CLASS_NAMES = sorted(os.listdir(DATA_DIR)) if os.path.isdir(DATA_DIR) else []
-MODEL_OPTIONS = {
-    "VGG16": "plant_disease_vgg16_e10.keras",
-    "VGG19": "plant_disease_vgg19_e10.keras"
-}
-
 # Extract crop details
 def extract_crop_details(query):
     location_match = re.search(r"(Mangalore|Udupi|Raichur|Gulbarga|Mysuru|Hassan|Kasaragodu)", query, re.IGNORECASE)
@@ -295,6 +318,10 @@ def verify_email():
             return render_template('verify_email.html', email=email)
         
         if entered_code == stored_data['code']:
+            # Claim the code atomically: a concurrent request with the same code on another worker gets None
+            if email_verification_codes.pop(email) is None:
+                flash('Verification code expired. Please request a new one.', 'error')
+                return render_template('verify_email.html', email=email)
             # Code verified - complete registration
             try:
                 with sqlite3.connect(DB_NAME) as conn:
@@ -318,7 +345,6 @@ def verify_email():
                 session.pop('pending_name', None)
                 session.pop('pending_phone', None)
                 session.pop('pending_password', None)
-                del email_verification_codes[email]
                 
                 flash('Email verified successfully! Registration complete. Please login.', 'success')
                 return redirect(url_for('user_login'))
@@ -348,6 +374,7 @@ def resend_verification():
         'code': verification_code,
         'expiry': expiry_time
     }
+    prune_shared_stores()
     
     if send_verification_email(email, verification_code):
         return jsonify({'success': True, 'message': 'Verification code sent!'})
@@ -440,6 +467,7 @@ def signup():
             'code': verification_code,
             'expiry': expiry_time
         }
+        prune_shared_stores()
         
         # Store user data in session for verification
         session['pending_email'] = email
@@ -524,6 +552,7 @@ def chatbot_response():
         audio_b64 = text_to_speech(response_text, language)
         if audio_b64:
             voice_cache[voice_id] = audio_b64
+            prune_shared_stores()
 
     executor.submit(make_tts)
 
@@ -554,6 +583,219 @@ def process_voice_input():
 
     return jsonify({'text': text})
 
+# === Plant disease API ===
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Room for multipart boundaries/form fields, and base64's 4/3 expansion in JSON bodies
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES * 4 // 3 + 64 * 1024
+
+# Werkzeug enforces this while it reads any body, including multipart parsing and chunked bodies
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+class UploadTooLarge(Exception):
+    pass
+
+@app.errorhandler(413)
+def request_too_large(e):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+    return e
+
+def read_bounded(stream, limit=MAX_UPLOAD_BYTES):
+    """Copy a stream into memory in fixed-size chunks, refusing to hold more than `limit` bytes"""
+    buffer = BytesIO()
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > limit:
+            raise UploadTooLarge()
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+def preload_disease_model():
+    try:
+        load_selected_bundle(DEFAULT_MODEL)
+        logger.info(f"Disease model {DEFAULT_MODEL} preloaded")
+    except Exception as e:
+        logger.warning(f"Disease model preload failed: {e}")
+
+apply_serving_config()  # TF pools and INFERENCE_CPUS pinning, on the main thread before any request thread runs
+executor.submit(preload_disease_model)
+start_model_watcher()
+
+@app.route('/api/predict_disease', methods=['POST'])
+def api_predict_disease():
+    declared = request.content_length
+    if declared is not None and declared > MAX_REQUEST_BYTES:
+        return jsonify({'error': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+
+    mimetype = request.mimetype
+    try:
+        if mimetype in ('multipart/form-data', 'application/json') and declared is None:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        if mimetype == 'multipart/form-data':
+            params = request.form
+            upload = request.files.get('image')
+            if not upload:
+                return jsonify({'error': "Missing 'image' file field"}), 400
+            image_bytes = read_bounded(upload.stream)
+        elif mimetype == 'application/json':
+            params = request.get_json(silent=True) or {}
+            try:
+                image_bytes = base64.b64decode(params.get('image', ''), validate=True)
+            except (TypeError, ValueError):
+                return jsonify({'error': "'image' must be base64-encoded"}), 400
+            if len(image_bytes) > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge()
+        elif mimetype.startswith('image/'):
+            params = request.args
+            image_bytes = read_bounded(request.stream)
+        else:
+            return jsonify({'error': 'Send multipart/form-data, application/json or an image/* body'}), 415
+    except UploadTooLarge:
+        return jsonify({'error': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+    if not image_bytes:
+        return jsonify({'error': 'Empty image'}), 400
+
+    model_name = params.get('model', DEFAULT_MODEL)
+    if model_name not in MODEL_CHOICES:
+        return jsonify({'error': f'Unknown model {model_name}'}), 400
+    language = 'kn' if params.get('language', 'en') in ('kn', 'ಕನ್ನಡ') else 'en'
+    try:
+        top_k = int(params.get('top_k', 3))
+    except (TypeError, ValueError):
+        return jsonify({'error': "'top_k' must be an integer"}), 400
+    tiled = str(params.get('tiled', '')).lower() in ('1', 'true', 'yes')
+    try:
+        similar_k = min(int(params.get('similar', 0)), 20)
+    except (TypeError, ValueError):
+        return jsonify({'error': "'similar' must be an integer"}), 400
+    tta = params.get('tta') or None
+    if tta is not None and tta not in TTA_MODES:
+        return jsonify({'error': f"'tta' must be one of {', '.join(TTA_MODES)}"}), 400
+
+    try:
+        if tiled:
+            prediction = classify_tiled(model_name, image_bytes, cache=get_prediction_cache())
+        else:
+            prediction = classify_image(model_name, image_bytes, cache=get_prediction_cache(),
+                                        similar_k=similar_k, tta=tta)
+        class_names = model_class_names(model_name)
+    except UploadRejected as e:
+        return jsonify({'error': f'Image rejected: {e.reason}'}), 413 if e.too_large else 415
+    except (OSError, Image.DecompressionBombError):  # UnidentifiedImageError, or a truncated or corrupt JPEG
+        return jsonify({'error': 'Could not decode the image'}), 400
+    except NotALeafImage as e:
+        return jsonify({'error': 'The image does not look like a plant leaf', 'reason': e.reason}), 422
+    except BundleError as e:
+        logger.error(f"Disease model unavailable: {e}")
+        return jsonify({'error': 'Disease model is unavailable'}), 503
+
+    predicted_class = prediction['class']
+    response = {
+        'model': model_name,
+        'class': predicted_class,
+        'confidence': round(prediction['confidence'], 2),
+        'healthy': 'healthy' in predicted_class.lower(),
+        'top_k': top_k_predictions(prediction['probabilities'], class_names, top_k),
+        'precaution': get_precaution(predicted_class, language),
+        'language': language,
+    }
+    if 'ood' in prediction:
+        response['out_of_distribution'] = prediction['ood']['out_of_distribution']
+        response['ood_distance'] = round(prediction['ood']['distance'], 3)
+    if 'resolution' in prediction:
+        response['resolution'] = prediction['resolution']
+    if 'uncertain' in prediction:
+        response['uncertain'] = bool(prediction['uncertain'])
+    if 'tta' in prediction:
+        response['tta'] = prediction['tta']
+    if 'similar' in prediction:
+        response['similar'] = [{'file': os.path.basename(case['path']), 'class': case['class'],
+                                'score': round(case['score'], 4)} for case in prediction['similar']]
+    if tiled:
+        response.update({key: prediction[key] for key in ('tiles', 'grid', 'image_size', 'tiles_scored',
+                                                          'tiles_skipped', 'disease_share')})
+    return jsonify(response)
+
+# === Live camera stream ===
+STREAM_EVENT_TIMEOUT = 15  # seconds between keep-alive comments on an idle event stream
+
+@app.route('/stream')
+def stream_page():
+    if 'username' not in session:
+        return redirect(url_for('user_login'))
+    models = [name for name in available_model_choices() if name in MODEL_OPTIONS]
+    return render_template('stream.html', username=session['username'], models=models, target_fps=STREAM_TARGET_FPS)
+
+@app.route('/api/stream', methods=['POST'])
+def api_stream_open():
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    params = request.get_json(silent=True) or request.form
+    model_name = params.get('model', DEFAULT_MODEL)
+    if model_name not in MODEL_OPTIONS:
+        return jsonify({'error': f'Streaming needs a single model: {", ".join(MODEL_OPTIONS)}'}), 400
+    stream = get_stream_scorer().open(model_name)
+    if stream is None:
+        return jsonify({'error': 'Too many live streams, try again shortly'}), 503
+    return jsonify({'stream_id': stream.id, 'model': model_name})
+
+@app.route('/api/stream/<stream_id>/frame', methods=['POST'])
+def api_stream_frame(stream_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    scorer = get_stream_scorer()
+    stream = scorer.get(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    try:
+        frame = read_bounded(request.stream)
+        status = scorer.submit(stream, frame, load_selected_bundle(stream.model_name).input_size)
+    except UploadTooLarge:
+        return jsonify({'error': f'Frame exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+    except UploadRejected as e:
+        return jsonify({'error': f'Frame rejected: {e.reason}'}), 413 if e.too_large else 400
+    except OSError:  # UnidentifiedImageError, or a truncated or corrupt JPEG
+        return jsonify({'error': 'Could not decode the frame'}), 400
+    except BundleError as e:
+        logger.error(f"Disease model unavailable: {e}")
+        return jsonify({'error': 'Disease model is unavailable'}), 503
+    return jsonify({'status': status, 'stats': stream.stats()})
+
+@app.route('/api/stream/<stream_id>/events')
+def api_stream_events(stream_id):
+    """Server-sent events: one smoothed result per scored frame"""
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    scorer = get_stream_scorer()
+    stream = scorer.get(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+
+    def events():
+        sequence = 0
+        while scorer.get(stream_id) is stream:
+            result = scorer.wait_for_result(stream, sequence, STREAM_EVENT_TIMEOUT)
+            if result is None:
+                yield ": keep-alive\n\n"
+                continue
+            sequence = result['sequence']
+            yield f"data: {json.dumps(result)}\n\n"
+        yield "event: closed\ndata: {}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/stream/<stream_id>', methods=['DELETE'])
+def api_stream_close(stream_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    stream = get_stream_scorer().close(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    return jsonify({'stats': stream.stats()})
+
 # Generate OTP
 def generate_otp():
     return str(random.randint(1000, 9999))
@@ -626,6 +868,7 @@ def forgot_password():
                 'expiry': expiry_time,
                 'email': email
             }
+            prune_shared_stores()
             
             # Send OTP email
             if send_otp_email(email, otp):
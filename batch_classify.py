@@ -0,0 +1,240 @@
+"""Classify every image under a folder (or a single image) with a disease model bundle, headless.
+
+Images are found by walking the folder tree. They are decoded and
+normalised on a thread pool that keeps `--prefetch` batches ready ahead of
+the model, and scored with one predict_on_batch per batch. Each finished
+batch is appended to the CSV or JSONL output and flushed, so the output
+file is also the checkpoint. Running the same command again skips images
+that are already in it, so an interrupted run resumes where it stopped.
+Rows that recorded a decode error are dropped on resume and those images
+are tried again.
+
+    python batch_classify.py "E:\\field photos\\2025-07" --model VGG19 --output july.csv
+    python batch_classify.py photos/ --output photos.jsonl --top-k 3
+    python batch_classify.py leaf.jpg
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from fast_preprocess import decode_resized, normalize_into
+from leaf_dataset import IMAGE_EXTENSIONS
+
+DEFAULT_OUTPUT = "predictions.csv"
+PROGRESS_EVERY = 10.0  # seconds between progress lines
+CSV_FIELDS = ["path", "predicted_class", "confidence", "top_k", "model", "model_version", "error"]
+
+
+def find_images(root):
+    """Image files under `root` (or `root` itself), in a stable sorted order"""
+    if os.path.isfile(root):
+        return [root]
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+    return found
+
+
+def output_format(path):
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+# === Checkpoint ===
+def _truncate_partial_line(path):
+    """Drop a half-written last line left by a crash, so appended rows start on a fresh line"""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def completed_paths(path):
+    """Paths already scored in an existing output file.
+
+    Rows with an error are removed from the file, so their images are
+    classified again rather than skipped forever.
+    """
+    if not os.path.exists(path):
+        return set()
+    _truncate_partial_line(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if output_format(path) == "jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    kept = [row for row in rows if not row.get("error")]
+    if len(kept) < len(rows):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            if output_format(path) == "jsonl":
+                f.writelines(json.dumps(row) + "\n" for row in kept)
+            else:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                writer.writeheader()
+                writer.writerows(kept)
+        os.replace(tmp_path, path)
+        print(f"🔁 Retrying {len(rows) - len(kept)} images that failed last time")
+    return {row["path"] for row in kept}
+
+
+class ResultWriter:
+    """Appends result rows to CSV or JSONL and flushes after every batch"""
+
+    def __init__(self, path):
+        self.format = output_format(path)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if is_new:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self._csv is not None:
+                self._csv.writerow({**row, "top_k": json.dumps(row["top_k"]) if row["top_k"] else ""})
+            else:
+                self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# === Pipeline ===
+def _load_batch(paths, size):
+    """(float32 batch of the images that decoded, their paths, {path: error} for the rest)"""
+    width, height = size
+    batch = np.empty((len(paths), height, width, 3), dtype=np.float32)
+    decoded, errors = [], {}
+    for path in paths:
+        try:
+            normalize_into(decode_resized(path, size), batch[len(decoded)])
+            decoded.append(path)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            errors[path] = str(e) or type(e).__name__
+    return batch[:len(decoded)], decoded, errors
+
+
+def iter_decoded(paths, batch_size, size, workers=4, prefetch=4):
+    """Yield _load_batch results in order, with up to `prefetch` batches decoding ahead of the consumer"""
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(_load_batch, chunk, size) for chunk in chunks[:prefetch]]
+        next_chunk = len(pending)
+        while pending:
+            result = pending.pop(0).result()
+            if next_chunk < len(chunks):
+                pending.append(pool.submit(_load_batch, chunks[next_chunk], size))
+                next_chunk += 1
+            yield result
+
+
+def result_rows(bundle, probabilities, paths, errors, relative_to, top_k=1):
+    def name(path):
+        return os.path.relpath(path, relative_to) if relative_to else path
+
+    rows = []
+    for path, row in zip(paths, probabilities):
+        order = np.argsort(row)[::-1][:top_k]
+        rows.append({
+            "path": name(path),
+            "predicted_class": bundle.class_names[order[0]],
+            "confidence": round(float(row[order[0]]) * 100, 2),
+            "top_k": [[bundle.class_names[i], round(float(row[i]) * 100, 2)] for i in order] if top_k > 1 else [],
+            "model": bundle.name,
+            "model_version": bundle.version,
+            "error": "",
+        })
+    for path, error in errors.items():
+        rows.append({"path": name(path), "predicted_class": "", "confidence": "", "top_k": [],
+                     "model": bundle.name, "model_version": bundle.version, "error": error})
+    return rows
+
+
+def classify_paths(bundle, paths, writer, relative_to=None, batch_size=32, workers=4, prefetch=4, top_k=1):
+    """Score `paths` in batches and write each batch's rows; returns (images scored, failures, seconds)"""
+    scored = failed = 0
+    start = last_report = time.perf_counter()
+    for batch, decoded, errors in iter_decoded(paths, batch_size, bundle.input_size, workers, prefetch):
+        probabilities = np.asarray(bundle.model.predict_on_batch(batch)) if len(batch) else np.empty((0, 0))
+        writer.write(result_rows(bundle, probabilities, decoded, errors, relative_to, top_k))
+        scored += len(decoded)
+        failed += len(errors)
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_EVERY:
+            last_report = now
+            print(f"⏳ {scored + failed}/{len(paths)} images, {scored / (now - start):.1f} images/sec")
+    return scored, failed, time.perf_counter() - start
+
+
+def main(argv=None):
+    from disease_inference import DEFAULT_MODEL, MODEL_OPTIONS
+    from model_bundle import load_bundle
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Folder of images (walked recursively) or a single image")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="A MODEL_OPTIONS name or a bundle dir")
+    parser.add_argument("--output", help=f"Results file, .csv or .jsonl (default {DEFAULT_OUTPUT}; "
+                                         "a single image is printed instead)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="Decode threads")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches decoded ahead of the model")
+    parser.add_argument("--top-k", type=int, default=1, help="Also record the k most likely classes")
+    parser.add_argument("--restart", action="store_true", help="Overwrite the output instead of resuming")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        raise SystemExit(f"❌ {args.input} does not exist")
+    bundle = load_bundle(MODEL_OPTIONS.get(args.model, args.model))
+    print(f"✅ Model {bundle.name} v{bundle.version} loaded")
+
+    if os.path.isfile(args.input) and args.output is None:
+        batch, decoded, errors = _load_batch([args.input], bundle.input_size)
+        if errors:
+            raise SystemExit(f"❌ Could not read {args.input}: {errors[args.input]}")
+        row = result_rows(bundle, np.asarray(bundle.model.predict_on_batch(batch)), decoded, {}, None,
+                          max(args.top_k, 1))[0]
+        print(f"\n✅ Predicted Class: {row['predicted_class']}")
+        print(f"🧠 Confidence: {row['confidence']:.2f}%")
+        return
+
+    output = args.output or DEFAULT_OUTPUT
+    if args.restart and os.path.exists(output):
+        os.remove(output)
+    relative_to = None if os.path.isfile(args.input) else args.input
+    paths = find_images(args.input)
+    done = completed_paths(output)
+    todo = [path for path in paths
+            if (os.path.relpath(path, relative_to) if relative_to else path) not in done]
+    print(f"📂 {len(paths)} images found, {len(paths) - len(todo)} already in {output}, {len(todo)} to classify")
+    if not todo:
+        return
+
+    writer = ResultWriter(output)
+    try:
+        scored, failed, seconds = classify_paths(bundle, todo, writer, relative_to, args.batch_size,
+                                                 args.workers, args.prefetch, args.top_k)
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrupted; run the same command again to resume from {output}")
+        sys.exit(130)
+    finally:
+        writer.close()
+    print(f"✅ {scored} images classified in {seconds:.1f} s ({scored / max(seconds, 1e-9):.1f} images/sec) -> {output}")
+    if failed:
+        print(f"⚠️ {failed} images could not be decoded; see the 'error' column")
+
+
+if __name__ == "__main__":
+    main()
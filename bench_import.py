@@ -0,0 +1,56 @@
+"""Measure cold-import time of the inference helpers in fresh interpreters.
+
+Usage:
+    python bench_import.py                       # disease_inference vs frontend
+    python bench_import.py disease_inference apps --runs 5
+
+Each import runs in a new process, so nothing is already cached in
+sys.modules. Streamlit and TensorFlow are reported when the import pulls
+them in.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "heavy": [m for m in ("tensorflow", "streamlit") if m in sys.modules]}}))
+"""
+
+
+def time_import(module, runs):
+    timings = []
+    heavy = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", _PROBE.format(module=module)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None, proc.stderr.strip().splitlines()[-1:]
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result["ms"])
+        heavy = result["heavy"]
+    return statistics.median(timings), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["disease_inference", "frontend"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'module':<20} {'median ms':>10}  pulls in")
+    for module in args.modules:
+        ms, heavy = time_import(module, args.runs)
+        if ms is None:
+            print(f"{module:<20} {'failed':>10}  {' '.join(heavy)}")
+        else:
+            print(f"{module:<20} {ms:>10.1f}  {', '.join(heavy) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Measure worker memory with preloaded (pre-fork, copy-on-write) versus per-worker model loading.
+
+    python bench_prefork.py
+    python bench_prefork.py --workers 1,4,8 --models VGG16,VGG19 --output prefork_memory.json
+
+Every configuration runs in a fresh master process, set up as
+prefork_server.py would set it up. With "preload" the master loads and
+warms the models, then forks. With "per-worker" each forked worker loads
+its own copy. Every worker then scores one image per model, which touches
+all of its weights, and reports /proc/self/smaps_rollup while all workers
+are alive. Shared pages are only split between processes that still map
+them. "total PSS" is the real footprint of the master plus its workers.
+Linux only.
+"""
+import argparse
+import gc
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from prefork_server import fork_worker, probe_models, process_memory
+from tf_threads import apply_serving_config
+
+MODES = ("preload", "per-worker")
+
+
+def _worker(mode, model_names, report, release, unused):
+    from disease_inference import preload_models
+
+    for fd in unused:
+        os.close(fd)  # so the master sees EOF on the report pipe and the workers on the release pipe
+    if mode == "per-worker":
+        apply_serving_config(0, 0, [])
+        preload_models(model_names)
+    if not probe_models():
+        return 1
+    os.write(report, (json.dumps(process_memory()) + "\n").encode())
+    os.close(report)
+    os.read(release, 1)  # stay alive until every worker has reported
+
+
+def _measure(mode, workers, model_names, results):
+    if mode == "preload":
+        from disease_inference import preload_models
+
+        apply_serving_config(1, -1, [])
+        preload_models(model_names)
+        gc.freeze()
+    report_r, report_w = os.pipe()
+    release_r, release_w = os.pipe()
+    pids = [fork_worker(_worker, mode, model_names, report_w, release_r, (report_r, release_w))
+            for _ in range(workers)]
+    os.close(report_w)
+    os.close(release_r)
+    with os.fdopen(report_r) as lines:  # ends once every worker has reported or exited
+        reports = [json.loads(line) for line in lines]
+    master = process_memory()
+    os.close(release_w)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    results.put({"master": master, "workers": reports})
+
+
+def run_config(mode, workers, model_names):
+    """Master and per-worker memory for one configuration, each in a fresh process"""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(mode, workers, model_names, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    if len(result["workers"]) < workers:
+        raise RuntimeError(f"{mode}: only {len(result['workers'])} of {workers} workers could run the models")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,4,8")
+    parser.add_argument("--models", default="VGG16,VGG19", help="MODEL_OPTIONS names")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    model_names = args.models.split(",")
+    rows = []
+    print(f"🧠 Models: {', '.join(model_names)}")
+    print(f"{'mode':<11} {'workers':>7} {'RSS/worker':>11} {'PSS/worker':>11} {'private/worker':>15} "
+          f"{'master PSS':>11} {'total PSS':>10} {'sum of RSS':>11}")
+    for mode in MODES:
+        for workers in (int(w) for w in args.workers.split(",")):
+            result = run_config(mode, workers, model_names)
+            reports, master = result["workers"], result["master"]
+            row = {
+                "mode": mode,
+                "workers": workers,
+                "rss_per_worker_mb": float(np.mean([r["rss_mb"] for r in reports])),
+                "pss_per_worker_mb": float(np.mean([r["pss_mb"] for r in reports])),
+                "private_per_worker_mb": float(np.mean([r["private_mb"] for r in reports])),
+                "master_pss_mb": master["pss_mb"],
+                "total_pss_mb": master["pss_mb"] + sum(r["pss_mb"] for r in reports),
+                "total_rss_mb": master["rss_mb"] + sum(r["rss_mb"] for r in reports),
+            }
+            rows.append(row)
+            print(f"{mode:<11} {workers:>7} {row['rss_per_worker_mb']:>8.0f} MB {row['pss_per_worker_mb']:>8.0f} MB "
+                  f"{row['private_per_worker_mb']:>12.0f} MB {row['master_pss_mb']:>8.0f} MB "
+                  f"{row['total_pss_mb']:>7.0f} MB {row['total_rss_mb']:>8.0f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"models": model_names, "results": rows}, f, indent=2)
+        print(f"\n📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Benchmark the legacy and fast leaf-image preprocessing paths on phone-size JPEGs.
+
+Usage:
+    python bench_preprocess.py --images path/to/phone/photos
+    python bench_preprocess.py            # synthesises 12 MP JPEGs from new/
+    python bench_preprocess.py --hostile  # oversized uploads and a decompression bomb
+
+Each path runs in a fresh process so that its peak RSS growth is measured
+in isolation.
+"""
+import argparse
+import glob
+import io
+import multiprocessing as mp
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from fast_preprocess import IMG_SIZE, preprocess_image_fast
+from upload_guard import UploadRejected
+
+PHONE_SIZE = (4032, 3024)  # 12 MP
+
+
+def preprocess_image_legacy(source):
+    # Same steps as preprocess_image in app.py, without importing TensorFlow
+    img = Image.open(source).convert('RGB')
+    img = img.resize(IMG_SIZE)
+    img_array = np.asarray(img, dtype=np.float32) / 255.0
+    return np.expand_dims(img_array, axis=0), img
+
+
+def synthesize_phone_jpegs(data_dir, count):
+    paths = sorted(glob.glob(os.path.join(data_dir, "*", "*.JPG")) + glob.glob(os.path.join(data_dir, "*", "*.jpg")))
+    blobs = []
+    for path in paths[:: max(1, len(paths) // count)][:count]:
+        img = Image.open(path).convert('RGB').resize(PHONE_SIZE, Image.BICUBIC)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        blobs.append(buf.getvalue())
+    return blobs
+
+
+def load_blobs(images_dir):
+    blobs = []
+    for path in sorted(glob.glob(os.path.join(images_dir, "**", "*"), recursive=True)):
+        if path.lower().endswith((".jpg", ".jpeg")):
+            with open(path, "rb") as f:
+                blobs.append(f.read())
+    return blobs
+
+
+def _reset_peak_rss():
+    # Linux only: restart the VmHWM high-water mark, which a spawned child
+    # otherwise inherits from the parent process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run(method, blobs, repeats, results):
+    fn = preprocess_image_fast if method == "fast" else preprocess_image_legacy
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+    fn(io.BytesIO(blobs[0]))  # warm-up
+    timings = []
+    for _ in range(repeats):
+        for blob in blobs:
+            start = time.perf_counter()
+            fn(io.BytesIO(blob))
+            timings.append((time.perf_counter() - start) * 1000)
+    peak_kb = _peak_rss_kb()
+    results.put({
+        "method": method,
+        "mean_ms": float(np.mean(timings)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "peak_growth_mb": None if baseline_kb is None else (peak_kb - baseline_kb) / 1024,
+    })
+
+
+# === Hostile uploads ===
+def _png_chunk(kind, data):
+    return struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def png_bomb(width, height):
+    """A small grayscale PNG that declares width x height pixels of zeros"""
+    compressor = zlib.compressobj(9)
+    row = b"\x00" * (width + 1)
+    data = b"".join(compressor.compress(row) for _ in range(height)) + compressor.flush()
+    header = struct.pack("!IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", data) + _png_chunk(b"IEND", b"")
+
+
+def synthesize_hostile(data_dir):
+    """(name, bytes) uploads that an unguarded decode would blow up to hundreds of MB"""
+    path = sorted(glob.glob(os.path.join(data_dir, "*", "*.JPG")) + glob.glob(os.path.join(data_dir, "*", "*.jpg")))[0]
+    leaf = Image.open(path).convert('RGB')
+    cases = []
+    for name, size, fmt in (("48 MP JPEG", (8000, 6000), "JPEG"), ("80 MP JPEG", (10328, 7746), "JPEG"),
+                            ("15 MP PNG", (4472, 3354), "PNG"), ("24 MP PNG", (5657, 4243), "PNG")):
+        buf = io.BytesIO()
+        leaf.resize(size).save(buf, format=fmt, **({"quality": 85} if fmt == "JPEG" else {"compress_level": 1}))
+        cases.append((name, buf.getvalue()))
+    cases.append(("PNG bomb 900 MP", png_bomb(30000, 30000)))
+    return cases
+
+
+def _run_hostile(blob, results):
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+    start = time.perf_counter()
+    try:
+        preprocess_image_fast(io.BytesIO(blob))
+        outcome = "decoded"
+    except UploadRejected as e:
+        outcome = f"rejected: {e.reason}"
+    results.put({
+        "ms": (time.perf_counter() - start) * 1000,
+        "peak_growth_mb": None if baseline_kb is None else (_peak_rss_kb() - baseline_kb) / 1024,
+        "outcome": outcome,
+    })
+
+
+def bench_hostile(data_dir):
+    ctx = mp.get_context("spawn")
+    print(f"{'upload':<16} {'size MB':>8} {'ms':>8} {'peak RSS growth':>16}  outcome")
+    for name, blob in synthesize_hostile(data_dir):
+        results = ctx.Queue()
+        proc = ctx.Process(target=_run_hostile, args=(blob, results))
+        proc.start()
+        row = results.get()
+        proc.join()
+        peak = "n/a" if row["peak_growth_mb"] is None else f"{row['peak_growth_mb']:.1f} MB"
+        print(f"{name:<16} {len(blob) / 1e6:>8.1f} {row['ms']:>8.1f} {peak:>16}  {row['outcome']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of real phone JPEGs")
+    parser.add_argument("--data-dir", default="new", help="Dataset used to synthesise phone-size JPEGs")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--hostile", action="store_true", help="Measure the upload guard on oversized images instead")
+    args = parser.parse_args()
+
+    if args.hostile:
+        bench_hostile(args.data_dir)
+        return
+
+    blobs = load_blobs(args.images) if args.images else synthesize_phone_jpegs(args.data_dir, args.count)
+    if not blobs:
+        print("❌ No JPEG images found.")
+        return
+    print(f"📂 {len(blobs)} images, {np.mean([len(b) for b in blobs]) / 1e6:.1f} MB average")
+
+    ctx = mp.get_context("spawn")
+    print(f"{'method':<8} {'mean ms':>9} {'p95 ms':>9} {'peak RSS growth':>16}")
+    for method in ("legacy", "fast"):
+        results = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(method, blobs, args.repeats, results))
+        proc.start()
+        row = results.get()
+        proc.join()
+        peak = "n/a" if row["peak_growth_mb"] is None else f"{row['peak_growth_mb']:.1f} MB"
+        print(f"{row['method']:<8} {row['mean_ms']:>9.1f} {row['p95_ms']:>9.1f} {peak:>16}")
+
+
+if __name__ == "__main__":
+    main()
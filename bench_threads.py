@@ -0,0 +1,137 @@
+"""Sweep TF intra/inter-op thread counts and CPU pinning under concurrent load on this host.
+
+Each configuration starts `workers` fresh processes (like Flask workers or
+inference workers). Each process applies the thread settings (see
+tf_threads.py), loads the model and warms it up. Then, after a common start
+barrier, `--clients` threads per process send batch-1 predictions for
+`--seconds`. The table reports the aggregate throughput and the latency
+percentiles per model, with the best configuration last.
+
+    python bench_threads.py
+    python bench_threads.py --models VGG16 --workers 1,2,4 --intra default,auto,2 --inter default,1 --pin off,on
+    python bench_threads.py --output thread_sweep.json
+
+"auto" intra-op means cores / workers; "default" leaves TF's own sizing
+(all cores per process).
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import threading
+import time
+
+import numpy as np
+
+from tf_threads import apply_serving_config, available_cpus, cpu_slices, format_cpus
+
+
+def _worker(bundle_dir, intra, inter, cpus, clients, seconds, barrier, results):
+    apply_serving_config(intra, inter, cpus)
+    from model_bundle import load_bundle
+
+    bundle = load_bundle(bundle_dir)
+    width, height = bundle.input_size
+    batch = np.random.default_rng(0).random((1, height, width, 3), dtype=np.float32)
+    for _ in range(3):
+        bundle.model.predict_on_batch(batch)
+
+    latencies = []
+    lock = threading.Lock()
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            bundle.model.predict_on_batch(batch)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(latencies)
+
+
+def run_config(bundle_dir, workers, intra, inter, pin, clients, seconds):
+    """{"requests_per_sec", "p50_ms", "p95_ms"} of one configuration"""
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    slices = cpu_slices(workers) if pin else [[] for _ in range(workers)]
+    procs = [ctx.Process(target=_worker, args=(bundle_dir, intra, inter, slices[i], clients, seconds, barrier, results))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    latencies = np.concatenate([results.get() for _ in procs])
+    for proc in procs:
+        proc.join()
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"requests_per_sec": len(latencies) / seconds, "p50_ms": float(p50), "p95_ms": float(p95)}
+
+
+def _thread_values(spec, cores, workers):
+    values = []
+    for value in spec.split(","):
+        if value == "default":
+            values.append(0)
+        elif value == "auto":
+            values.append(max(1, cores // workers))
+        else:
+            values.append(int(value))
+    return sorted(set(values))
+
+
+def main():
+    from disease_inference import MODEL_OPTIONS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="VGG16,VGG19", help="MODEL_OPTIONS names or bundle dirs")
+    parser.add_argument("--workers", default="1,2,4", help="Processes sharing the host")
+    parser.add_argument("--intra", default="default,auto", help="Intra-op threads per process: default, auto or N")
+    parser.add_argument("--inter", default="default,1", help="Inter-op threads per process: default or N")
+    parser.add_argument("--pin", default="off,on", help="Pin each process to its own slice of cores")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent request threads per process")
+    parser.add_argument("--seconds", type=float, default=8.0)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    cores = len(available_cpus())
+    print(f"🖥️ {cores} cores available, {args.clients} clients per process, {args.seconds:.0f} s per configuration")
+    rows = []
+    for model in args.models.split(","):
+        bundle_dir = MODEL_OPTIONS.get(model, model)
+        print(f"\n{model}")
+        print(f"{'workers':>7} {'intra':>6} {'inter':>6} {'pinned':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        model_rows = []
+        for workers in (int(w) for w in args.workers.split(",")):
+            grid = itertools.product(_thread_values(args.intra, cores, workers), _thread_values(args.inter, cores, workers),
+                                     [p == "on" for p in args.pin.split(",")])
+            for intra, inter, pin in grid:
+                if pin and workers > cores:
+                    continue
+                result = run_config(bundle_dir, workers, intra, inter, pin, args.clients, args.seconds)
+                row = dict(result, model=model, workers=workers, intra=intra, inter=inter, pinned=pin)
+                model_rows.append(row)
+                print(f"{workers:>7} {intra or 'dflt':>6} {inter or 'dflt':>6} {'yes' if pin else 'no':>7} "
+                      f"{row['requests_per_sec']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}")
+        best = max(model_rows, key=lambda row: row["requests_per_sec"])
+        slices = cpu_slices(best["workers"]) if best["pinned"] else None
+        print(f"🏆 Best for {model}: {best['workers']} worker(s), TF_INTRA_OP_THREADS={best['intra']} "
+              f"TF_INTER_OP_THREADS={best['inter']}"
+              + (f", INFERENCE_CPUS={' | '.join(format_cpus(s) for s in slices)}" if slices else ""))
+        rows.extend(model_rows)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cores": cores, "clients": args.clients, "seconds": args.seconds, "results": rows}, f, indent=2)
+        print(f"\n📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Temperature scaling and per-class acceptance thresholds for the disease models.
+
+The fine-tuned VGGs are overconfident: their top-1 softmax probability is
+well above their actual accuracy. `fit` learns, per bundle and on the
+held-out validation split of new/:
+- one temperature T minimising the negative log-likelihood;
+- for each class, the lowest calibrated confidence at which predictions of
+  that class reach `--target-precision`.
+
+The models end in a softmax, so their logits are recovered as log(p), up
+to a per-row constant that softmax ignores. Serving rescales them as
+softmax(log(p) / T). That is one vectorised numpy expression per batch,
+with no extra model call. Predictions below their class threshold are
+flagged "uncertain". Separate parameters can be fitted for the reduced
+input sizes the cascade runs at (`--sizes 224,160`). Everything is stored
+next to the weights as calibration.json.
+
+    python calibration.py fit VGG16 --sizes 224,160
+    python calibration.py fit VGG19 --target-precision 0.97
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+CALIBRATION_FILE = "calibration.json"
+DEFAULT_TARGET_PRECISION = 0.95
+_EPS = 1e-12
+
+logger = logging.getLogger(__name__)
+
+
+def temperature_scale(probabilities, temperature):
+    """softmax(log(p) / T) along the last axis, for (C,) or (N, C) softmax outputs"""
+    logits = np.log(np.maximum(np.asarray(probabilities, dtype=np.float32), _EPS)) / np.float32(temperature)
+    logits -= logits.max(axis=-1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+
+class Calibration:
+    """Fitted temperature and per-class thresholds of one bundle, optionally per input size"""
+
+    def __init__(self, temperature, thresholds, version="", by_size=None):
+        self.temperature = float(temperature)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.version = version
+        self.by_size = by_size or {}
+
+    def for_size(self, input_size):
+        """The Calibration fitted at `input_size` (W, H), or this one when that size was not fitted"""
+        return self.by_size.get(int(input_size[0]), self)
+
+    def apply(self, probabilities):
+        return temperature_scale(probabilities, self.temperature)
+
+    def accepted(self, calibrated):
+        """Boolean (N,) (or scalar for one row): top-1 confidence reaches its class threshold"""
+        calibrated = np.asarray(calibrated)
+        top = calibrated.argmax(axis=-1)
+        return np.take_along_axis(calibrated, top[..., None], axis=-1)[..., 0] >= self.thresholds[top]
+
+    def to_dict(self):
+        return {"temperature": self.temperature, "thresholds": self.thresholds.tolist()}
+
+
+def load_calibration(bundle_dir, bundle_version=None):
+    """Calibration stored in a bundle, or None when it was never fitted or was fitted on another `bundle_version`"""
+    path = os.path.join(bundle_dir, CALIBRATION_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    fitted_on = stored.get("bundle_version", stored["version"].rpartition("-")[0])
+    if bundle_version is not None and fitted_on != bundle_version:
+        logger.warning("Ignoring %s: fitted on bundle v%s, the model is v%s; re-run calibration.py fit",
+                       path, fitted_on, bundle_version)
+        return None
+    by_size = {int(size): Calibration(entry["temperature"], entry["thresholds"], stored["version"])
+               for size, entry in stored.get("by_size", {}).items()}
+    return Calibration(stored["temperature"], stored["thresholds"], stored["version"], by_size)
+
+
+# === Fitting ===
+def negative_log_likelihood(probabilities, labels, temperature):
+    scaled = temperature_scale(probabilities, temperature)
+    return float(-np.mean(np.log(np.maximum(scaled[np.arange(len(labels)), labels], _EPS))))
+
+
+def fit_temperature(probabilities, labels, low=0.05, high=20.0, iterations=60):
+    """Temperature minimising the NLL, by golden-section search over log T"""
+    ratio = (np.sqrt(5) - 1) / 2
+    a, b = np.log(low), np.log(high)
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc = negative_log_likelihood(probabilities, labels, np.exp(c))
+    fd = negative_log_likelihood(probabilities, labels, np.exp(d))
+    for _ in range(iterations):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = negative_log_likelihood(probabilities, labels, np.exp(c))
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = negative_log_likelihood(probabilities, labels, np.exp(d))
+    return float(np.exp((a + b) / 2))
+
+
+def fit_thresholds(calibrated, labels, target_precision=DEFAULT_TARGET_PRECISION):
+    """Per class, the lowest confidence at which predictions of that class reach `target_precision`.
+
+    When no threshold reaches the target, the one with the best precision is used.
+    """
+    predicted = calibrated.argmax(axis=1)
+    confidence = calibrated.max(axis=1)
+    thresholds = np.zeros(calibrated.shape[1], dtype=np.float32)
+    for k in range(calibrated.shape[1]):
+        mask = predicted == k
+        if not mask.any():
+            continue
+        order = np.argsort(-confidence[mask])
+        ranked_confidence = confidence[mask][order]
+        correct = (labels[mask][order] == k).astype(np.float64)
+        # precision of "accept everything at or above this confidence", scanning down from the top
+        precision = np.cumsum(correct) / np.arange(1, len(correct) + 1)
+        reached = np.nonzero(precision >= target_precision)[0]
+        cut = reached[-1] if len(reached) else int(np.argmax(precision))
+        thresholds[k] = ranked_confidence[cut]
+    return thresholds
+
+
+def fit(probabilities, labels, target_precision=DEFAULT_TARGET_PRECISION):
+    temperature = fit_temperature(probabilities, labels)
+    thresholds = fit_thresholds(temperature_scale(probabilities, temperature), labels, target_precision)
+    return Calibration(temperature, thresholds)
+
+
+def save_calibration(bundle_dir, native, by_size, meta):
+    stored = dict(meta, **native.to_dict(), by_size={str(size): c.to_dict() for size, c in by_size.items()})
+    tmp_path = os.path.join(bundle_dir, CALIBRATION_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stored, f, indent=2)
+    os.replace(tmp_path, os.path.join(bundle_dir, CALIBRATION_FILE))
+
+
+def _halves(samples):
+    """Interleaved (fit, report) halves of [(path, label)], stratified by class"""
+    fit_part, report_part, seen = [], [], {}
+    for sample in samples:
+        count = seen[sample[1]] = seen.get(sample[1], 0) + 1
+        (fit_part if count % 2 else report_part).append(sample)
+    return fit_part, report_part
+
+
+def main():
+    from cascade import with_flexible_input
+    from disease_inference import MODEL_OPTIONS
+    from evaluate_models import expected_calibration_error, score_samples
+    from leaf_dataset import DATA_DIR, validation_split
+    from model_bundle import load_bundle
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit_parser = sub.add_parser("fit", help="Fit the temperature and thresholds, and store them in the bundle")
+    fit_parser.add_argument("model", help="A MODEL_OPTIONS name or a bundle dir")
+    fit_parser.add_argument("--data-dir", default=DATA_DIR)
+    fit_parser.add_argument("--sizes", help="Input sizes to fit, comma separated (default: the bundle's)")
+    fit_parser.add_argument("--target-precision", type=float, default=DEFAULT_TARGET_PRECISION)
+    fit_parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    bundle = load_bundle(MODEL_OPTIONS.get(args.model, args.model))
+    samples, class_names = validation_split(args.data_dir)
+    if class_names != bundle.class_names:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match {args.data_dir}")
+    fit_samples, report_samples = _halves(samples)
+    native_size = bundle.input_size[0]
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else [native_size]
+    print(f"📂 Fitting on {len(fit_samples)} held-out images, reporting on the other {len(report_samples)}")
+
+    fitted = {}
+    print(f"\n{'size':>5} {'T':>6} {'ECE before':>11} {'ECE after':>10} {'accepted':>9} {'accepted acc.':>14}")
+    for size in sizes:
+        model = bundle.model if size == native_size else with_flexible_input(bundle.model)
+        fit_probs = score_samples(model, fit_samples, (size, size), args.batch_size)[0]
+        report_probs = score_samples(model, report_samples, (size, size), args.batch_size)[0]
+        fit_labels = np.array([label for _, label in fit_samples])
+        report_labels = np.array([label for _, label in report_samples])
+
+        calibration = fit(fit_probs, fit_labels, args.target_precision)
+        calibrated = calibration.apply(report_probs)
+        accepted = calibration.accepted(calibrated)
+        accepted_accuracy = np.mean(calibrated[accepted].argmax(axis=1) == report_labels[accepted]) \
+            if accepted.any() else 0.0
+        fitted[size] = calibration
+        print(f"{size:>5} {calibration.temperature:>6.3f} "
+              f"{expected_calibration_error(report_probs, report_labels) * 100:>10.2f}% "
+              f"{expected_calibration_error(calibrated, report_labels) * 100:>9.2f}% "
+              f"{accepted.mean() * 100:>8.1f}% {accepted_accuracy * 100:>13.2f}%")
+
+    native = fitted.pop(native_size) if native_size in fitted else \
+        fit(score_samples(bundle.model, fit_samples, bundle.input_size, args.batch_size)[0],
+            np.array([label for _, label in fit_samples]), args.target_precision)
+    save_calibration(bundle.bundle_dir, native, fitted, {
+        "version": f"{bundle.version}-{int(time.time())}",
+        "bundle_version": bundle.version,
+        "target_precision": args.target_precision,
+        "fitted_on": len(fit_samples),
+    })
+    print(f"\n✅ Calibration saved to {os.path.join(bundle.bundle_dir, CALIBRATION_FILE)}")
+    for name, threshold in zip(class_names, native.thresholds):
+        print(f"   {name:<40} accept at ≥ {threshold * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Confidence-gated model cascade: a cheap first stage, VGG19 only when unsure.
+
+The first stage is any model whose top-1 probability is trusted above
+`threshold`; by default VGG16 run at a reduced 160 px resolution, which the
+GlobalAveragePooling2D head allows. Images below the threshold escalate to
+the full-resolution second stage.
+"""
+import threading
+import time
+
+import numpy as np
+
+from fast_preprocess import normalize_into
+
+CASCADE_OPTION = "Cascade (fast → VGG19)"
+
+
+def with_flexible_input(model):
+    """Rebuild a single-chain model (VGG + GAP head) on an input of any spatial size.
+
+    The new model reuses the original layer objects, so no weights are
+    copied. Models without accessible layers (e.g. a RemoteModel) are
+    returned unchanged.
+    """
+    if not hasattr(model, "layers"):
+        return model
+    from tensorflow.keras import Input, Model
+
+    inputs = Input(shape=(None, None, model.input_shape[-1]))
+    x = inputs
+    for layer in model.layers[1:]:
+        x = layer(x)
+    return Model(inputs, x, name=f"{model.name}_flexible")
+
+
+def to_batch(img, size):
+    """(1, H, W, 3) float32 batch of a PIL image resized to `size` (W, H)"""
+    if img.size != tuple(size):
+        img = img.resize(tuple(size))
+    out = np.empty((1, size[1], size[0], 3), dtype=np.float32)
+    normalize_into(img, out[0])
+    return out
+
+
+class CascadeStats:
+    """Running escalation rate and average compute per image"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalations = 0
+        self.gflops = 0.0
+
+    def record(self, escalated, gflops):
+        with self._lock:
+            self.images += 1
+            self.escalations += int(escalated)
+            self.gflops += gflops
+
+    def summary(self):
+        with self._lock:
+            return {
+                "images": self.images,
+                "escalation_rate": self.escalations / self.images if self.images else 0.0,
+                "avg_gflops_per_image": self.gflops / self.images if self.images else 0.0,
+            }
+
+
+def predict_cascade(img, fast_stage, slow_stage, class_names, threshold=0.9, stats=None, calibrations=None):
+    """Classify a decoded PIL image with the cascade.
+
+    Each stage is a (model, input_size, gflops) tuple; gflops may be 0 when
+    unknown. `calibrations` is an optional (fast, slow) pair of Calibration
+    or None (calibration.py); the escalation decision then uses the fast
+    stage's calibrated confidence. Returns class/confidence/probabilities
+    plus which stage decided, the first stage's confidence, "model_ms" (time
+    in forward passes and calibration, preprocessing excluded) and
+    "uncertain" when the deciding stage is calibrated.
+    """
+    fast_calibration, slow_calibration = calibrations or (None, None)
+    fast_model, fast_size, fast_gflops = fast_stage
+    batch = to_batch(img, fast_size)
+    start = time.perf_counter()
+    probabilities = np.asarray(fast_model.predict_on_batch(batch))[0]
+    calibration = fast_calibration
+    if calibration is not None:
+        probabilities = calibration.apply(probabilities)
+    model_seconds = time.perf_counter() - start
+    fast_confidence = float(np.max(probabilities))
+    escalated = fast_confidence < threshold
+    gflops = fast_gflops
+    if escalated:
+        slow_model, slow_size, slow_gflops = slow_stage
+        batch = to_batch(img, slow_size)
+        start = time.perf_counter()
+        probabilities = np.asarray(slow_model.predict_on_batch(batch))[0]
+        calibration = slow_calibration
+        if calibration is not None:
+            probabilities = calibration.apply(probabilities)
+        model_seconds += time.perf_counter() - start
+        gflops += slow_gflops
+    if stats is not None:
+        stats.record(escalated, gflops)
+
+    index = int(np.argmax(probabilities))
+    result = {
+        "class": class_names[index],
+        "confidence": float(probabilities[index]) * 100,
+        "probabilities": probabilities,
+        "stage": "slow" if escalated else "fast",
+        "fast_confidence": fast_confidence * 100,
+        "model_ms": model_seconds * 1000,
+    }
+    if calibration is not None:
+        result["uncertain"] = not calibration.accepted(probabilities)
+    return result
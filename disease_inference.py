@@ -0,0 +1,490 @@
+"""Plant-disease inference helpers shared by the Streamlit pages and the Flask app.
+
+Importing this module shows no UI, imports no TensorFlow and reads no
+files. Its one process-wide effect comes from upload_guard, which sets
+PIL's decompression-bomb limit (Image.MAX_IMAGE_PIXELS) and silences PIL's
+DecompressionBombWarning. Bundles and their manifests are read on first use and kept
+in a registry; `start_model_watcher()` hot-swaps them when a new bundle
+version is dropped in.
+"""
+import os
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+
+from calibration import load_calibration
+from cascade import CASCADE_OPTION, CascadeStats, predict_cascade, with_flexible_input
+from ensemble import ENSEMBLE_OPTION, ENSEMBLE_MEMBERS, predict_ensemble
+from fast_preprocess import decode_resized, preprocess_image_fast
+from leaf_gate import require_leaf
+from model_bundle import MANIFEST_FILE, load_bundle, read_manifest
+from model_watcher import MODEL_WATCH_INTERVAL, ModelRegistry, ModelWatcher
+from ood import embedding_model, load_detector
+from prediction_cache import PredictionCache, make_cache_key
+from shadow import SHADOW_FRACTION, SHADOW_MODEL, ShadowEvaluator
+from similar_cases import load_index
+from stream_inference import StreamScorer
+from tiling import decode_bounded, predict_tiles
+from tf_threads import apply_serving_config
+from tta import TTA_AUTO_THRESHOLD, TTA_MODE, TTA_MODES, augment_views, predict_tta
+from upload_guard import check_upload_bytes
+
+# === Configurations ===
+IMG_SIZE = (224, 224)
+
+# Model bundles (weights + manifest), see model_bundle.py
+MODEL_OPTIONS = {
+    "VGG16": "models/plant_disease_vgg16_e10",
+    "VGG19": "models/plant_disease_vgg19_e10",
+    "Student": "models/plant_disease_student",  # written by distill.py
+}
+DEFAULT_MODEL = "VGG16"
+
+# Cascade: CASCADE_FAST_MODEL first (VGG16 at CASCADE_FAST_SIZE px, or e.g. "Student"),
+# VGG19 when its top-1 probability < CASCADE_THRESHOLD
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "VGG16")
+CASCADE_FAST_SIZE = int(os.getenv("CASCADE_FAST_SIZE", 160))
+CASCADE_SLOW_MODEL = "VGG19"
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", 0.9))
+cascade_stats = CascadeStats()
+
+# Low-resolution fast path for single models: the same weights at LOWRES_SIZE px first, the
+# bundle's full resolution only when the calibrated top-1 is below LOWRES_THRESHOLD (0 disables)
+LOWRES_SIZE = int(os.getenv("LOWRES_SIZE", 0))
+LOWRES_THRESHOLD = float(os.getenv("LOWRES_THRESHOLD", 0.9))
+lowres_stats = CascadeStats()
+
+# Out-of-distribution check for bundles with fitted stats (ood.py): "mahalanobis" or "cosine"
+OOD_METHOD = os.getenv("OOD_METHOD", "mahalanobis")
+
+# Similar-case retrieval for bundles with a built index (similar_cases.py): "exact", "ivf" or "hnsw"
+SIMILAR_SEARCH = os.getenv("SIMILAR_SEARCH", "exact")
+
+# Everything a user can pick in the UIs and the API
+MODEL_CHOICES = list(MODEL_OPTIONS) + [ENSEMBLE_OPTION, CASCADE_OPTION]
+
+
+def load_model(model_path):
+    """Plain Keras model loader; TensorFlow is only imported when a model is actually needed"""
+    from tensorflow.keras.models import load_model as keras_load_model
+    return keras_load_model(model_path)
+
+
+def inference_worker_address():
+    """host:port of a shared inference_worker.py process, or None to load models in-process"""
+    return os.getenv("INFERENCE_WORKER")
+
+
+def bundle_available(model_name):
+    return os.path.exists(os.path.join(MODEL_OPTIONS[model_name], MANIFEST_FILE))
+
+
+def available_model_choices():
+    """MODEL_CHOICES whose bundles are present on this host (checked on each call)"""
+    if inference_worker_address():
+        return MODEL_CHOICES
+    present = {name for name in MODEL_OPTIONS if bundle_available(name)}
+    choices = [name for name in MODEL_OPTIONS if name in present]
+    if present.issuperset(ENSEMBLE_MEMBERS):
+        choices.append(ENSEMBLE_OPTION)
+    if present.issuperset((CASCADE_FAST_MODEL, CASCADE_SLOW_MODEL)):
+        choices.append(CASCADE_OPTION)
+    return choices
+
+
+@lru_cache(maxsize=None)
+def get_class_names(model_name=DEFAULT_MODEL):
+    """Class list from the bundle manifest, in the model's output order"""
+    return read_manifest(MODEL_OPTIONS[model_name])["class_names"]
+
+
+def _load_bundle_by_name(model_name):
+    address = inference_worker_address()
+    if address:
+        from inference_worker import connect_remote_bundle
+        return connect_remote_bundle(address, model_name)
+    apply_serving_config()  # TF_INTRA_OP_THREADS / TF_INTER_OP_THREADS / INFERENCE_CPUS, before TF starts
+    return load_bundle(MODEL_OPTIONS[model_name])
+
+
+_registry = ModelRegistry(_load_bundle_by_name)
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def load_selected_bundle(model_name):
+    """Current bundle for a model name (take it once per request; a hot reload swaps it between requests)"""
+    return _registry.get(model_name)
+
+
+def load_selected_model(model_name):
+    return load_selected_bundle(model_name).model
+
+
+def preprocess_image(uploaded_file):
+    # Draft-mode JPEG decode + single resize + in-place normalisation
+    return preprocess_image_fast(uploaded_file, IMG_SIZE)
+
+
+def predict_disease(model, img_array, class_names=None, tta=None, calibration=None):
+    """(class, confidence %); `tta` ("flips", "full" or "auto", see tta.py) averages augmented views in one batch.
+
+    With a `calibration` (calibration.py) the confidence is temperature-scaled.
+    """
+    class_names = class_names or get_class_names()
+    if tta and tta != "none":
+        predictions = predict_tta(model, img_array, tta)
+    else:
+        predictions = model.predict(img_array)
+    if calibration is not None:
+        predictions = calibration.apply(predictions)
+    predicted_index = np.argmax(predictions)
+    predicted_class = class_names[predicted_index]
+    confidence = np.max(predictions) * 100
+    return predicted_class, confidence
+
+
+def top_k_predictions(probabilities, class_names, k=3):
+    """The k most likely classes as [{"class", "confidence"}], confidence in percent"""
+    probabilities = np.asarray(probabilities).ravel()
+    k = max(1, min(k, len(probabilities)))
+    top = np.argpartition(-probabilities, k - 1)[:k]
+    top = top[np.argsort(-probabilities[top])]
+    return [{"class": class_names[i], "confidence": float(probabilities[i]) * 100} for i in top]
+
+
+def _member_names(model_name):
+    if model_name == ENSEMBLE_OPTION:
+        return ENSEMBLE_MEMBERS
+    if model_name == CASCADE_OPTION:
+        return (CASCADE_FAST_MODEL, CASCADE_SLOW_MODEL)
+    return (model_name,)
+
+
+def model_class_names(model_name):
+    """Class list for any MODEL_CHOICES entry (ensemble and cascade members share one list)"""
+    return load_selected_bundle(_member_names(model_name)[-1]).class_names
+
+
+def _stage_gflops(model, input_size):
+    from model_profile import estimate_flops
+    try:
+        return estimate_flops(model, input_size) / 1e9
+    except Exception:  # remote or non-chain models
+        return 0.0
+
+
+def cascade_stages():
+    """((model, size, gflops) for the fast stage, the same for the slow stage)"""
+    return _cascade_stages(load_selected_bundle(CASCADE_FAST_MODEL), load_selected_bundle(CASCADE_SLOW_MODEL))
+
+
+# Keyed on the bundle objects, so a hot-reloaded bundle gets fresh stages and the old ones are evicted
+@lru_cache(maxsize=1)
+def _cascade_stages(fast_bundle, slow_bundle):
+    fast_model, fast_size = fast_bundle.model, fast_bundle.input_size
+    if fast_size == slow_bundle.input_size:
+        # A full-resolution model (e.g. VGG16) is made cheap by running it at CASCADE_FAST_SIZE;
+        # a student trained at its own smaller size runs natively
+        fast_model = with_flexible_input(fast_bundle.model)
+        if fast_model is not fast_bundle.model:
+            fast_size = (CASCADE_FAST_SIZE, CASCADE_FAST_SIZE)
+    fast = (fast_model, fast_size, _stage_gflops(fast_model, fast_size))
+    slow = (slow_bundle.model, slow_bundle.input_size, _stage_gflops(slow_bundle.model, slow_bundle.input_size))
+    return fast, slow
+
+
+@lru_cache(maxsize=len(MODEL_OPTIONS))
+def _lowres_stages(bundle):
+    """(fast, slow) cascade stages running one bundle's weights at LOWRES_SIZE and at full size, or None"""
+    flexible = with_flexible_input(bundle.model)  # shares the layer objects: no second copy of the weights
+    if flexible is bundle.model:
+        return None
+    size = (LOWRES_SIZE, LOWRES_SIZE)
+    return ((flexible, size, _stage_gflops(flexible, size)),
+            (bundle.model, bundle.input_size, _stage_gflops(bundle.model, bundle.input_size)))
+
+
+def _use_lowres(bundle, tta, extras, similar_k):
+    """The fast path skips requests that need full-resolution views or the embedding (OOD, similar cases)"""
+    if not 0 < LOWRES_SIZE < bundle.input_size[0] or tta != "none":
+        return False
+    if extras is not None and (extras[1] is not None or (extras[2] is not None and similar_k > 0)):
+        return False
+    return _lowres_stages(bundle) is not None
+
+
+def ood_model(model_name):
+    """(model with an extra embedding output, OODDetector) when OOD stats were fitted for the bundle, else None"""
+    extras = _bundle_extras(load_selected_bundle(model_name))
+    return None if extras is None or extras[1] is None else extras[:2]
+
+
+@lru_cache(maxsize=len(MODEL_OPTIONS))
+def _bundle_extras(bundle):
+    """(embedding model, OODDetector or None, SimilarCaseIndex or None), or None when the bundle has neither"""
+    detector = load_detector(bundle.bundle_dir, bundle.version)
+    index = load_index(bundle.bundle_dir, bundle.version)
+    if detector is None and index is None:
+        return None
+    dual = embedding_model(bundle.model)
+    return None if dual is None else (dual, detector, index)
+
+
+@lru_cache(maxsize=len(MODEL_OPTIONS))
+def bundle_calibration(bundle):
+    """Calibration fitted for a bundle (calibration.py), or None; cached per bundle object"""
+    return load_calibration(bundle.bundle_dir, bundle.version)
+
+
+def _calibration_version(bundles):
+    versions = [calibration.version for calibration in map(bundle_calibration, bundles) if calibration is not None]
+    return f"|cal={','.join(versions)}" if versions else ""
+
+
+@lru_cache(maxsize=1)
+def get_shadow_evaluator():
+    """Background scorer comparing SHADOW_MODEL against served predictions, or None when shadowing is off"""
+    if not SHADOW_MODEL or SHADOW_FRACTION <= 0:
+        return None
+    def load_candidate():
+        apply_serving_config()
+        return load_bundle(MODEL_OPTIONS.get(SHADOW_MODEL, SHADOW_MODEL))
+
+    return ShadowEvaluator(load_candidate, bundle_calibration)
+
+
+@lru_cache(maxsize=1)
+def get_stream_scorer():
+    """Shared batch scorer for live camera streams (stream_inference.py); its thread starts on first use"""
+    return StreamScorer(load_selected_bundle, bundle_calibration)
+
+
+# === Hot reload ===
+def warm_bundle(model_name, bundle):
+    """Run every graph a request could hit on a freshly loaded bundle, before it is swapped in"""
+    width, height = bundle.input_size
+    bundle.model.predict_on_batch(np.zeros((1, height, width, 3), dtype=np.float32))
+    extras = _bundle_extras(bundle)
+    if extras is not None:
+        extras[0].predict_on_batch(np.zeros((1, height, width, 3), dtype=np.float32))
+    if 0 < LOWRES_SIZE < width and _lowres_stages(bundle) is not None:
+        model, (w, h), _ = _lowres_stages(bundle)[0]
+        model.predict_on_batch(np.zeros((1, h, w, 3), dtype=np.float32))
+    if model_name in (CASCADE_FAST_MODEL, CASCADE_SLOW_MODEL):
+        other = _registry.peek(CASCADE_SLOW_MODEL if model_name == CASCADE_FAST_MODEL else CASCADE_FAST_MODEL)
+        if other is not None:
+            pair = (bundle, other) if model_name == CASCADE_FAST_MODEL else (other, bundle)
+            for model, (w, h), _ in _cascade_stages(*pair):
+                model.predict_on_batch(np.zeros((1, h, w, 3), dtype=np.float32))
+
+
+def _on_swap(model_name, old, new):
+    get_class_names.cache_clear()
+
+
+def make_model_watcher(interval=MODEL_WATCH_INTERVAL):
+    """A watcher over this process's registry, not started: call check_once() or start() on it"""
+    return ModelWatcher(_registry, MODEL_OPTIONS, interval, warm=warm_bundle, on_swap=_on_swap)
+
+
+def start_model_watcher(interval=MODEL_WATCH_INTERVAL):
+    """Start (once per process) the background watcher that hot-reloads new bundle versions.
+
+    Does nothing when MODEL_WATCH_INTERVAL is 0 or models are served by an
+    inference worker (restart or reload the worker instead).
+    """
+    global _watcher
+    if interval <= 0 or inference_worker_address():
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = make_model_watcher(interval)
+            _watcher.start()
+    return _watcher
+
+
+def preload_models(model_names=None):
+    """Load and warm the available bundles now rather than on first request; returns the names loaded.
+
+    Calibration, OOD stats and similar-case indexes are loaded too, so a
+    pre-fork master (prefork_server.py) shares all of them with its workers.
+    """
+    loaded = []
+    for name in model_names or [name for name in MODEL_OPTIONS if bundle_available(name)]:
+        bundle = load_selected_bundle(name)
+        bundle_calibration(bundle)
+        warm_bundle(name, bundle)
+        loaded.append(name)
+    return loaded
+
+
+def loaded_bundles():
+    """name -> bundle for the models already loaded in this process"""
+    return {name: _registry.peek(name) for name in MODEL_OPTIONS if _registry.peek(name) is not None}
+
+
+@lru_cache(maxsize=1)
+def get_prediction_cache():
+    return PredictionCache(
+        max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", 256)),
+        disk_dir=os.getenv("PREDICTION_CACHE_DIR"),
+        max_disk_entries=int(os.getenv("PREDICTION_CACHE_DISK_SIZE", 10_000)),
+    )
+
+
+def classify_image(model_name, image_bytes, cache=None, similar_k=0, tta=None):
+    """Predict the disease for raw image bytes with a single model, the ensemble or the cascade.
+
+    Returns a dict with "class", "confidence" (percent) and "probabilities",
+    calibrated for bundles with a fitted calibration (which then also adds
+    "uncertain" when the confidence is below the class threshold), plus
+    "per_model" and "latency_ms" for the ensemble, "stage" for the cascade, "ood" for
+    single models with fitted OOD stats and, when `similar_k` > 0 and the
+    bundle has a similar-case index, the "similar" labelled images. With
+    LOWRES_SIZE set, plain single-model requests report the "resolution" that
+    decided. `tta`
+    (default TTA_MODE) enables batched test-time augmentation for single
+    models, reported back as "tta" (the views actually used). When
+    `cache` is given, identical bytes scored by the same model version are
+    served from it. Uploads that fail the non-leaf gate raise NotALeafImage
+    before any model runs, and oversized ones raise UploadRejected before decoding.
+    """
+    check_upload_bytes(image_bytes)
+    bundles = {name: load_selected_bundle(name) for name in _member_names(model_name)}
+    tta = tta or TTA_MODE
+    if tta not in TTA_MODES:
+        raise ValueError(f"Unknown TTA mode {tta!r}; use one of {', '.join(TTA_MODES)}")
+    tta = tta if model_name in MODEL_OPTIONS else "none"
+
+    cache_key = None
+    if cache is not None:
+        version = "+".join(bundle.version for bundle in bundles.values())
+        if model_name == CASCADE_OPTION:
+            version += f"|{CASCADE_FAST_SIZE}px|t={CASCADE_THRESHOLD}"
+        elif model_name in MODEL_OPTIONS and _bundle_extras(bundles[model_name]) is not None:
+            _, detector, index = _bundle_extras(bundles[model_name])
+            if detector is not None:
+                version += f"|ood={detector.version}:{OOD_METHOD}"
+            if index is not None and similar_k > 0:
+                version += f"|similar={index.version}:{SIMILAR_SEARCH}:{similar_k}"
+        if tta != "none":
+            version += f"|tta={tta}"
+        elif model_name in MODEL_OPTIONS and LOWRES_SIZE:
+            version += f"|lowres={LOWRES_SIZE}:{LOWRES_THRESHOLD}"
+        version += _calibration_version(bundles.values())
+        cache_key = make_cache_key(image_bytes, model_name, version)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    extra = {}
+    if model_name == CASCADE_OPTION:
+        img = decode_resized(BytesIO(image_bytes), IMG_SIZE)
+        require_leaf(img)
+        fast, slow = _cascade_stages(bundles[CASCADE_FAST_MODEL], bundles[CASCADE_SLOW_MODEL])
+        fast_calibration = bundle_calibration(bundles[CASCADE_FAST_MODEL])
+        calibrations = (fast_calibration and fast_calibration.for_size(fast[1]),
+                        bundle_calibration(bundles[CASCADE_SLOW_MODEL]))
+        result = predict_cascade(img, fast, slow, bundles[CASCADE_SLOW_MODEL].class_names,
+                                 CASCADE_THRESHOLD, stats=cascade_stats, calibrations=calibrations)
+        predicted_class, confidence, probabilities = result["class"], result["confidence"], result["probabilities"]
+        model_ms = result["model_ms"]
+        extra["stage"] = result["stage"]
+        if "uncertain" in result:
+            extra["uncertain"] = result["uncertain"]
+    elif model_name == ENSEMBLE_OPTION:
+        img_array, img = preprocess_image_fast(BytesIO(image_bytes), bundles[ENSEMBLE_MEMBERS[0]].input_size)
+        require_leaf(img)
+        models = {name: bundle.model for name, bundle in bundles.items()}
+        calibrations = {name: bundle_calibration(bundle) for name, bundle in bundles.items()}
+        result = predict_ensemble(models, img_array, bundles[ENSEMBLE_MEMBERS[0]].class_names, calibrations)
+        predicted_class, confidence, probabilities = result["class"], result["confidence"], result["probabilities"]
+        extra["per_model"] = result["per_model"]
+        extra["latency_ms"] = model_ms = result["latency_ms"]
+        if "uncertain" in result:
+            extra["uncertain"] = result["uncertain"]
+    else:
+        bundle = bundles[model_name]
+        img_array, img = preprocess_image_fast(BytesIO(image_bytes), bundle.input_size)
+        require_leaf(img)
+        extras = _bundle_extras(bundle)
+        calibration = bundle_calibration(bundle)
+        if _use_lowres(bundle, tta, extras, similar_k):
+            fast, slow = _lowres_stages(bundle)
+            result = predict_cascade(img, fast, slow, bundle.class_names, LOWRES_THRESHOLD, stats=lowres_stats,
+                                     calibrations=(calibration and calibration.for_size(fast[1]), calibration))
+            probabilities, model_ms = result["probabilities"], result["model_ms"]
+            extra["resolution"] = (fast if result["stage"] == "fast" else slow)[1][0]
+            if "uncertain" in result:
+                extra["uncertain"] = result["uncertain"]
+        else:
+            # Every TTA view goes through the same single forward pass (view 0 is the unaugmented image)
+            views = augment_views(img_array, tta) if tta in ("flips", "full") else img_array
+            start = time.perf_counter()
+            if extras is None:
+                probabilities = np.asarray(bundle.model.predict_on_batch(views)).mean(axis=0)
+            else:
+                # One forward pass yields both the probabilities and the penultimate embedding
+                dual, detector, index = extras
+                embedding, probabilities = dual.predict_on_batch(views)
+                embedding, probabilities = np.asarray(embedding)[:1], np.asarray(probabilities).mean(axis=0)
+            if calibration is not None:
+                probabilities = calibration.apply(probabilities)
+            if tta == "auto":
+                tta = "none"
+                if probabilities.max() < TTA_AUTO_THRESHOLD:
+                    probabilities, tta = predict_tta(bundle.model, img_array, "full")[0], "full"
+                    if calibration is not None:
+                        probabilities = calibration.apply(probabilities)
+            model_ms = (time.perf_counter() - start) * 1000
+            if extras is not None:
+                if detector is not None:
+                    extra["ood"] = detector.check(embedding, OOD_METHOD)
+                if index is not None and similar_k > 0:
+                    extra["similar"] = index.search(embedding, similar_k, SIMILAR_SEARCH)
+            if tta != "none":
+                extra["tta"] = tta
+            if calibration is not None:
+                extra["uncertain"] = not calibration.accepted(probabilities)
+        predicted_index = int(np.argmax(probabilities))
+        predicted_class = bundle.class_names[predicted_index]
+        confidence = float(probabilities[predicted_index]) * 100
+
+    shadow = get_shadow_evaluator()
+    if shadow is not None:
+        # Non-blocking: a sampled copy is scored by the candidate on its own thread. Both sides report
+        # forward-pass plus calibration time, so decoding, the leaf gate and retrieval are left out.
+        shadow.maybe_submit(model_name, img, predicted_class, confidence, model_ms, extra.get("tta", "none"))
+
+    if cache is not None:
+        return cache.put(cache_key, predicted_class, confidence, probabilities, **extra)
+    return dict(extra, **{"class": predicted_class, "confidence": confidence, "probabilities": probabilities})
+
+
+def classify_tiled(model_name, image_bytes, cache=None):
+    """Tiled mode for wide field photos: overlapping tiles scored in fixed-size batches, see tiling.py.
+
+    Returns the aggregated "class"/"confidence"/"probabilities" plus the
+    per-tile "tiles" list and "grid" map. Composite choices (ensemble,
+    cascade) run their final member on the tiles.
+    """
+    check_upload_bytes(image_bytes)
+    bundle = load_selected_bundle(_member_names(model_name)[-1])
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(image_bytes, model_name, f"{bundle.version}|tiled")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    result = predict_tiles(bundle.model, decode_bounded(BytesIO(image_bytes)), bundle.class_names,
+                           bundle.input_size)
+    extra = {key: result[key] for key in ("tiles", "grid", "image_size", "tiles_scored", "tiles_skipped",
+                                          "disease_share")}
+    if cache is not None:
+        return cache.put(cache_key, result["class"], result["confidence"], result["probabilities"], **extra)
+    return result
@@ -0,0 +1,194 @@
+"""Distil the VGG16/VGG19 teachers into a compact CNN student that trains on CPU.
+
+Usage:
+    python distill.py
+    python distill.py --teachers VGG16,VGG19 --img-size 128 --epochs 15 --temperature 4 --alpha 0.3
+
+Teacher soft targets are computed once over the training split (and cached
+in --soft-targets), so each epoch only runs the small student. The student
+is written as a model bundle (default models/plant_disease_student, the
+"Student" entry in MODEL_OPTIONS) and compared against both teachers on
+the held-out validation split.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from disease_inference import MODEL_OPTIONS
+from leaf_dataset import DATA_DIR, iter_batches, training_split, validation_split
+from model_bundle import load_bundle, save_bundle
+from model_profile import print_comparison, profile_bundle
+
+
+# === Teacher soft targets ===
+def soften(probabilities, temperature):
+    """Teacher softmax re-tempered: softmax(log(p) / T)"""
+    logits = np.log(np.clip(probabilities, 1e-8, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def teacher_soft_targets(teachers, paths, temperature, cache_path=None, batch_size=32):
+    """Average of the teachers' tempered probabilities for every path, cached on disk by teacher version"""
+    cache_tag = json.dumps({"teachers": [t.version for t in teachers], "temperature": temperature,
+                            "count": len(paths)})
+    if cache_path and os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if str(cached["tag"]) == cache_tag:
+            print(f"✅ Reusing teacher soft targets from {cache_path}")
+            return cached["targets"]
+
+    targets = np.zeros((len(paths), len(teachers[0].class_names)), dtype=np.float32)
+    for teacher in teachers:
+        print(f"🧠 Scoring {len(paths)} training images with teacher {teacher.name}...")
+        probs = np.concatenate([np.asarray(teacher.model.predict_on_batch(batch))
+                                for batch in iter_batches(paths, batch_size, teacher.input_size)])
+        targets += soften(probs, temperature) / len(teachers)
+    if cache_path:
+        np.savez(cache_path, targets=targets, tag=np.array(cache_tag))
+    return targets
+
+
+# === Student ===
+def build_student(num_classes, img_size, width=32):
+    """Four conv blocks + GAP head; returns (probabilities model, logits model) sharing weights"""
+    from tensorflow.keras import Input, Model
+    from tensorflow.keras.layers import (BatchNormalization, Conv2D, Dense, Dropout, GlobalAveragePooling2D,
+                                         MaxPooling2D, ReLU, Softmax)
+
+    inputs = Input(shape=(img_size, img_size, 3))
+    x = inputs
+    for block, filters in enumerate((width, width * 2, width * 4, width * 8)):
+        for conv in range(2):
+            x = Conv2D(filters, 3, padding="same", use_bias=False, name=f"block{block + 1}_conv{conv + 1}")(x)
+            x = BatchNormalization(name=f"block{block + 1}_bn{conv + 1}")(x)
+            x = ReLU(name=f"block{block + 1}_relu{conv + 1}")(x)
+        x = MaxPooling2D(name=f"block{block + 1}_pool")(x)
+    x = GlobalAveragePooling2D(name="gap")(x)
+    x = Dropout(0.3, name="dropout")(x)
+    logits = Dense(num_classes, name="logits")(x)
+    probabilities = Softmax(name="probabilities")(logits)
+    return Model(inputs, probabilities, name="leaf_student"), Model(inputs, logits, name="leaf_student_logits")
+
+
+def distillation_loss(num_classes, temperature, alpha):
+    """alpha * CE(hard labels) + (1 - alpha) * T^2 * CE(teacher soft targets, student at T).
+
+    y_true packs [one-hot label | soft target] so Keras can pass both.
+    """
+    import tensorflow as tf
+
+    def loss(y_true, logits):
+        hard, soft = y_true[:, :num_classes], y_true[:, num_classes:]
+        hard_loss = tf.keras.losses.categorical_crossentropy(hard, logits, from_logits=True)
+        soft_loss = tf.keras.losses.categorical_crossentropy(soft, logits / temperature, from_logits=True)
+        return alpha * hard_loss + (1.0 - alpha) * temperature ** 2 * soft_loss
+
+    def hard_accuracy(y_true, logits):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], logits)
+
+    return loss, hard_accuracy
+
+
+def make_dataset(paths, targets, img_size, batch_size, training):
+    import tensorflow as tf
+
+    def load(path, target):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img = tf.image.resize(img, (img_size, img_size)) / 255.0
+        if training:
+            img = tf.image.random_flip_left_right(img)
+            img = tf.image.random_flip_up_down(img)
+            img = tf.clip_by_value(tf.image.random_brightness(img, 0.1), 0.0, 1.0)
+        return img, target
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, targets))
+    if training:
+        dataset = dataset.shuffle(len(paths), seed=42, reshuffle_each_iteration=True)
+    return dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teachers", default="VGG16,VGG19")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--img-size", type=int, default=128)
+    parser.add_argument("--width", type=int, default=32, help="Filters in the first conv block")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.3, help="Weight of the hard-label loss")
+    parser.add_argument("--soft-targets", default="teacher_soft_targets.npz")
+    parser.add_argument("--output", default=MODEL_OPTIONS["Student"])
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import Adam
+
+    teachers = [load_bundle(MODEL_OPTIONS.get(name, name)) for name in args.teachers.split(",")]
+    train_samples, class_names = training_split(args.data_dir)
+    val_samples, _ = validation_split(args.data_dir)
+    for teacher in teachers:
+        if teacher.class_names != class_names:
+            raise SystemExit(f"❌ {teacher.name}'s classes do not match {args.data_dir}")
+    num_classes = len(class_names)
+    print(f"📂 {len(train_samples)} training / {len(val_samples)} held-out images, {num_classes} classes")
+
+    # === Soft targets (teachers run once, not every epoch) ===
+    train_paths = [path for path, _ in train_samples]
+    soft = teacher_soft_targets(teachers, train_paths, args.temperature, args.soft_targets, args.batch_size)
+    hard = np.eye(num_classes, dtype=np.float32)[[label for _, label in train_samples]]
+    train_targets = np.concatenate([hard, soft], axis=1)
+    val_hard = np.eye(num_classes, dtype=np.float32)[[label for _, label in val_samples]]
+    val_targets = np.concatenate([val_hard, val_hard], axis=1)
+
+    # === Train ===
+    student, student_logits = build_student(num_classes, args.img_size, args.width)
+    loss, hard_accuracy = distillation_loss(num_classes, args.temperature, args.alpha)
+    student_logits.compile(optimizer=Adam(args.learning_rate), loss=loss, metrics=[hard_accuracy])
+    history = student_logits.fit(
+        make_dataset(train_paths, train_targets, args.img_size, args.batch_size, training=True),
+        validation_data=make_dataset([p for p, _ in val_samples], val_targets, args.img_size,
+                                     args.batch_size, training=False),
+        epochs=args.epochs,
+        callbacks=[EarlyStopping(monitor="val_hard_accuracy", mode="max", patience=4, restore_best_weights=True)],
+    )
+    val_accuracy = max(history.history["val_hard_accuracy"])
+    print(f"\n✅ Student validation accuracy: {val_accuracy * 100:.2f}%")
+
+    # === Save bundle ===
+    manifest = save_bundle(
+        student,
+        args.output,
+        name="Student",
+        class_names=class_names,
+        input_size=(args.img_size, args.img_size),
+        training={
+            "architecture": "leaf_student",
+            "width": args.width,
+            "teachers": {t.name: t.version for t in teachers},
+            "temperature": args.temperature,
+            "alpha": args.alpha,
+            "epochs": len(history.history["loss"]),
+            "batch_size": args.batch_size,
+            "learning_rate": args.learning_rate,
+            "train_samples": len(train_samples),
+            "val_accuracy": float(val_accuracy),
+            "tensorflow": tf.__version__,
+        },
+    )
+    print(f"✅ Student bundle v{manifest['version']} saved to: {args.output}")
+
+    # === Comparison against the teachers ===
+    rows = [profile_bundle(load_bundle(args.output), val_samples)]
+    rows += [profile_bundle(teacher, val_samples) for teacher in teachers]
+    print_comparison(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# === Ensemble Configuration ===
+ENSEMBLE_OPTION = "Ensemble (VGG16 + VGG19)"
+ENSEMBLE_MEMBERS = ("VGG16", "VGG19")
+
+# One long-lived thread per member model. TensorFlow releases the GIL inside
+# the forward pass, so both models run in parallel on the same input tensor.
+_executor = ThreadPoolExecutor(max_workers=len(ENSEMBLE_MEMBERS), thread_name_prefix="ensemble")
+
+
+def _timed_predict(model, img_array):
+    start = time.perf_counter()
+    probs = np.asarray(model.predict_on_batch(img_array))
+    return probs, (time.perf_counter() - start) * 1000
+
+
+def predict_ensemble(models, img_array, class_names, calibrations=None):
+    """Score one preprocessed batch with every model concurrently and average the softmax outputs.
+
+    `models` maps a model name to a loaded Keras model. `calibrations`
+    optionally maps a name to its Calibration (calibration.py), applied to
+    that member before averaging. Returns the combined class/confidence plus
+    per-model results and latencies in milliseconds, and "uncertain" when
+    every member is calibrated (checked against their mean thresholds).
+    """
+    calibrations = calibrations or {}
+    start = time.perf_counter()
+    futures = {name: _executor.submit(_timed_predict, model, img_array) for name, model in models.items()}
+
+    per_model = {}
+    all_probs = []
+    for name, future in futures.items():
+        probs, latency_ms = future.result()
+        probs = probs[0]
+        if calibrations.get(name) is not None:
+            probs = calibrations[name].apply(probs)
+        all_probs.append(probs)
+        index = int(np.argmax(probs))
+        per_model[name] = {
+            "class": class_names[index],
+            "confidence": float(probs[index]) * 100,
+            "latency_ms": latency_ms,
+        }
+
+    combined = np.mean(all_probs, axis=0)
+    index = int(np.argmax(combined))
+    result = {
+        "class": class_names[index],
+        "confidence": float(combined[index]) * 100,
+        "probabilities": combined,
+        "per_model": per_model,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+    }
+    if models and all(calibrations.get(name) is not None for name in models):
+        threshold = np.mean([calibrations[name].thresholds[index] for name in models])
+        result["uncertain"] = bool(combined[index] < threshold)
+    return result
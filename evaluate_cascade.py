@@ -0,0 +1,76 @@
+"""Evaluate the confidence-gated cascade on the held-out validation split of new/.
+
+Usage:
+    python evaluate_cascade.py
+    python evaluate_cascade.py --fast VGG16 --fast-size 160 --thresholds 0.5,0.8,0.9,0.95,0.99
+
+Both stages score every held-out image once; each threshold is then
+simulated from those probabilities. The table reports the escalation
+rate, the accuracy, and the average compute per image in GFLOPs and in
+measured batch-1 CPU milliseconds.
+"""
+import argparse
+
+import numpy as np
+
+from cascade import with_flexible_input
+from disease_inference import CASCADE_SLOW_MODEL, MODEL_OPTIONS
+from leaf_dataset import DATA_DIR, iter_batches, validation_split
+from model_bundle import load_bundle
+from model_profile import estimate_flops, measure_latency
+
+
+def score(model, paths, size, batch_size):
+    return np.concatenate([np.asarray(model.predict_on_batch(batch))
+                           for batch in iter_batches(paths, batch_size, size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fast", default="VGG16", help="First-stage model (a MODEL_OPTIONS name or a bundle dir)")
+    parser.add_argument("--fast-size", type=int, default=160)
+    parser.add_argument("--slow", default=CASCADE_SLOW_MODEL)
+    parser.add_argument("--thresholds", default="0.5,0.7,0.8,0.9,0.95,0.99")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    fast_bundle = load_bundle(MODEL_OPTIONS.get(args.fast, args.fast))
+    slow_bundle = load_bundle(MODEL_OPTIONS.get(args.slow, args.slow))
+    samples, class_names = validation_split(args.data_dir)
+    if class_names != slow_bundle.class_names or class_names != fast_bundle.class_names:
+        raise SystemExit("❌ Dataset classes do not match the bundle manifests")
+    paths = [path for path, _ in samples]
+    labels = np.array([label for _, label in samples])
+    print(f"📂 {len(paths)} held-out images, {len(class_names)} classes")
+
+    fast_model = with_flexible_input(fast_bundle.model)
+    fast_size = (args.fast_size, args.fast_size)
+    slow_size = slow_bundle.input_size
+    fast_probs = score(fast_model, paths, fast_size, args.batch_size)
+    slow_probs = score(slow_bundle.model, paths, slow_size, args.batch_size)
+
+    fast_gflops = estimate_flops(fast_model, fast_size) / 1e9
+    slow_gflops = estimate_flops(slow_bundle.model, slow_size) / 1e9
+    fast_ms = measure_latency(fast_model, fast_size)
+    slow_ms = measure_latency(slow_bundle.model, slow_size)
+
+    fast_pred = fast_probs.argmax(axis=1)
+    slow_pred = slow_probs.argmax(axis=1)
+    fast_conf = fast_probs.max(axis=1)
+
+    print(f"\n{'policy':<24} {'escalated':>9} {'accuracy':>9} {'GFLOPs/img':>11} {'ms/img':>8}")
+    print(f"{args.slow + ' only':<24} {'-':>9} {np.mean(slow_pred == labels) * 100:>8.2f}% "
+          f"{slow_gflops:>11.2f} {slow_ms:>8.1f}")
+    print(f"{args.fast + f' @{args.fast_size}px only':<24} {'-':>9} {np.mean(fast_pred == labels) * 100:>8.2f}% "
+          f"{fast_gflops:>11.2f} {fast_ms:>8.1f}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        escalated = fast_conf < threshold
+        pred = np.where(escalated, slow_pred, fast_pred)
+        rate = escalated.mean()
+        print(f"{f'cascade t={threshold:.2f}':<24} {rate * 100:>8.1f}% {np.mean(pred == labels) * 100:>8.2f}% "
+              f"{fast_gflops + rate * slow_gflops:>11.2f} {fast_ms + rate * slow_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
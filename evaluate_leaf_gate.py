@@ -0,0 +1,150 @@
+"""Measure (and optionally fit) the non-leaf gate on a mixed set of leaf and non-leaf images.
+
+Usage:
+    python evaluate_leaf_gate.py
+    python evaluate_leaf_gate.py --negatives path/to/selfies_documents_etc --fit
+
+Leaf images are the held-out validation split of new/. Non-leaf images
+come from --negatives (any folder tree of photos) or, when none is given,
+from a synthetic set of blank frames, document-like pages, skin-toned
+blobs, sky and noise. The report covers:
+- the share of leaves wrongly rejected;
+- the share of non-leaf images rejected;
+- the gate's own cost per image;
+- the CNN compute the gate saves on the mixed set.
+
+--fit trains the logistic-regression gate on the training split vs half
+of the negatives, evaluates it on the rest and saves it to LEAF_GATE_PATH.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from disease_inference import DEFAULT_MODEL, MODEL_OPTIONS
+from leaf_dataset import DATA_DIR, IMAGE_EXTENSIONS, training_split, validation_split
+from leaf_gate import LEAF_GATE_PATH, check_leaf, histogram_features, save_learned_gate, thumbnail_hsv
+
+
+def synthetic_negatives(count, seed=0):
+    """Blank frames, documents, skin-toned blobs, sky and noise at phone-like sizes"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:  # blank / lens-cap / overexposed frame
+            shade = int(rng.choice([0, 20, 128, 235, 255]))
+            img = Image.new("RGB", (640, 480), (shade, shade, shade))
+        elif kind == 1:  # document: light page with dark text lines
+            img = Image.new("RGB", (480, 640), tuple(int(v) for v in rng.integers(225, 256, 3)))
+            draw = ImageDraw.Draw(img)
+            for y in range(40, 600, 22):
+                draw.line((40, y, int(rng.integers(200, 440)), y), fill=(30, 30, 30), width=6)
+        elif kind == 2:  # selfie-like: skin-toned ellipse on a random background
+            img = Image.new("RGB", (480, 640), tuple(int(v) for v in rng.integers(0, 256, 3)))
+            skin = tuple(int(v) for v in np.array([224, 172, 140]) * rng.uniform(0.6, 1.1))
+            ImageDraw.Draw(img).ellipse((90, 120, 390, 520), fill=skin)
+        elif kind == 3:  # sky / wall: smooth gradient
+            top, bottom = rng.integers(80, 256, 3), rng.integers(80, 256, 3)
+            ramp = np.linspace(0, 1, 480)[:, None, None]
+            img = Image.fromarray(((1 - ramp) * top + ramp * bottom).repeat(640, axis=1).astype(np.uint8))
+        else:  # sensor noise
+            img = Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8))
+        images.append(img)
+    return images
+
+
+def folder_images(root):
+    return sorted(os.path.join(d, f) for d, _, files in os.walk(root) for f in files
+                  if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def fit_logistic(features, labels, epochs=1000, learning_rate=0.5, l2=1e-3):
+    """Batch-gradient-descent logistic regression on standardised features.
+
+    Classes are weighted equally. The standardisation is folded back into
+    the returned (weights, bias), so they apply to raw features.
+    """
+    mean, std = features.mean(axis=0), features.std(axis=0) + 1e-6
+    x = (features - mean) / std
+    sample_weight = np.where(labels == 1, 0.5 / labels.sum(), 0.5 / (len(labels) - labels.sum()))
+    weights = np.zeros(x.shape[1], dtype=np.float64)
+    bias = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+        error = (p - labels) * sample_weight
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+    return weights / std, bias - float(np.sum(weights * mean / std))
+
+
+def cnn_cost(model_name):
+    """(GFLOPs, batch-1 CPU ms) of one forward pass, or None when the bundle is not present"""
+    from model_bundle import BundleError, load_bundle
+    from model_profile import estimate_flops, measure_latency
+    try:
+        bundle = load_bundle(MODEL_OPTIONS[model_name])
+    except (BundleError, OSError, ImportError):
+        return None
+    return estimate_flops(bundle.model, bundle.input_size) / 1e9, measure_latency(bundle.model, bundle.input_size)
+
+
+def score(items, gate):
+    decisions, timings = [], []
+    for item in items:
+        start = time.perf_counter()
+        is_leaf, _, _ = check_leaf(item, gate)
+        timings.append((time.perf_counter() - start) * 1000)
+        decisions.append(is_leaf)
+    return np.array(decisions), timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--negatives", help="Folder of non-leaf images (default: synthetic set)")
+    parser.add_argument("--synthetic", type=int, default=500, help="Synthetic negatives when --negatives is not given")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="CNN whose compute the gate saves")
+    parser.add_argument("--fit", action="store_true", help="Fit the logistic-regression gate and save it")
+    parser.add_argument("--min-leaf-recall", type=float, default=0.995)
+    parser.add_argument("--output", default=LEAF_GATE_PATH)
+    args = parser.parse_args()
+
+    leaves = [path for path, _ in validation_split(args.data_dir)[0]]
+    negatives = folder_images(args.negatives) if args.negatives else synthetic_negatives(args.synthetic)
+    print(f"📂 {len(leaves)} held-out leaf images, {len(negatives)} non-leaf images")
+
+    gates = {"rules": "rules"}
+    if args.fit:
+        train_leaves = [path for path, _ in training_split(args.data_dir)[0]]
+        fit_negatives, negatives = negatives[0::2], negatives[1::2]
+        features = np.stack([histogram_features(thumbnail_hsv(item)) for item in train_leaves + fit_negatives])
+        labels = np.concatenate([np.ones(len(train_leaves)), np.zeros(len(fit_negatives))])
+        weights, bias = fit_logistic(features, labels)
+        leaf_scores = 1.0 / (1.0 + np.exp(-(features[:len(train_leaves)] @ weights + bias)))
+        threshold = float(np.quantile(leaf_scores, 1.0 - args.min_leaf_recall))
+        save_learned_gate(weights, bias, threshold, args.output,
+                          train_leaves=len(train_leaves), train_negatives=len(fit_negatives))
+        print(f"✅ Learned gate saved to {args.output} (threshold {threshold:.3f})")
+        gates["learned"] = (weights, bias, threshold)
+
+    cost = cnn_cost(args.model)
+    total = len(leaves) + len(negatives)
+    print(f"\n{'gate':<8} {'leaves rejected':>16} {'non-leaf rejected':>18} {'gate ms/img':>12} {'CNN passes saved':>17}")
+    for name, gate in gates.items():
+        leaf_ok, leaf_ms = score(leaves, gate)
+        neg_ok, neg_ms = score(negatives, gate)
+        saved = (np.sum(~leaf_ok) + np.sum(~neg_ok)) / total
+        print(f"{name:<8} {np.mean(~leaf_ok) * 100:>15.2f}% {np.mean(~neg_ok) * 100:>17.2f}% "
+              f"{np.mean(leaf_ms + neg_ms):>12.2f} {saved * 100:>16.1f}%")
+        if cost is not None:
+            gflops, cnn_ms = cost
+            gate_ms = np.mean(leaf_ms + neg_ms)
+            print(f"         {args.model}: {gflops * saved:.2f} of {gflops:.2f} GFLOPs/img saved; "
+                  f"{cnn_ms:.1f} -> {cnn_ms * (1 - saved) + gate_ms:.1f} ms/img including the gate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compute saved and accuracy retained by the low-resolution fast path (LOWRES_SIZE) on the held-out set.
+
+Usage:
+    python evaluate_lowres.py
+    python evaluate_lowres.py --models VGG16 --sizes 128,160,192 --thresholds 0.8,0.9,0.95
+
+The GlobalAveragePooling2D head lets one loaded model run at any input
+size. Every held-out image (evaluation/heldout_manifest.json, see
+evaluate_models.py) is scored once at each reduced size and once at full
+size, with the bundle's calibration when one was fitted. Each threshold is
+then simulated from those probabilities. The fast path escalates an image
+to full size when its low-resolution confidence is below the threshold,
+so it pays for both passes.
+"""
+import argparse
+
+import numpy as np
+
+from calibration import load_calibration
+from cascade import with_flexible_input
+from disease_inference import MODEL_OPTIONS
+from evaluate_models import EVAL_MANIFEST, load_eval_set, score_samples
+from leaf_dataset import DATA_DIR
+from model_bundle import load_bundle
+from model_profile import estimate_flops, measure_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="VGG16,VGG19", help="MODEL_OPTIONS names or bundle dirs")
+    parser.add_argument("--sizes", default="128,160,192")
+    parser.add_argument("--thresholds", default="0.8,0.9,0.95,0.99")
+    parser.add_argument("--manifest", default=EVAL_MANIFEST)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    manifest, samples = load_eval_set(args.manifest, args.data_dir)
+    labels = np.array([label for _, label in samples])
+    print(f"📂 Held-out set {manifest['id']}: {len(samples)} images")
+
+    for name in args.models.split(","):
+        bundle = load_bundle(MODEL_OPTIONS.get(name, name))
+        calibration = load_calibration(bundle.bundle_dir, bundle.version)
+        flexible = with_flexible_input(bundle.model)
+        full_size = bundle.input_size
+        full_probs = score_samples(bundle.model, samples, full_size, args.batch_size)[0]
+        if calibration is not None:
+            full_probs = calibration.apply(full_probs)
+        full_pred = full_probs.argmax(axis=1)
+        full_accuracy = np.mean(full_pred == labels)
+        full_gflops = estimate_flops(bundle.model, full_size) / 1e9
+        full_ms = measure_latency(bundle.model, full_size)
+
+        print(f"\n=== {bundle.name} v{bundle.version}{' (calibrated)' if calibration else ''} ===")
+        print(f"{'policy':<22} {'escalated':>9} {'accuracy':>9} {'retained':>9} {'GFLOPs/img':>11} "
+              f"{'saved':>7} {'ms/img':>8} {'saved':>7}")
+        print(f"{f'{full_size[0]} px only':<22} {'-':>9} {full_accuracy * 100:>8.2f}% {100:>8.2f}% "
+              f"{full_gflops:>11.2f} {'-':>7} {full_ms:>8.1f} {'-':>7}")
+        for size in (int(s) for s in args.sizes.split(",")):
+            low_size = (size, size)
+            low_probs = score_samples(flexible, samples, low_size, args.batch_size)[0]
+            if calibration is not None:
+                low_probs = calibration.for_size(low_size).apply(low_probs)
+            low_pred = low_probs.argmax(axis=1)
+            low_conf = low_probs.max(axis=1)
+            low_gflops = estimate_flops(flexible, low_size) / 1e9
+            low_ms = measure_latency(flexible, low_size)
+
+            policies = [(f"{size} px only", np.zeros(len(labels), dtype=bool), 0.0)]
+            policies += [(f"{size}→{full_size[0]} t={t:.2f}", low_conf < t, 1.0)
+                         for t in (float(t) for t in args.thresholds.split(","))]
+            for label, escalated, pays_full in policies:
+                pred = np.where(escalated, full_pred, low_pred)
+                accuracy = np.mean(pred == labels)
+                rate = escalated.mean() * pays_full
+                gflops = low_gflops + rate * full_gflops
+                ms = low_ms + rate * full_ms
+                escalated_text = f"{rate * 100:.1f}%" if pays_full else "-"
+                print(f"{label:<22} {escalated_text:>9} {accuracy * 100:>8.2f}% "
+                      f"{accuracy / full_accuracy * 100:>8.2f}% {gflops:>11.2f} "
+                      f"{(1 - gflops / full_gflops) * 100:>6.1f}% {ms:>8.1f} {(1 - ms / full_ms) * 100:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
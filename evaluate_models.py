@@ -0,0 +1,232 @@
+"""Compare disease models on a fixed, manifest-defined held-out set from new/.
+
+`freeze` writes the evaluation set manifest: the relative paths and labels
+of the held-out images (the training validation split by default), plus a
+hash of that list. Every later `run` scores exactly those images, so
+results from different days, models and machines are comparable. `run`
+decodes on a thread pool with prefetch, scores in batches and reports the
+following:
+- accuracy;
+- per-class precision, recall and F1;
+- the confusion matrix;
+- the expected calibration error (ECE);
+- throughput.
+Each run is appended to a JSONL history file, which `history` prints side
+by side.
+
+    python evaluate_models.py freeze
+    python evaluate_models.py run --models VGG16,VGG19
+    python evaluate_models.py history
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from leaf_dataset import DATA_DIR, iter_batches, validation_split
+
+EVAL_DIR = "evaluation"
+EVAL_MANIFEST = os.path.join(EVAL_DIR, "heldout_manifest.json")
+EVAL_HISTORY = os.path.join(EVAL_DIR, "history.jsonl")
+ECE_BINS = 15
+
+
+# === Held-out set ===
+def _set_id(class_names, items):
+    listing = json.dumps([class_names, items], separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(listing).hexdigest()[:12]
+
+
+def freeze_eval_set(data_dir=DATA_DIR, path=EVAL_MANIFEST, per_class=None):
+    """Write the held-out manifest from the validation split, optionally capped to `per_class` images per class"""
+    samples, class_names = validation_split(data_dir)
+    items, counts = [], {}
+    for sample_path, label in samples:
+        if per_class is not None and counts.get(label, 0) >= per_class:
+            continue
+        counts[label] = counts.get(label, 0) + 1
+        items.append([os.path.relpath(sample_path, data_dir).replace(os.sep, "/"), label])
+    manifest = {"id": _set_id(class_names, items), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "class_names": class_names, "items": items}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_eval_set(path=EVAL_MANIFEST, data_dir=DATA_DIR):
+    """(manifest, [(absolute path, label)]); fails if the listing was edited or images are missing"""
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if _set_id(manifest["class_names"], manifest["items"]) != manifest["id"]:
+        raise SystemExit(f"❌ {path} was modified after it was frozen; run 'freeze' again")
+    samples = [(os.path.join(data_dir, *relative.split("/")), label) for relative, label in manifest["items"]]
+    missing = [sample_path for sample_path, _ in samples if not os.path.exists(sample_path)]
+    if missing:
+        raise SystemExit(f"❌ {len(missing)} held-out images are missing from {data_dir}, e.g. {missing[0]}")
+    return manifest, samples
+
+
+# === Metrics ===
+def confusion_matrix(labels, predictions, num_classes):
+    """counts[true, predicted]"""
+    return np.bincount(labels * num_classes + predictions, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+
+def per_class_metrics(confusion):
+    """(precision, recall, f1, support) arrays from a confusion matrix"""
+    true_positive = np.diag(confusion).astype(np.float64)
+    predicted = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+    recall = np.divide(true_positive, support, out=np.zeros_like(true_positive), where=support > 0)
+    total = precision + recall
+    f1 = np.divide(2 * precision * recall, total, out=np.zeros_like(total), where=total > 0)
+    return precision, recall, f1, support
+
+
+def expected_calibration_error(probabilities, labels, bins=ECE_BINS):
+    """Support-weighted gap between top-1 confidence and accuracy over equal-width confidence bins"""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    which = np.minimum((confidence * bins).astype(int), bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    gap = np.abs(np.bincount(which, weights=correct, minlength=bins) - np.bincount(which, weights=confidence, minlength=bins))
+    return float(gap.sum() / max(counts.sum(), 1))
+
+
+# === Run ===
+def score_samples(model, samples, input_size, batch_size=32, workers=4, prefetch=2):
+    """(probabilities, wall seconds, seconds spent in the model) over [(path, label)]"""
+    paths = [sample_path for sample_path, _ in samples]
+    outputs, model_seconds = [], 0.0
+    start = time.perf_counter()
+    for batch in iter_batches(paths, batch_size, input_size, workers, prefetch):
+        batch_start = time.perf_counter()
+        outputs.append(np.asarray(model.predict_on_batch(batch)))
+        model_seconds += time.perf_counter() - batch_start
+    return np.concatenate(outputs), time.perf_counter() - start, model_seconds
+
+
+def evaluate_bundle(bundle, manifest, samples, batch_size=32, workers=4):
+    """History record with every metric for one bundle"""
+    if bundle.class_names != manifest["class_names"]:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match the held-out manifest")
+    labels = np.array([label for _, label in samples])
+    probabilities, wall_seconds, model_seconds = score_samples(bundle.model, samples, bundle.input_size,
+                                                               batch_size, workers)
+    predictions = probabilities.argmax(axis=1)
+    confusion = confusion_matrix(labels, predictions, len(manifest["class_names"]))
+    precision, recall, f1, support = per_class_metrics(confusion)
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model": bundle.name,
+        "model_version": bundle.version,
+        "eval_set": manifest["id"],
+        "images": len(samples),
+        "accuracy": float(np.mean(predictions == labels)),
+        "macro_f1": float(f1.mean()),
+        "ece": expected_calibration_error(probabilities, labels),
+        "mean_confidence": float(probabilities.max(axis=1).mean()),
+        "images_per_sec": len(samples) / wall_seconds,
+        "model_ms_per_image": model_seconds * 1000 / len(samples),
+        "batch_size": batch_size,
+        "per_class": {name: {"precision": float(p), "recall": float(r), "f1": float(f), "support": int(s)}
+                      for name, p, r, f, s in zip(manifest["class_names"], precision, recall, f1, support)},
+        "confusion_matrix": confusion.tolist(),
+    }
+
+
+def append_history(record, path=EVAL_HISTORY):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_history(path=EVAL_HISTORY):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# === Reports ===
+def print_report(record, class_names):
+    print(f"\n=== {record['model']} v{record['model_version']} on held-out set {record['eval_set']} "
+          f"({record['images']} images) ===")
+    print(f"Accuracy {record['accuracy'] * 100:.2f}%   macro F1 {record['macro_f1']:.4f}   "
+          f"ECE {record['ece'] * 100:.2f}%   mean confidence {record['mean_confidence'] * 100:.2f}%")
+    print(f"Throughput {record['images_per_sec']:.1f} images/sec end to end, "
+          f"{record['model_ms_per_image']:.1f} ms/image in the model (batch {record['batch_size']})")
+
+    width = max(len(name) for name in class_names)
+    print(f"\n{'class':<{width}} {'precision':>9} {'recall':>7} {'F1':>6} {'support':>8}")
+    for name in class_names:
+        row = record["per_class"][name]
+        print(f"{name:<{width}} {row['precision'] * 100:>8.2f}% {row['recall'] * 100:>6.2f}% "
+              f"{row['f1']:>6.3f} {row['support']:>8}")
+
+    print("\nConfusion matrix (rows: true class, columns: predicted class)")
+    print(" " * 4 + "".join(f"{j:>6}" for j in range(len(class_names))))
+    for i, row in enumerate(record["confusion_matrix"]):
+        print(f"{i:>3} " + "".join(f"{count:>6}" for count in row) + f"  {class_names[i]}")
+
+
+def print_history(records):
+    print(f"{'when':<20} {'model':<14} {'version':<14} {'set':<13} {'accuracy':>9} {'macro F1':>9} "
+          f"{'ECE':>7} {'img/s':>7} {'ms/img':>7}")
+    for record in records:
+        print(f"{record['timestamp']:<20} {record['model']:<14} {record['model_version']:<14} "
+              f"{record['eval_set']:<13} {record['accuracy'] * 100:>8.2f}% {record['macro_f1']:>9.4f} "
+              f"{record['ece'] * 100:>6.2f}% {record['images_per_sec']:>7.1f} {record['model_ms_per_image']:>7.1f}")
+
+
+def main():
+    from disease_inference import MODEL_OPTIONS
+    from model_bundle import load_bundle
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=EVAL_MANIFEST)
+    parser.add_argument("--history", default=EVAL_HISTORY)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    freeze = sub.add_parser("freeze", help="Write the held-out manifest from the validation split")
+    freeze.add_argument("--per-class", type=int, help="Cap the images per class")
+    freeze.add_argument("--force", action="store_true", help="Replace an existing manifest")
+    run = sub.add_parser("run", help="Evaluate models on the held-out set and append to the history")
+    run.add_argument("--models", default="VGG16,VGG19", help="MODEL_OPTIONS names or bundle dirs, comma separated")
+    run.add_argument("--batch-size", type=int, default=32)
+    run.add_argument("--workers", type=int, default=4, help="Decode threads")
+    history = sub.add_parser("history", help="Print past runs")
+    history.add_argument("--model", help="Only runs of this model")
+    args = parser.parse_args()
+
+    if args.command == "freeze":
+        if os.path.exists(args.manifest) and not args.force:
+            raise SystemExit(f"❌ {args.manifest} exists; pass --force to replace it (older runs will not compare)")
+        manifest = freeze_eval_set(args.data_dir, args.manifest, args.per_class)
+        print(f"✅ Held-out set {manifest['id']}: {len(manifest['items'])} images, "
+              f"{len(manifest['class_names'])} classes -> {args.manifest}")
+    elif args.command == "run":
+        if not os.path.exists(args.manifest):
+            manifest = freeze_eval_set(args.data_dir, args.manifest)
+            print(f"📌 No held-out manifest yet; froze set {manifest['id']} to {args.manifest}")
+        manifest, samples = load_eval_set(args.manifest, args.data_dir)
+        for name in args.models.split(","):
+            bundle = load_bundle(MODEL_OPTIONS.get(name, name))
+            record = evaluate_bundle(bundle, manifest, samples, args.batch_size, args.workers)
+            append_history(record, args.history)
+            print_report(record, manifest["class_names"])
+        print(f"\n📝 Appended to {args.history}")
+    else:
+        records = [r for r in read_history(args.history) if args.model is None or r["model"] == args.model]
+        if not records:
+            raise SystemExit(f"❌ No runs in {args.history}")
+        print_history(records)
+
+
+if __name__ == "__main__":
+    main()
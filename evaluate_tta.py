@@ -0,0 +1,78 @@
+"""Latency vs accuracy of the test-time augmentation modes on the held-out validation split of new/.
+
+Usage:
+    python evaluate_tta.py
+    python evaluate_tta.py --model VGG19 --modes none,flips,full,auto --auto-threshold 0.8
+
+Accuracy is measured over the whole held-out split. Latency is the median
+batch-1 CPU time of one request, including building the views; for "auto"
+it is the average cost, given the share of images that needed the second,
+augmented pass.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import tta
+from disease_inference import MODEL_OPTIONS
+from leaf_dataset import DATA_DIR, iter_batches, validation_split
+from model_bundle import load_bundle
+
+
+def request_latency(model, image, mode, runs=10):
+    """Median ms of predict_tta on one (1, H, W, 3) image"""
+    tta.predict_tta(model, image, mode)  # warm-up for this batch shape
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        tta.predict_tta(model, image, mode)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="VGG16", help="A MODEL_OPTIONS name or a bundle dir")
+    parser.add_argument("--modes", default="none,flips,full,auto")
+    parser.add_argument("--auto-threshold", type=float, default=tta.TTA_AUTO_THRESHOLD)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per forward pass (x views)")
+    args = parser.parse_args()
+    tta.TTA_AUTO_THRESHOLD = args.auto_threshold
+
+    bundle = load_bundle(MODEL_OPTIONS.get(args.model, args.model))
+    samples, class_names = validation_split(args.data_dir)
+    if class_names != bundle.class_names:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match {args.data_dir}")
+    paths = [path for path, _ in samples]
+    labels = np.array([label for _, label in samples])
+    print(f"📂 {len(paths)} held-out images, {bundle.name} v{bundle.version}")
+
+    modes = args.modes.split(",")
+    plain_ms = None
+    print(f"\n{'mode':<8} {'views':>6} {'accuracy':>9} {'ms/request':>11} {'augmented':>10}")
+    for mode in modes:
+        probabilities = np.concatenate([tta.predict_tta(bundle.model, batch, mode)
+                                        for batch in iter_batches(paths, args.batch_size, bundle.input_size)])
+        accuracy = np.mean(probabilities.argmax(axis=1) == labels)
+        image = next(iter_batches(paths[:1], 1, bundle.input_size))
+        if mode == "auto":
+            # Plain pass for every image, plus the full pass for the share below the threshold
+            plain_ms = plain_ms if plain_ms is not None else request_latency(bundle.model, image, "none")
+            plain = np.concatenate([np.asarray(bundle.model.predict_on_batch(batch))
+                                    for batch in iter_batches(paths, args.batch_size, bundle.input_size)])
+            share = float(np.mean(plain.max(axis=1) < tta.TTA_AUTO_THRESHOLD))
+            ms = plain_ms + share * request_latency(bundle.model, image, "full")
+            views = f"1-{tta.view_count('full')}"
+        else:
+            ms = request_latency(bundle.model, image, mode)
+            if mode == "none":
+                plain_ms = ms
+            share = 1.0 if mode != "none" else 0.0
+            views = str(tta.view_count(mode))
+        print(f"{mode:<8} {views:>6} {accuracy * 100:>8.2f}% {ms:>11.1f} {share * 100:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+
+from upload_guard import open_bounded
+
+IMG_SIZE = (224, 224)
+
+_INV_255 = np.float32(1.0 / 255.0)
+
+
+def decode_resized(source, size=IMG_SIZE):
+    """Decode an image straight to `size` RGB.
+
+    JPEGs are opened in draft mode, so libjpeg scales by 1/2, 1/4 or 1/8 in
+    the DCT domain and a 12 MP phone photo never materialises at full
+    resolution. The remaining resize is a single pass down to `size`.
+    Oversized or unsupported images raise UploadRejected before decoding
+    (see upload_guard.py).
+    """
+    img = open_bounded(source, size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != size:
+        img = img.resize(size)
+    return img
+
+
+def normalize_into(img, out):
+    """Scale the uint8 pixels of `img` into `out` (float32, HxWx3) in one pass"""
+    np.multiply(np.asarray(img), _INV_255, out=out, dtype=np.float32)
+    return out
+
+
+def preprocess_image_fast(source, size=IMG_SIZE, out=None):
+    """Fast equivalent of `preprocess_image`: returns a (1, H, W, 3) float32 batch and the resized image.
+
+    Pass `out` (shape (1, H, W, 3) or (H, W, 3), float32) to write into an
+    existing buffer, e.g. one slot of a larger batch.
+    """
+    img = decode_resized(source, size)
+    if out is None:
+        out = np.empty((1, size[1], size[0], 3), dtype=np.float32)
+    normalize_into(img, out[0] if out.ndim == 4 else out)
+    return (out if out.ndim == 4 else out[np.newaxis]), img
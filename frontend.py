@@ -1,54 +1,20 @@
-import streamlit as st
-import numpy as np
-import os
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from PIL import Image
-
-# === Configurations ===
-IMG_SIZE = (224, 224)
-DATA_DIR = r"E:\plant detection\new"  # Used to get class names
-CLASS_NAMES = sorted(os.listdir(DATA_DIR))
-
-# === Model Paths ===
-MODEL_OPTIONS = {
-    "VGG16": "plant_disease_vgg16_e10.keras",
-    "VGG19": "plant_disease_vgg19_e10.keras"
-}
-
-# === Sample Precautions (extend as needed) ===
-precautions_dict = {
-    "early_blight": "Remove infected leaves, apply copper-based fungicide, and avoid overhead watering.",
-    "late_blight": "Destroy infected plants, use certified seeds, and apply recommended fungicide promptly.",
-    "leaf_mold": "Ensure good air circulation, remove affected foliage, and apply appropriate fungicides.",
-    "septoria_leaf_spot": "Avoid wet foliage, remove infected leaves, and use crop rotation.",
-    "bacterial_spot": "Use resistant varieties, avoid splashing water, and treat with copper spray.",
-    "powdery_mildew": "Increase airflow, use neem oil or sulfur spray, and keep foliage dry.",
-    "rust": "Remove infected leaves, water at the base, and apply sulfur or other fungicides.",
-    # Add more based on your class names
-}
+from io import BytesIO
 
-# === Load selected model ===
-@st.cache_resource
-def load_selected_model(model_name):
-    model_path = MODEL_OPTIONS[model_name]
-    model = load_model(model_path)
-    return model
-
-# === Preprocess image ===
-def preprocess_image(uploaded_file):
-    img = Image.open(uploaded_file).convert('RGB')
-    img = img.resize(IMG_SIZE)
-    img_array = image.img_to_array(img) / 255.0
-    return np.expand_dims(img_array, axis=0), img
+import streamlit as st
+from disease_inference import (
+    available_model_choices,
+    classify_image,
+    get_prediction_cache,
+    start_model_watcher,
+)
+from cascade import CASCADE_OPTION
+from ensemble import ENSEMBLE_OPTION
+from leaf_gate import NotALeafImage
+from tiling import decode_bounded
+from upload_guard import UploadRejected
+from precautions import precautions_dict
 
-# === Prediction function ===
-def predict_disease(model, img_array):
-    predictions = model.predict(img_array)
-    predicted_index = np.argmax(predictions)
-    predicted_class = CLASS_NAMES[predicted_index]
-    confidence = np.max(predictions) * 100
-    return predicted_class, confidence
+start_model_watcher()  # hot-reload new bundle versions; idempotent across reruns
 
 # === Streamlit UI ===
 st.set_page_config(page_title="🌿 Plant Disease Detector", layout="centered")
@@ -56,25 +22,46 @@ st.title("🌿 Plant Leaf Disease Classifier")
 st.markdown("Upload a plant leaf image and select the model to detect if it's healthy or affected by disease.")
 
 # === Model selection dropdown ===
-selected_model_name = st.selectbox("Choose Model", list(MODEL_OPTIONS.keys()))
+selected_model_name = st.selectbox("Choose Model", available_model_choices())
 
 # === File uploader ===
 uploaded_file = st.file_uploader("Upload Leaf Image", type=["jpg", "jpeg", "png"])
 
 if uploaded_file:
-    st.image(uploaded_file, caption="Uploaded Leaf Image", use_container_width=True)
-
-    # Load model and preprocess
-    model = load_selected_model(selected_model_name)
-    img_array, display_img = preprocess_image(uploaded_file)
+    try:
+        preview = decode_bounded(BytesIO(uploaded_file.getvalue()), 1024)
+    except (UploadRejected, OSError) as e:
+        st.warning(f"🚫 This image cannot be used ({getattr(e, 'reason', e)}). Please upload a JPEG or PNG under 10 MB.")
+        st.stop()
+    st.image(preview, caption="Uploaded Leaf Image", use_container_width=True)
 
     # Predict
-    predicted_class, confidence = predict_disease(model, img_array)
+    try:
+        # Single models, the ensemble and the cascade share the upload checks, the cache and shadow scoring
+        result = classify_image(selected_model_name, uploaded_file.getvalue(), cache=get_prediction_cache())
+    except UploadRejected as e:
+        st.warning(f"🚫 This image cannot be used ({e.reason}). Please upload a JPEG or PNG under 10 MB.")
+        st.stop()
+    except NotALeafImage as e:
+        st.warning(f"🚫 This doesn't look like a plant leaf photo ({e.reason}). Please upload a clear image of a single leaf.")
+        st.stop()
+    except OSError:  # a truncated or corrupt photo that the preview could still show
+        st.warning("🚫 Could not decode this image. Please upload a complete JPEG or PNG photo.")
+        st.stop()
+    predicted_class, confidence = result["class"], result["confidence"]
 
     # Show result
     st.subheader("🔍 Prediction Result")
     st.write(f"**Predicted Class:** {predicted_class}")
     st.write(f"**Confidence:** {confidence:.2f}%")
+    if result.get("uncertain"):
+        st.info("🤔 The model is not sure about this result. Retake the photo in good light.")
+    if selected_model_name == ENSEMBLE_OPTION:
+        for name, member in result["per_model"].items():
+            st.write(f"- {name}: {member['class']} ({member['confidence']:.2f}%, {member['latency_ms']:.0f} ms)")
+        st.caption(f"Ensemble wall-clock time: {result['latency_ms']:.0f} ms")
+    elif selected_model_name == CASCADE_OPTION:
+        st.caption(f"Decided by the {result['stage']} stage")
 
     # Determine if healthy
     if "healthy" in predicted_class.lower():
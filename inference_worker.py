@@ -0,0 +1,423 @@
+"""Standalone disease-inference worker with dynamic micro-batching.
+
+One process holds the disease models; Streamlit sessions and Flask routes
+send it images over a local TCP socket instead of each running its own
+batch-size-1 `model.predict`. Requests that arrive close together are
+coalesced into one batch, bounded by --max-batch-size and --max-wait-ms.
+
+Start the worker:
+    python inference_worker.py serve --bind 127.0.0.1:8765 --max-batch-size 16 --max-wait-ms 5
+
+Point the apps at it (they fall back to in-process models when unset):
+    set INFERENCE_WORKER=127.0.0.1:8765
+
+Give each worker its own cores and right-sized TF pools when several share a host
+(see tf_threads.py and bench_threads.py):
+    python inference_worker.py serve --intra-op 4 --inter-op 1 --cpus 0-3
+
+Measure throughput and tail latency under synthetic concurrent load:
+    python inference_worker.py bench --worker 127.0.0.1:8765 --model VGG16 --concurrency 16 --requests 512
+
+Wire format, both directions: 4-byte big-endian header length, a JSON
+header, then `payload_bytes` of raw array data described by the header's
+`dtype` and `shape`.
+"""
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from disease_inference import MODEL_OPTIONS
+from model_bundle import BundleError, ModelBundle, load_bundle
+from model_watcher import MODEL_WATCH_INTERVAL, ModelRegistry, ModelWatcher
+from tf_threads import INFERENCE_CPUS, TF_INTER_OP_THREADS, TF_INTRA_OP_THREADS, apply_serving_config
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+RESULT_TIMEOUT = 60.0  # seconds a request waits for its batch before the worker reports an error
+
+_LENGTH = struct.Struct("!I")
+_INV_255 = np.float32(1.0 / 255.0)
+
+
+class WorkerError(RuntimeError):
+    """Raised on the client side when the worker reports a failed request"""
+
+
+# === Wire protocol ===
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return None
+        received += n
+    return buf
+
+
+def send_message(sock, header, payload=b""):
+    header = dict(header, payload_bytes=len(payload))
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Return (header, payload), or None when the peer closed the connection"""
+    raw_length = _recv_exact(sock, _LENGTH.size)
+    if raw_length is None:
+        return None
+    raw_header = _recv_exact(sock, _LENGTH.unpack(raw_length)[0])
+    if raw_header is None:
+        return None
+    header = json.loads(raw_header.decode("utf-8"))
+    payload = b""
+    if header.get("payload_bytes"):
+        payload = _recv_exact(sock, header["payload_bytes"])
+        if payload is None:
+            return None
+    return header, payload
+
+
+# === Micro-batching ===
+class MicroBatcher:
+    """Coalesce concurrent requests for one model into batched forward passes.
+
+    The batch thread blocks for the first request, then keeps collecting
+    until `max_batch_size` images are queued or `max_wait_ms` has passed
+    since that first request.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        """Queue a float32 (N, H, W, 3) array; the future resolves to (probabilities, batch_size)"""
+        future = Future()
+        self._queue.put((images, future))
+        return future
+
+    def _next(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+
+    def _collect(self):
+        pending = [self._next()]
+        count = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._next(timeout=remaining)
+            except queue.Empty:
+                break
+            if count + len(item[0]) > self.max_batch_size or item[0].shape[1:] != pending[0][0].shape[1:]:
+                self._carry = item  # starts the next batch; images of another size are never concatenated
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            try:
+                batch = pending[0][0] if len(pending) == 1 else np.concatenate([images for images, _ in pending])
+                probs = np.asarray(self.model.predict_on_batch(batch), dtype=np.float32)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            offset = 0
+            for images, future in pending:
+                future.set_result((probs[offset:offset + len(images)], len(batch)))
+                offset += len(images)
+
+
+# === Server ===
+class InferenceWorker:
+    def __init__(self, bundles, max_batch_size=16, max_wait_ms=5.0):
+        self.bundles = bundles
+        self.batchers = {name: MicroBatcher(bundle.model, max_batch_size, max_wait_ms)
+                         for name, bundle in bundles.items()}
+
+    def handle(self, header, payload):
+        op = header.get("op", "predict")
+        if op == "describe":
+            return {"models": {name: bundle.manifest for name, bundle in self.bundles.items()}}, b""
+        if op == "stats":
+            return {"models": {name: {"batches": b.batches, "images": b.images,
+                                      "mean_batch_size": b.images / b.batches if b.batches else 0.0}
+                               for name, b in self.batchers.items()}}, b""
+        if op != "predict":
+            raise ValueError(f"Unknown op {op!r}")
+
+        name = header.get("model")
+        if name not in self.batchers:
+            raise ValueError(f"Unknown model {name!r}; available: {', '.join(self.batchers)}")
+        width, height = self.bundles[name].input_size
+        shape = list(header.get("shape", []))
+        if len(shape) != 4 or shape[0] < 1 or shape[1:] != [height, width, 3]:
+            raise ValueError(f"{name} expects images of shape (n, {height}, {width}, 3), got {tuple(shape)}")
+        images = np.frombuffer(payload, dtype=header["dtype"]).reshape(shape)
+        if images.dtype == np.uint8:
+            images = np.multiply(images, _INV_255, dtype=np.float32)
+        elif images.dtype != np.float32:
+            raise ValueError(f"Unsupported dtype {header['dtype']}")
+
+        start = time.perf_counter()
+        probs, batch_size = self.batchers[name].submit(images).result(timeout=RESULT_TIMEOUT)
+        response = {
+            "dtype": "float32",
+            "shape": list(probs.shape),
+            "batch_size": batch_size,
+            "server_ms": (time.perf_counter() - start) * 1000,
+        }
+        return response, probs.tobytes()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            message = recv_message(sock)
+            if message is None:
+                return
+            try:
+                response, body = self.server.worker.handle(*message)
+            except Exception as e:
+                response, body = {"error": f"{type(e).__name__}: {e}"}, b""
+            send_message(sock, response, body)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _warm_up(bundle):
+    width, height = bundle.input_size
+    bundle.model.predict_on_batch(np.zeros((1, height, width, 3), dtype=np.float32))
+
+
+def serve(address, model_options, max_batch_size, max_wait_ms, watch_interval=MODEL_WATCH_INTERVAL,
+          intra_op=TF_INTRA_OP_THREADS, inter_op=TF_INTER_OP_THREADS, cpus=INFERENCE_CPUS):
+    apply_serving_config(intra_op, inter_op, cpus)
+    bundles = {}
+    for name, bundle_dir in model_options.items():
+        try:
+            bundle = load_bundle(bundle_dir)
+        except BundleError as e:
+            print(f"⚠️ Skipping {name}: {e}")
+            continue
+        _warm_up(bundle)
+        bundles[name] = bundle
+        print(f"✅ Loaded {name} v{bundle.version} from {bundle_dir}")
+
+    server = _Server(_parse_address(address), _Handler)
+    worker = server.worker = InferenceWorker(bundles, max_batch_size, max_wait_ms)
+
+    if watch_interval > 0:
+        registry = ModelRegistry(lambda name: load_bundle(model_options[name]))
+        for name, bundle in bundles.items():
+            registry.swap(name, bundle)
+
+        def on_swap(name, old, new):
+            worker.bundles[name] = new
+            worker.batchers[name].model = new.model  # a batch already running finishes on the old model
+
+        ModelWatcher(registry, {name: model_options[name] for name in bundles}, watch_interval,
+                     warm=lambda name, bundle: _warm_up(bundle), on_swap=on_swap).start()
+    print(f"🚀 Inference worker listening on {address} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# === Client ===
+class InferenceClient:
+    """Thread-safe client; each calling thread keeps its own persistent connection"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30.0):
+        self.address = _parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+        return sock
+
+    def request(self, header, payload=b""):
+        sock = self._socket()
+        try:
+            send_message(sock, header, payload)
+            message = recv_message(sock)
+        except OSError:
+            self.close()
+            raise
+        if message is None:
+            self.close()
+            raise WorkerError("Inference worker closed the connection")
+        response, body = message
+        if "error" in response:
+            raise WorkerError(response["error"])
+        return response, body
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def describe(self):
+        return self.request({"op": "describe"})[0]["models"]
+
+    def stats(self):
+        return self.request({"op": "stats"})[0]["models"]
+
+    def predict(self, model_name, images, return_meta=False):
+        """Score a uint8 or float32 (N, H, W, 3) array; returns the (N, classes) probabilities"""
+        images = np.ascontiguousarray(images)
+        if images.dtype not in (np.uint8, np.float32):
+            images = images.astype(np.float32)
+        header = {"op": "predict", "model": model_name, "dtype": images.dtype.name, "shape": list(images.shape)}
+        response, body = self.request(header, images.tobytes())
+        probs = np.frombuffer(body, dtype=response["dtype"]).reshape(response["shape"])
+        return (probs, response) if return_meta else probs
+
+
+class RemoteModel:
+    """Stands in for a Keras model: predict()/predict_on_batch() are served by the worker"""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+
+    def predict_on_batch(self, images):
+        return self.client.predict(self.model_name, images)
+
+    def predict(self, images, **kwargs):
+        return self.predict_on_batch(images)
+
+
+def connect_remote_bundle(address, model_name, client=None):
+    """Build a ModelBundle whose model is served by the worker at `address`"""
+    client = client or InferenceClient(address)
+    manifests = client.describe()
+    if model_name not in manifests:
+        raise WorkerError(f"Worker at {address} does not serve {model_name!r}")
+    return ModelBundle(f"worker://{address}/{model_name}", manifests[model_name], RemoteModel(client, model_name))
+
+
+# === Synthetic load test ===
+def bench(address, model_name, concurrency, total_requests):
+    client = InferenceClient(address)
+    width, height = client.describe()[model_name]["input_size"]
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(8, 1, height, width, 3), dtype=np.uint8)
+    client.predict(model_name, images[0])  # warm-up
+
+    latencies = []
+    batch_sizes = []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def run():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            _, meta = client.predict(model_name, images[i % len(images)], return_meta=True)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                batch_sizes.append(meta["batch_size"])
+
+    threads = [threading.Thread(target=run) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"📊 {model_name}: {len(latencies)} requests, concurrency {concurrency}")
+    print(f"   throughput      {len(latencies) / wall:.1f} images/s")
+    print(f"   latency p50/p95/p99  {p50:.1f} / {p95:.1f} / {p99:.1f} ms")
+    print(f"   mean batch size {np.mean(batch_sizes):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Load the models and serve batched inference")
+    serve_parser.add_argument("--bind", default=DEFAULT_ADDRESS)
+    serve_parser.add_argument("--model", action="append", metavar="NAME=BUNDLE_DIR",
+                              help="Model to serve (default: VGG16 and VGG19 bundles)")
+    serve_parser.add_argument("--max-batch-size", type=int, default=16)
+    serve_parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    serve_parser.add_argument("--watch-interval", type=float, default=MODEL_WATCH_INTERVAL,
+                              help="Seconds between checks for new bundle versions (0 disables hot reload)")
+    serve_parser.add_argument("--intra-op", type=int, default=TF_INTRA_OP_THREADS,
+                              help="TF intra-op threads (0: TF default, or the number of pinned cores)")
+    serve_parser.add_argument("--inter-op", type=int, default=TF_INTER_OP_THREADS, help="TF inter-op threads")
+    serve_parser.add_argument("--cpus", default=INFERENCE_CPUS, help="Pin the worker to these cores, e.g. 0-3")
+
+    bench_parser = sub.add_parser("bench", help="Synthetic concurrent load against a running worker")
+    bench_parser.add_argument("--worker", default=DEFAULT_ADDRESS)
+    bench_parser.add_argument("--model", default="VGG16")
+    bench_parser.add_argument("--concurrency", type=int, default=16)
+    bench_parser.add_argument("--requests", type=int, default=512)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        model_options = dict(spec.split("=", 1) for spec in args.model) if args.model else MODEL_OPTIONS
+        serve(args.bind, model_options, args.max_batch_size, args.max_wait_ms, args.watch_interval,
+              args.intra_op, args.inter_op, args.cpus)
+    else:
+        bench(args.worker, args.model, args.concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    main()
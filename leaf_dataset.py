@@ -0,0 +1,81 @@
+"""Dataset listing, train/validation splits and a parallel batch loader for new/.
+
+`validation_split()` returns exactly the files that Keras'
+`flow_from_directory(..., validation_split=0.2, subset='validation')` held
+out while training vgg16.py / vgg19.py, so evaluations on it never score
+images the models were trained on.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fast_preprocess import IMG_SIZE, decode_resized, normalize_into
+
+DATA_DIR = os.getenv("PLANT_DATA_DIR", "new")
+VALIDATION_FRACTION = 0.2
+
+# Extensions flow_from_directory accepts
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+
+
+def list_class_files(data_dir=DATA_DIR):
+    """Sorted class names and, per class, its image files in the order Keras lists them"""
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    files = {}
+    for name in class_names:
+        class_dir = os.path.join(data_dir, name)
+        found = []
+        for root, _, filenames in sorted(os.walk(class_dir), key=lambda entry: entry[0]):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    found.append(os.path.join(root, filename))
+        files[name] = found
+    return class_names, files
+
+
+def _split(data_dir, fraction, validation):
+    class_names, files = list_class_files(data_dir)
+    samples = []
+    for label, name in enumerate(class_names):
+        class_files = files[name]
+        cut = int(fraction * len(class_files))
+        chosen = class_files[:cut] if validation else class_files[cut:]
+        samples.extend((path, label) for path in chosen)
+    return samples, class_names
+
+
+def validation_split(data_dir=DATA_DIR, fraction=VALIDATION_FRACTION):
+    """[(path, label)] held out from training, plus the class names"""
+    return _split(data_dir, fraction, validation=True)
+
+
+def training_split(data_dir=DATA_DIR, fraction=VALIDATION_FRACTION):
+    """[(path, label)] the models were trained on, plus the class names"""
+    return _split(data_dir, fraction, validation=False)
+
+
+def iter_batches(paths, batch_size=32, size=IMG_SIZE, workers=4, prefetch=2):
+    """Yield float32 (N, H, W, 3) batches for `paths`, decoding on a thread pool.
+
+    Up to `prefetch` batches are decoded ahead of the consumer, and every
+    image is normalised straight into its slot of the batch array.
+    """
+    width, height = size
+
+    def load(batch_paths):
+        batch = np.empty((len(batch_paths), height, width, 3), dtype=np.float32)
+        for i, path in enumerate(batch_paths):
+            normalize_into(decode_resized(path, size), batch[i])
+        return batch
+
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(load, chunk) for chunk in chunks[:prefetch + 1]]
+        next_chunk = len(pending)
+        while pending:
+            batch = pending.pop(0).result()
+            if next_chunk < len(chunks):
+                pending.append(pool.submit(load, chunks[next_chunk]))
+                next_chunk += 1
+            yield batch
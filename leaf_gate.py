@@ -0,0 +1,150 @@
+"""Cheap non-leaf gate that runs before the disease CNN.
+
+Selfies, documents and blank frames would otherwise cost a full VGG
+forward pass and still come back with a confident disease label. The gate
+looks only at a 64x64 thumbnail: the share of saturated plant-coloured
+pixels (green through yellow-brown hues), the share of green pixels, the
+overall contrast and the fine texture (mean neighbouring-pixel difference),
+which separates veined leaf surfaces from flat walls, sky and skin. It
+costs well under a millisecond.
+
+By default fixed thresholds are used. `evaluate_leaf_gate.py --fit` can
+also train a tiny logistic-regression gate on colour-histogram features
+(leaf images from new/ vs a folder of negatives) and save it as JSON at
+LEAF_GATE_PATH; when that file exists it replaces the fixed thresholds.
+"""
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from upload_guard import open_bounded
+
+LEAF_GATE_ENABLED = os.getenv("LEAF_GATE", "1") != "0"
+LEAF_GATE_PATH = os.getenv("LEAF_GATE_PATH", "models/leaf_gate.json")
+
+THUMBNAIL_SIZE = (64, 64)
+# Hue is 0-255 in PIL's HSV mode: ~20 is orange-brown, ~64 yellow-green, ~85 green, ~128 cyan
+PLANT_HUE_RANGE = (18, 130)
+GREEN_HUE_RANGE = (40, 110)
+MIN_SATURATION = 40
+MIN_VALUE = 30
+
+# Fixed-threshold gate
+MIN_PLANT_RATIO = 0.15
+MIN_CONTRAST = 8.0
+MIN_TEXTURE = 2.5
+
+HUE_BINS = 16
+SATURATION_BINS = 4
+
+
+class NotALeafImage(ValueError):
+    """Raised when an upload does not look like a leaf photo, before any model runs"""
+
+    def __init__(self, reason, features=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.features = features or {}
+
+
+def thumbnail_hsv(img):
+    """(64, 64, 3) uint8 HSV array of a PIL image (or path / file object)"""
+    if not isinstance(img, Image.Image):
+        img = open_bounded(img, THUMBNAIL_SIZE)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img.resize(THUMBNAIL_SIZE).convert("HSV"))
+
+
+def texture(value):
+    """Mean absolute difference between neighbouring pixels of the value channel (int16)"""
+    return float(np.abs(np.diff(value, axis=0)).mean() + np.abs(np.diff(value, axis=1)).mean()) / 2
+
+
+def colour_features(hsv):
+    """Named scalar features used by the fixed-threshold gate"""
+    hue, saturation, value = (hsv[..., i].astype(np.int16) for i in range(3))
+    coloured = (saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+    plant = coloured & (hue >= PLANT_HUE_RANGE[0]) & (hue <= PLANT_HUE_RANGE[1])
+    green = coloured & (hue >= GREEN_HUE_RANGE[0]) & (hue <= GREEN_HUE_RANGE[1])
+    return {
+        "plant_ratio": float(plant.mean()),
+        "green_ratio": float(green.mean()),
+        "contrast": float(value.std()),
+        "texture": texture(value),
+        "mean_saturation": float(saturation.mean()),
+    }
+
+
+def histogram_features(hsv):
+    """Fixed-length vector for the learned gate: saturation-masked hue histogram, saturation histogram,
+    contrast, brightness and texture"""
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2].astype(np.int16)
+    coloured = (saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+    pixels = float(hue.size)
+    hue_hist = np.bincount((hue[coloured].astype(np.int32) * HUE_BINS) >> 8, minlength=HUE_BINS) / pixels
+    sat_hist = np.bincount((saturation.ravel().astype(np.int32) * SATURATION_BINS) >> 8,
+                           minlength=SATURATION_BINS) / pixels
+    return np.concatenate([hue_hist, sat_hist, [value.std() / 64.0, value.mean() / 255.0, texture(value) / 16.0]]).astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def load_learned_gate(path=LEAF_GATE_PATH):
+    """(weights, bias, threshold) of a fitted gate, or None to use the fixed thresholds"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        gate = json.load(f)
+    return np.asarray(gate["weights"], dtype=np.float32), float(gate["bias"]), float(gate["threshold"])
+
+
+def save_learned_gate(weights, bias, threshold, path=LEAF_GATE_PATH, **metadata):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(metadata, weights=[float(w) for w in weights], bias=float(bias),
+                       threshold=float(threshold)), f, indent=2)
+    os.replace(tmp_path, path)
+    load_learned_gate.cache_clear()
+
+
+def leaf_score(hsv, gate):
+    weights, bias, _ = gate
+    return float(1.0 / (1.0 + np.exp(-(histogram_features(hsv) @ weights + bias))))
+
+
+def check_leaf(img, gate="auto"):
+    """(is_leaf, reason, features) for a PIL image.
+
+    `gate` is "auto" (the learned gate when one is saved, else fixed
+    thresholds), "rules", or a (weights, bias, threshold) tuple.
+    """
+    hsv = thumbnail_hsv(img)
+    features = colour_features(hsv)
+    if gate == "auto":
+        gate = load_learned_gate()
+    if gate not in (None, "rules"):
+        features["leaf_score"] = leaf_score(hsv, gate)
+        if features["leaf_score"] < gate[2]:
+            return False, "does not look like a leaf photo", features
+        return True, None, features
+
+    if features["contrast"] < MIN_CONTRAST:
+        return False, "image is blank or nearly uniform", features
+    if features["texture"] < MIN_TEXTURE:
+        return False, "image is too smooth to be a leaf", features
+    if features["plant_ratio"] < MIN_PLANT_RATIO:
+        return False, "too few leaf-coloured pixels", features
+    return True, None, features
+
+
+def require_leaf(img):
+    """Raise NotALeafImage unless `img` passes the gate (no-op when LEAF_GATE=0)"""
+    if not LEAF_GATE_ENABLED:
+        return
+    is_leaf, reason, features = check_leaf(img)
+    if not is_leaf:
+        raise NotALeafImage(reason, features)
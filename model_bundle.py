@@ -0,0 +1,204 @@
+"""Versioned disease-model bundles.
+
+A bundle is a directory holding the Keras weights and a manifest.json with
+everything an inference host needs: class list (in output-index order),
+input size, preprocessing spec, training metadata and a sha256 checksum of
+the weights. Inference hosts load bundles and never touch the training
+dataset.
+
+Create a bundle from an existing .keras file:
+    python model_bundle.py create plant_disease_vgg16_e10.keras models/vgg16 --name VGG16 --data-dir "E:\\plant detection\\new"
+    python model_bundle.py create plant_disease_vgg19_e10.keras models/vgg19 --name VGG19 --classes a,b,c,...
+
+Inspect or verify one:
+    python model_bundle.py verify models/vgg16
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+WEIGHTS_FILE = "model.keras"
+
+DEFAULT_PREPROCESSING = {
+    "color_mode": "rgb",
+    "resize": "bicubic",
+    "rescale": 1.0 / 255.0,
+}
+
+_REQUIRED_FIELDS = ("format_version", "name", "version", "class_names", "input_size", "preprocessing", "weights")
+
+
+class BundleError(ValueError):
+    """Raised when a bundle is missing, malformed or fails validation"""
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_bundle(model, bundle_dir, name, class_names, input_size=(224, 224),
+                preprocessing=None, training=None, version=None):
+    """Write `model` (a Keras model or a path to a .keras file) and its manifest to `bundle_dir`"""
+    os.makedirs(bundle_dir, exist_ok=True)
+    weights_path = os.path.join(bundle_dir, WEIGHTS_FILE)
+    # Written next to the live file and swapped in, so a concurrent load never reads half-written weights.
+    # Keras only saves to paths ending in .keras, hence "model.tmp.keras".
+    stem, ext = os.path.splitext(WEIGHTS_FILE)
+    tmp_weights_path = os.path.join(bundle_dir, f"{stem}.tmp{ext}")
+    if isinstance(model, (str, os.PathLike)):
+        shutil.copyfile(model, tmp_weights_path)
+    else:
+        model.save(tmp_weights_path)
+    sha256 = file_sha256(tmp_weights_path)
+    os.replace(tmp_weights_path, weights_path)
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "name": name,
+        "version": version or sha256[:12],
+        "class_names": list(class_names),
+        "input_size": list(input_size),
+        "preprocessing": dict(preprocessing or DEFAULT_PREPROCESSING),
+        "training": dict(training or {}),
+        "weights": {"file": WEIGHTS_FILE, "sha256": sha256, "bytes": os.path.getsize(weights_path)},
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    tmp_path = os.path.join(bundle_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(bundle_dir, MANIFEST_FILE))
+    return manifest
+
+
+def read_manifest(bundle_dir):
+    """Read and schema-check a bundle manifest without loading the weights"""
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise BundleError(f"No model bundle at {bundle_dir} (missing {MANIFEST_FILE})") from None
+    except ValueError as e:
+        raise BundleError(f"Corrupt manifest in {bundle_dir}: {e}") from None
+
+    missing = [field for field in _REQUIRED_FIELDS if field not in manifest]
+    if missing:
+        raise BundleError(f"Manifest in {bundle_dir} is missing fields: {', '.join(missing)}")
+    if manifest["format_version"] > BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Bundle {bundle_dir} uses format {manifest['format_version']}, "
+                          f"this code supports up to {BUNDLE_FORMAT_VERSION}")
+    if not manifest["class_names"] or len(set(manifest["class_names"])) != len(manifest["class_names"]):
+        raise BundleError(f"Bundle {bundle_dir} has an empty or duplicated class list")
+    return manifest
+
+
+def verify_bundle(bundle_dir, manifest=None):
+    """Check the weights file against the manifest's size and sha256"""
+    manifest = manifest or read_manifest(bundle_dir)
+    weights = manifest["weights"]
+    weights_path = os.path.join(bundle_dir, weights["file"])
+    if not os.path.exists(weights_path):
+        raise BundleError(f"Bundle {bundle_dir} is missing its weights file {weights['file']}")
+    if os.path.getsize(weights_path) != weights["bytes"]:
+        raise BundleError(f"Weights in {bundle_dir} have the wrong size (truncated or replaced?)")
+    if file_sha256(weights_path) != weights["sha256"]:
+        raise BundleError(f"Weights in {bundle_dir} do not match the manifest checksum")
+    return manifest
+
+
+class ModelBundle:
+    """A loaded model together with the manifest it was validated against"""
+
+    def __init__(self, bundle_dir, manifest, model):
+        self.bundle_dir = bundle_dir
+        self.manifest = manifest
+        self.model = model
+
+    @property
+    def name(self):
+        return self.manifest["name"]
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def class_names(self):
+        return self.manifest["class_names"]
+
+    @property
+    def input_size(self):
+        return tuple(self.manifest["input_size"])
+
+    def __repr__(self):
+        return f"ModelBundle({self.name!r}, version={self.version!r}, classes={len(self.class_names)})"
+
+
+def load_bundle(bundle_dir, verify=True):
+    """Load a bundle as one unit, validating checksum and output/input shapes against the manifest"""
+    from tensorflow.keras.models import load_model
+
+    manifest = verify_bundle(bundle_dir) if verify else read_manifest(bundle_dir)
+    model = load_model(os.path.join(bundle_dir, manifest["weights"]["file"]))
+
+    num_outputs = model.output_shape[-1]
+    if num_outputs != len(manifest["class_names"]):
+        raise BundleError(f"Model in {bundle_dir} has {num_outputs} outputs but the manifest lists "
+                          f"{len(manifest['class_names'])} classes")
+    height, width = model.input_shape[1:3]
+    if height is not None and (width, height) != tuple(manifest["input_size"]):
+        raise BundleError(f"Model in {bundle_dir} expects {width}x{height} input, manifest says "
+                          f"{manifest['input_size'][0]}x{manifest['input_size'][1]}")
+    return ModelBundle(bundle_dir, manifest, model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Package an existing .keras model as a bundle")
+    create.add_argument("model_path")
+    create.add_argument("bundle_dir")
+    create.add_argument("--name", required=True)
+    create.add_argument("--data-dir", help="Training dataset; class order is its sorted sub-directories")
+    create.add_argument("--classes", help="Comma-separated class list in output-index order")
+    create.add_argument("--img-size", type=int, default=224)
+
+    verify = sub.add_parser("verify", help="Validate a bundle's manifest and checksum")
+    verify.add_argument("bundle_dir")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "create":
+            if args.classes:
+                class_names = [c.strip() for c in args.classes.split(",") if c.strip()]
+            elif args.data_dir:
+                # Same order flow_from_directory used when the model was trained
+                class_names = sorted(d for d in os.listdir(args.data_dir)
+                                     if os.path.isdir(os.path.join(args.data_dir, d)))
+            else:
+                parser.error("create needs --data-dir or --classes")
+            manifest = save_bundle(args.model_path, args.bundle_dir, args.name, class_names,
+                                   input_size=(args.img_size, args.img_size),
+                                   training={"source_model": os.path.basename(args.model_path)})
+            print(f"✅ Bundle {manifest['name']} v{manifest['version']} written to {args.bundle_dir}")
+        else:
+            manifest = verify_bundle(args.bundle_dir)
+            print(f"✅ {manifest['name']} v{manifest['version']}: {len(manifest['class_names'])} classes, "
+                  f"checksum OK")
+    except (BundleError, OSError) as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compute and latency profiling for the disease models (FLOPs, size, CPU latency)."""
+import os
+import time
+
+import numpy as np
+
+
+def estimate_flops(model, input_size=(224, 224)):
+    """Multiply-add FLOPs (x2) of one forward pass for a single-chain conv model at `input_size` (W, H)"""
+    from tensorflow.keras.layers import Conv2D, Dense, InputLayer
+
+    width, height = input_size
+    shape = (1, height, width, model.input_shape[-1])
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, InputLayer):
+            continue
+        out_shape = tuple(layer.compute_output_shape(shape))
+        if isinstance(layer, Conv2D):
+            kernel_h, kernel_w = layer.kernel_size
+            flops += 2 * out_shape[1] * out_shape[2] * kernel_h * kernel_w * shape[-1] * out_shape[-1] // layer.groups
+        elif isinstance(layer, Dense):
+            flops += 2 * shape[-1] * out_shape[-1]
+        shape = out_shape
+    return flops
+
+
+def measure_latency(model, input_size=(224, 224), batch_size=1, runs=20, warmup=3):
+    """Median CPU latency in ms of one predict_on_batch call"""
+    width, height = input_size
+    batch = np.zeros((batch_size, height, width, model.input_shape[-1]), dtype=np.float32)
+    for _ in range(warmup):
+        model.predict_on_batch(batch)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_on_batch(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def file_size_mb(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2**20
+    return os.path.getsize(path) / 2**20
+
+
+def evaluate_accuracy(model, samples, input_size=(224, 224), batch_size=32):
+    """Top-1 accuracy of `model` over [(path, label)] samples"""
+    from leaf_dataset import iter_batches
+
+    paths = [path for path, _ in samples]
+    labels = np.array([label for _, label in samples])
+    predictions = np.concatenate([np.asarray(model.predict_on_batch(batch)).argmax(axis=1)
+                                  for batch in iter_batches(paths, batch_size, input_size)])
+    return float(np.mean(predictions == labels))
+
+
+def profile_bundle(bundle, samples=None, input_size=None):
+    """Params, size, GFLOPs, batch-1 CPU latency and (when samples are given) accuracy of a loaded bundle"""
+    input_size = input_size or bundle.input_size
+    row = {
+        "name": bundle.name,
+        "params_m": bundle.model.count_params() / 1e6,
+        "size_mb": file_size_mb(bundle.bundle_dir),
+        "gflops": estimate_flops(bundle.model, input_size) / 1e9,
+        "latency_ms": measure_latency(bundle.model, input_size),
+        "accuracy": None,
+    }
+    if samples:
+        row["accuracy"] = evaluate_accuracy(bundle.model, samples, input_size)
+    return row
+
+
+def print_comparison(rows):
+    print(f"\n{'model':<22} {'params (M)':>10} {'size (MB)':>10} {'GFLOPs':>8} {'CPU ms':>8} {'accuracy':>9}")
+    for row in rows:
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy'] * 100:.2f}%"
+        print(f"{row['name']:<22} {row['params_m']:>10.2f} {row['size_mb']:>10.1f} {row['gflops']:>8.2f} "
+              f"{row['latency_ms']:>8.1f} {accuracy:>9}")
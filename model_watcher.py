@@ -0,0 +1,114 @@
+"""Hot reload of disease-model bundles without restarting the apps.
+
+`ModelRegistry` maps a model name to its current ModelBundle. Readers take
+a reference to the bundle once per request, so a request that started on
+the old model finishes on it. `ModelWatcher` polls each loaded bundle's
+manifest.json. When a new version appears (save_bundle writes the
+manifest last, after the weights), the watcher loads it on its own
+thread, verifies the checksum and runs the warm-up callback. Only then
+does it swap the registry entry, so no request ever waits on a cold load.
+"""
+import os
+import threading
+import time
+
+from model_bundle import BundleError, load_bundle, read_manifest
+
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 10))
+MAX_RELOAD_ATTEMPTS = 3
+
+
+class ModelRegistry:
+    """name -> current bundle; loads lazily on first use and swaps atomically on reload"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._bundles = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, name):
+        bundle = self._bundles.get(name)
+        if bundle is not None:
+            return bundle
+        with self._guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:  # one cold load per model, other models are not blocked
+            bundle = self._bundles.get(name)
+            if bundle is None:
+                bundle = self._loader(name)
+                self._bundles[name] = bundle
+            return bundle
+
+    def peek(self, name):
+        """The loaded bundle, or None without loading it"""
+        return self._bundles.get(name)
+
+    def swap(self, name, bundle):
+        """Point `name` at `bundle` (a single dict assignment) and return the previous bundle"""
+        old, self._bundles[name] = self._bundles.get(name), bundle
+        return old
+
+    def clear(self):
+        self._bundles.clear()
+
+
+class ModelWatcher(threading.Thread):
+    """Background thread that reloads, warms and swaps bundles whose manifest version changed.
+
+    `warm(name, bundle)` runs on the watcher thread before the swap;
+    `on_swap(name, old, new)` runs right after it.
+    """
+
+    def __init__(self, registry, model_options, interval=MODEL_WATCH_INTERVAL, warm=None, on_swap=None):
+        super().__init__(name="model-watcher", daemon=True)
+        self.registry = registry
+        self.model_options = model_options
+        self.interval = interval
+        self.warm = warm
+        self.on_swap = on_swap
+        self.reloads = 0
+        self._attempts = {}
+        self._stop_event = threading.Event()
+
+    def check_once(self):
+        """Reload every loaded model whose bundle on disk has a new version; returns the names swapped"""
+        swapped = []
+        for name, bundle_dir in self.model_options.items():
+            current = self.registry.peek(name)
+            if current is None:
+                continue  # never used in this process; it will load fresh on first use
+            try:
+                version = read_manifest(bundle_dir)["version"]
+            except BundleError:
+                continue  # mid-copy or removed; keep serving the current bundle
+            if version == current.version or self._attempts.get((name, version), 0) >= MAX_RELOAD_ATTEMPTS:
+                continue
+
+            start = time.perf_counter()
+            try:
+                bundle = load_bundle(bundle_dir)
+                if bundle.version != version:
+                    continue  # replaced again while loading; pick it up on the next poll
+                if self.warm is not None:
+                    self.warm(name, bundle)
+            except Exception as e:
+                attempts = self._attempts[(name, version)] = self._attempts.get((name, version), 0) + 1
+                print(f"⚠️ Reload of {name} v{version} failed ({attempts}/{MAX_RELOAD_ATTEMPTS}): {e}")
+                continue
+
+            old = self.registry.swap(name, bundle)
+            if self.on_swap is not None:
+                self.on_swap(name, old, bundle)
+            self.reloads += 1
+            swapped.append(name)
+            print(f"🔄 {name}: v{old.version} -> v{bundle.version} "
+                  f"(loaded and warmed in {time.perf_counter() - start:.1f} s)")
+        return swapped
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check_once()
+
+    def stop(self):
+        self._stop_event.set()
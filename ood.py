@@ -0,0 +1,168 @@
+"""Out-of-distribution detection from penultimate-layer class centroids.
+
+The six classes only cover pepper, potato and tomato, yet softmax
+confidence stays high for leaves of any other crop. This module fits, per
+bundle:
+- per-class centroids and a shared (tied) covariance of the embedding that
+  feeds the final Dense layer, over the training split of new/;
+- a distance threshold at a high percentile of the held-out split's scores.
+
+At inference the embedding comes out of the same forward pass as the
+probabilities: `embedding_model()` adds it as a second output of the
+existing graph, so no extra model call is made. Stats are stored next to
+the weights as ood_stats.npz.
+
+    python ood.py fit VGG16
+    python ood.py fit VGG19 --negatives path/to/other_crops
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+OOD_FILE = "ood_stats.npz"
+OOD_METHODS = ("mahalanobis", "cosine")
+DEFAULT_PERCENTILE = 99.0
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_model(model):
+    """Model returning [embedding, probabilities] from one forward pass, or None for models without layers.
+
+    The embedding is the input of the last Dense layer (after GAP / the
+    hidden Dense for the VGGs); all layers are shared with `model`.
+    """
+    if not hasattr(model, "layers"):
+        return None
+    from tensorflow.keras import Model
+    from tensorflow.keras.layers import Dense
+
+    dense = [layer for layer in model.layers if isinstance(layer, Dense)]
+    if not dense:
+        return None
+    return Model(model.input, [dense[-1].input, model.output], name=f"{model.name}_with_embedding")
+
+
+class OODDetector:
+    """Distance of embeddings to the nearest class centroid, with a fitted in-distribution threshold"""
+
+    def __init__(self, centroids, precision, thresholds, version=""):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.precision = np.asarray(precision, dtype=np.float64)
+        self.thresholds = {method: float(value) for method, value in thresholds.items()}
+        self.version = version
+        # Mahalanobis with a tied covariance is a Euclidean distance after whitening by chol(precision)
+        self._whiten = np.linalg.cholesky(precision).astype(np.float32)
+        self._white_centroids = self.centroids @ self._whiten
+        self._unit_centroids = self.centroids / np.linalg.norm(self.centroids, axis=1, keepdims=True)
+
+    def distances(self, embeddings, method="mahalanobis"):
+        """(N,) distance to the nearest centroid: squared Mahalanobis, or 1 - max cosine similarity"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        if method == "cosine":
+            unit = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8)
+            return 1.0 - (unit @ self._unit_centroids.T).max(axis=1)
+        white = embeddings @ self._whiten
+        squared = ((white[:, None, :] - self._white_centroids[None, :, :]) ** 2).sum(axis=2)
+        return squared.min(axis=1)
+
+    def check(self, embedding, method="mahalanobis"):
+        """{"method", "distance", "threshold", "out_of_distribution"} for a single embedding"""
+        distance = float(self.distances(embedding, method)[0])
+        threshold = self.thresholds[method]
+        return {"method": method, "distance": distance, "threshold": threshold,
+                "out_of_distribution": distance > threshold}
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, precision=self.precision, version=np.array(self.version),
+                 **{f"threshold_{method}": np.float32(value) for method, value in self.thresholds.items()})
+
+
+def load_detector(bundle_dir, bundle_version=None):
+    """OODDetector for a bundle, or None when no stats were fitted for it or they were fitted on another `bundle_version`"""
+    path = os.path.join(bundle_dir, OOD_FILE)
+    if not os.path.exists(path):
+        return None
+    stats = np.load(path, allow_pickle=False)
+    fitted_on = str(stats["version"]).rpartition("-")[0]  # "<bundle version>-<fit timestamp>"
+    if bundle_version is not None and fitted_on != bundle_version:
+        logger.warning("Ignoring %s: fitted on bundle v%s, the model is v%s; re-run ood.py", path, fitted_on,
+                       bundle_version)
+        return None
+    thresholds = {method: float(stats[f"threshold_{method}"]) for method in OOD_METHODS
+                  if f"threshold_{method}" in stats}
+    return OODDetector(stats["centroids"], stats["precision"], thresholds, str(stats["version"]))
+
+
+def fit_class_stats(embeddings, labels, num_classes, shrinkage=1e-3):
+    """(centroids, precision) with a covariance shared by all classes, ridge-regularised"""
+    centroids = np.stack([embeddings[labels == k].mean(axis=0) for k in range(num_classes)])
+    centred = embeddings - centroids[labels]
+    covariance = centred.T @ centred / len(embeddings)
+    covariance += shrinkage * np.trace(covariance) / covariance.shape[0] * np.eye(covariance.shape[0])
+    return centroids, np.linalg.inv(covariance)
+
+
+def embed(model, paths, input_size, batch_size=32):
+    """Embeddings of every path through `embedding_model(model)`"""
+    from leaf_dataset import iter_batches
+
+    dual = embedding_model(model)
+    return np.concatenate([np.asarray(dual.predict_on_batch(batch)[0])
+                           for batch in iter_batches(paths, batch_size, input_size)])
+
+
+def main():
+    from disease_inference import MODEL_OPTIONS
+    from leaf_dataset import DATA_DIR, IMAGE_EXTENSIONS, training_split, validation_split
+    from model_bundle import load_bundle
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit = sub.add_parser("fit", help="Fit centroids/covariance and thresholds, and store them in the bundle")
+    fit.add_argument("model", help="A MODEL_OPTIONS name or a bundle dir")
+    fit.add_argument("--data-dir", default=DATA_DIR)
+    fit.add_argument("--percentile", type=float, default=DEFAULT_PERCENTILE,
+                     help="Held-out in-distribution percentile used as the threshold")
+    fit.add_argument("--negatives", help="Folder of out-of-distribution leaves (other crops) to report on")
+    fit.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    bundle = load_bundle(MODEL_OPTIONS.get(args.model, args.model))
+    train_samples, class_names = training_split(args.data_dir)
+    val_samples, _ = validation_split(args.data_dir)
+    if class_names != bundle.class_names:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match {args.data_dir}")
+
+    print(f"🧠 Embedding {len(train_samples)} training images with {bundle.name}...")
+    train_embeddings = embed(bundle.model, [p for p, _ in train_samples], bundle.input_size, args.batch_size)
+    labels = np.array([label for _, label in train_samples])
+    centroids, precision = fit_class_stats(train_embeddings, labels, len(class_names))
+
+    val_embeddings = embed(bundle.model, [p for p, _ in val_samples], bundle.input_size, args.batch_size)
+    provisional = OODDetector(centroids, precision, {})
+    thresholds = {method: float(np.percentile(provisional.distances(val_embeddings, method), args.percentile))
+                  for method in OOD_METHODS}
+    detector = OODDetector(centroids, precision, thresholds, version=f"{bundle.version}-{int(time.time())}")
+    detector.save(os.path.join(bundle.bundle_dir, OOD_FILE))
+    print(f"✅ OOD stats ({train_embeddings.shape[1]}-d embeddings) saved to "
+          f"{os.path.join(bundle.bundle_dir, OOD_FILE)}")
+
+    print(f"\n{'method':<12} {'threshold':>10} {'held-out flagged':>17} {'negatives flagged':>18}")
+    negatives = None
+    if args.negatives:
+        paths = sorted(os.path.join(d, f) for d, _, files in os.walk(args.negatives) for f in files
+                       if f.lower().endswith(IMAGE_EXTENSIONS))
+        negatives = embed(bundle.model, paths, bundle.input_size, args.batch_size)
+    for method in OOD_METHODS:
+        held_out = np.mean(detector.distances(val_embeddings, method) > thresholds[method])
+        flagged = "-" if negatives is None else \
+            f"{np.mean(detector.distances(negatives, method) > thresholds[method]) * 100:.2f}%"
+        print(f"{method:<12} {thresholds[method]:>10.3f} {held_out * 100:>16.2f}% {flagged:>18}")
+
+
+if __name__ == "__main__":
+    main()
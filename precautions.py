@@ -0,0 +1,45 @@
+# Disease precautions shared by the Streamlit pages and the Flask API
+
+# English precautions
+precautions_dict = {
+    "early_blight": "Remove infected leaves, apply copper-based fungicide, and avoid overhead watering.",
+    "late_blight": "Destroy infected plants, use certified seeds, and apply recommended fungicide promptly.",
+    "leaf_mold": "Ensure good air circulation, remove affected foliage, and apply appropriate fungicides.",
+    "septoria_leaf_spot": "Avoid wet foliage, remove infected leaves, and use crop rotation.",
+    "bacterial_spot": "Use resistant varieties, avoid splashing water, and treat with copper spray.",
+    "powdery_mildew": "Increase airflow, use neem oil or sulfur spray, and keep foliage dry.",
+    "rust": "Remove infected leaves, water at the base, and apply sulfur or other fungicides.",
+}
+
+# Kannada precautions (manually translated)
+precautions_dict_kn = {
+    "early_blight": "ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ, ತಾಮ್ರ-ಆಧಾರಿತ ಫಂಗಿಸೈಡ್ ಅನ್ನು ಅನ್ವಯಿಸಿ ಮತ್ತು ಮೇಲಿನ ನೀರಾವರಿಯನ್ನು ತಪ್ಪಿಸಿ.",
+    "late_blight": "ಸೋಂಕು ಹರಡಿದ ಸಸ್ಯಗಳನ್ನು ನಾಶಪಡಿಸಿ, ಪ್ರಮಾಣೀಕೃತ ಬೀಜಗಳನ್ನು ಬಳಸಿ ಮತ್ತು ಶಿಫಾರಸು ಮಾಡಿದ ಫಂಗಿಸೈಡ್ ಅನ್ನು ತಕ್ಷಣ ಅನ್ವಯಿಸಿ.",
+    "leaf_mold": "ಉತ್ತಮ ಗಾಳಿ ಸಂಚಾರವನ್ನು ಖಚಿತಪಡಿಸಿ, ಪೀಡಿತ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ ಮತ್ತು ಸೂಕ್ತವಾದ ಫಂಗಿಸೈಡ್ಗಳನ್ನು ಅನ್ವಯಿಸಿ.",
+    "septoria_leaf_spot": "ನೆನೆದ ಎಲೆಗಳನ್ನು ತಪ್ಪಿಸಿ, ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ ಮತ್ತು ಬೆಳೆ ತಿರುಗಾಟವನ್ನು ಬಳಸಿ.",
+    "bacterial_spot": "ನಿರೋಧಕ ಪ್ರಭೇದಗಳನ್ನು ಬಳಸಿ, ನೀರನ್ನು ಚಿಮ್ಮುವುದನ್ನು ತಪ್ಪಿಸಿ ಮತ್ತು ತಾಮ್ರ ಸ್ಪ್ರೇನೊಂದಿಗೆ ಚಿಕಿತ್ಸೆ ನೀಡಿ.",
+    "powdery_mildew": "ಗಾಳಿಯ ಹರಿವನ್ನು ಹೆಚ್ಚಿಸಿ, ನೀಂ ಎಣ್ಣೆ ಅಥವಾ ಸಲ್ಫರ್ ಸ್ಪ್ರೇ ಬಳಸಿ ಮತ್ತು ಎಲೆಗಳನ್ನು ಒಣಗಿರಿಸಿ.",
+    "rust": "ಸೋಂಕು ಹರಡಿದ ಎಲೆಗಳನ್ನು ತೆಗೆದುಹಾಕಿ, ಬೇಸಿಗೆಯಲ್ಲಿ ನೀರು ಹಾಕಿ ಮತ್ತು ಸಲ್ಫರ್ ಅಥವಾ ಇತರ ಫಂಗಿಸೈಡ್ಗಳನ್ನು ಅನ್ವಯಿಸಿ.",
+}
+
+GENERAL_ADVICE = "General Advice: Remove the infected parts, isolate affected plants, and consult an agricultural expert."
+GENERAL_ADVICE_KN = "ಸಾಮಾನ್ಯ ಸಲಹೆ: ಸೋಂಕು ಹರಡಿದ ಭಾಗಗಳನ್ನು ತೆಗೆದುಹಾಕಿ, ಪೀಡಿತ ಸಸ್ಯಗಳನ್ನು ಪ್ರತ್ಯೇಕಿಸಿ ಮತ್ತು ಕೃಷಿ ತಜ್ಞರನ್ನು ಸಂಪರ್ಕಿಸಿ."
+
+
+def find_precaution_key(predicted_class):
+    """Return the precautions_dict key contained in a predicted class name, or None"""
+    normalized = predicted_class.lower().replace(" ", "_")
+    for key in precautions_dict:
+        if key in normalized:
+            return key
+    return None
+
+
+def get_precaution(predicted_class, language="en"):
+    """Localized precaution for a predicted class ("en" or "kn"); None for healthy leaves"""
+    if "healthy" in predicted_class.lower():
+        return None
+    key = find_precaution_key(predicted_class)
+    if language == "kn":
+        return precautions_dict_kn.get(key, precautions_dict.get(key)) if key else GENERAL_ADVICE_KN
+    return precautions_dict[key] if key else GENERAL_ADVICE
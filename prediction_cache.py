@@ -0,0 +1,158 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def model_version(model_path):
+    """Cheap version tag for a model file: size and modification time change whenever it is re-saved"""
+    stat = os.stat(model_path)
+    return f"{stat.st_size:x}-{int(stat.st_mtime)}"
+
+
+def make_cache_key(image_bytes, model_name, version):
+    """Key a prediction by the uploaded bytes, the model that scored them and that model's version"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}|{model_name}|{version}".encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """Bounded LRU of disease predictions with an optional on-disk tier.
+
+    Each entry holds the predicted class, the confidence (in percent), the
+    full probability vector and any extra JSON-serialisable fields. Entries
+    evicted from memory stay on disk when `disk_dir` is set, so a re-upload
+    after a restart is still a hit. The disk tier keeps at most
+    `max_disk_entries` files, least recently used first out. Callers get
+    copies, so they cannot change what is cached.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, max_disk_entries=10_000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._disk_keys = OrderedDict()  # files on disk, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            files = [name for name in os.listdir(disk_dir) if name.endswith(".json")]
+            for name in sorted(files, key=lambda name: os.path.getmtime(os.path.join(disk_dir, name))):
+                self._disk_keys[name[:-len(".json")]] = None
+            self._evict_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _evict_disk(self):
+        """Drop the least recently used files beyond max_disk_entries; call with the lock held or from __init__"""
+        while len(self._disk_keys) > self.max_disk_entries:
+            key, _ = self._disk_keys.popitem(last=False)
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass  # another process sharing the directory removed it
+            except OSError as e:
+                logger.warning("Prediction cache could not remove %s: %s", self._disk_path(key), e)
+
+    def _touch(self, key):
+        """Bump the file's mtime, the recency a restarted process rebuilds its disk LRU order from"""
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass  # evicted meanwhile, possibly by another process sharing the directory
+
+    @staticmethod
+    def _copy(entry):
+        return copy.deepcopy(entry)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                on_disk = key in self._disk_keys
+                if on_disk:
+                    self._disk_keys.move_to_end(key)  # served from memory, but still recently used on disk
+                entry = self._copy(entry)
+        if entry is not None:
+            if on_disk:
+                self._touch(key)
+            return entry
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                entry["probabilities"] = np.asarray(entry["probabilities"], dtype=np.float32)
+            except (OSError, ValueError, KeyError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, entry)
+                    self._disk_keys[key] = None
+                    self._disk_keys.move_to_end(key)
+                    self.hits += 1
+                    self.disk_hits += 1
+                self._touch(key)
+                return self._copy(entry)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, predicted_class, confidence, probabilities, **extra):
+        entry = dict(extra)
+        entry["class"] = predicted_class
+        entry["confidence"] = float(confidence)
+        entry["probabilities"] = np.array(probabilities, dtype=np.float32).ravel()
+        with self._lock:
+            self._remember(key, entry)
+
+        if self.disk_dir:
+            record = dict(entry, probabilities=entry["probabilities"].tolist())
+            tmp_path = self._disk_path(key) + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(record, f)
+                os.replace(tmp_path, self._disk_path(key))
+            except (OSError, TypeError) as e:
+                logger.warning("Prediction cache disk write failed: %s", e)
+            else:
+                with self._lock:
+                    self._disk_keys[key] = None
+                    self._disk_keys.move_to_end(key)
+                    self._evict_disk()
+        return self._copy(entry)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "disk_entries": len(self._disk_keys),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+            }
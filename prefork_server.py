@@ -0,0 +1,320 @@
+"""Pre-fork server for the Flask app: load the disease models once, then fork the workers.
+
+    python prefork_server.py --workers 4 --bind 0.0.0.0:5000
+    python prefork_server.py --workers 8 --pin            # each worker on its own slice of cores
+    python prefork_server.py --workers 4 --load per-worker
+
+With `--load preload` (default) the master loads and warms every available
+disease bundle, including its calibration, OOD stats and similar-case index.
+It then calls gc.freeze() and forks the workers. The weights are a few large
+buffers that inference only reads, so the workers share those pages with
+the master copy-on-write. N workers cost about one copy of the models plus
+their own activations. With `--load per-worker`, every worker loads its
+own copy after the fork. `python bench_prefork.py` measures both modes.
+
+TensorFlow's thread pools belong to the master and do not exist in a forked
+child. Preloading therefore runs TF with one intra-op thread and inter-op
+work in the calling thread (`--intra-op 1 --inter-op -1`). Concurrent
+requests of a worker then run side by side on their own request threads.
+Each worker also runs a probe prediction first. When a TF build still
+hangs after fork, the master re-executes itself with `--load per-worker`.
+
+Workers do not hot-reload on their own, because each would end up with a
+private copy. The master polls the bundles every `--watch-interval` seconds.
+When one has a new version, it loads and warms it once, then replaces the
+workers one at a time. A worker that dies is forked again. SIGTERM or
+Ctrl+C stops the workers and the master.
+
+Login state, OTPs, verification codes and chatbot audio are shared through
+SQLite (shared_store.py). Live camera streams (/stream) are not shared:
+each stream lives in the worker that opened it, and its frames and events
+may land on another worker. Serve streaming with `--workers 1`.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from tf_threads import TF_INTER_OP_THREADS, TF_INTRA_OP_THREADS, apply_serving_config, available_cpus, \
+    cpu_slices, pin_cpus
+
+PREFORK_PROBE_SECONDS = float(os.getenv("PREFORK_PROBE_SECONDS", 60))
+PROBE_FAILED = 3  # worker exit status: TF did not survive the fork
+LISTEN_BACKLOG = 128
+WORKER_DRAIN_SECONDS = float(os.getenv("WORKER_DRAIN_SECONDS", 30))  # in-flight requests get this long on SIGTERM
+MIN_WORKER_SECONDS = 1.0  # workers dying faster than this are restarted at most once per interval
+
+
+# === Memory accounting ===
+def process_memory(pid="self"):
+    """RSS, PSS, shared and private memory of a process in MB, from /proc/<pid>/smaps_rollup (Linux 4.14+).
+
+    PSS charges every shared page to the processes mapping it in equal
+    parts, so the PSS of all processes adds up to the memory they really use.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[key] = int(value.split()[0]) / 1024
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "shared_mb": fields["Shared_Clean"] + fields["Shared_Dirty"],
+        "private_mb": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+# === Workers ===
+def fork_worker(target, *args):
+    """Fork a child that runs target(*args) and exits with its return value; returns the child's pid"""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 1
+        try:
+            code = target(*args) or 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+    return pid
+
+
+def probe_models(timeout=PREFORK_PROBE_SECONDS):
+    """Run one prediction per loaded model on a helper thread; False if TF does not answer within `timeout`"""
+    from disease_inference import loaded_bundles
+
+    def run():
+        for bundle in loaded_bundles().values():
+            width, height = bundle.input_size
+            bundle.model.predict_on_batch(np.zeros((1, height, width, 3), dtype=np.float32))
+        done.set()
+
+    done = threading.Event()
+    threading.Thread(target=run, name="fork-probe", daemon=True).start()
+    return done.wait(timeout)
+
+
+class InFlight:
+    """WSGI middleware counting requests whose response body has not been fully sent yet"""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self._condition = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._condition:
+            self.count += 1
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return ClosingIterator(body, self._done)
+
+    def _done(self):
+        with self._condition:
+            self.count -= 1
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout):
+        """True once no request is in flight, False if `timeout` passes first"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count == 0, timeout)
+
+
+def _serve(listener, address, cpus, probe):
+    """Worker body: pin, probe the inherited models, then serve the Flask app on the shared socket.
+
+    SIGTERM stops accepting and lets in-flight requests finish for up to
+    WORKER_DRAIN_SECONDS before the worker exits.
+    """
+    pin_cpus(cpus)
+    if probe and not probe_models():
+        print(f"⚠️ Worker {os.getpid()}: preloaded models did not answer within {PREFORK_PROBE_SECONDS:.0f} s")
+        return PROBE_FAILED
+    from werkzeug.serving import make_server
+
+    from apps import app
+
+    host, port = address
+    in_flight = InFlight(app)
+    server = make_server(host, port, in_flight, threaded=True, fd=listener.fileno())
+    # shutdown() waits for serve_forever to return, so it must not run on the thread serving
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the master, which stops the workers with SIGTERM
+    print(f"👷 Worker {os.getpid()} serving" + (f" on CPUs {','.join(map(str, cpus))}" if cpus else ""))
+    server.serve_forever()
+    if not in_flight.wait_idle(WORKER_DRAIN_SECONDS):
+        print(f"⚠️ Worker {os.getpid()}: {in_flight.count} request(s) still open after {WORKER_DRAIN_SECONDS:.0f} s")
+    server.server_close()
+
+
+def _per_worker(listener, address, cpus, probe, intra, inter):
+    """Worker body for --load per-worker: its own TF setup and model copies, then _serve"""
+    from disease_inference import preload_models
+
+    apply_serving_config(intra, inter, cpus)
+    preload_models()
+    return _serve(listener, address, cpus, probe)
+
+
+# === Master ===
+class PreforkServer:
+    def __init__(self, address, workers, load, pin, intra, inter, watch_interval):
+        self.address = address
+        self.workers = workers
+        self.load = load
+        self.slices = cpu_slices(workers) if pin else [[] for _ in range(workers)]
+        self.intra = intra
+        self.inter = inter
+        self.watch_interval = watch_interval
+        self.pids = {}  # pid -> worker index
+        self.started = {}  # pid -> fork time
+        self.stopping = False
+        self.listener = None
+
+    def _listen(self):
+        host, port = self.address
+        listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen(LISTEN_BACKLOG)
+        return listener
+
+    def _spawn(self, index):
+        if self.load == "preload":
+            pid = fork_worker(_serve, self.listener, self.address, self.slices[index], True)
+        else:
+            pid = fork_worker(_per_worker, self.listener, self.address, self.slices[index], False,
+                              self.intra, self.inter)
+        self.pids[pid] = index
+        self.started[pid] = time.monotonic()
+        return pid
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _replace_all(self):
+        """Rolling restart onto the master's current models.
+
+        Each replacement is forked before the old worker gets SIGTERM, and
+        the master waits while the old worker drains its in-flight requests.
+        """
+        for pid, index in list(self.pids.items()):
+            self._spawn(index)
+            del self.pids[pid], self.started[pid]
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+    def run(self):
+        watcher = None
+        if self.load == "preload":
+            from disease_inference import make_model_watcher, preload_models
+
+            apply_serving_config(self.intra, self.inter, [])
+            start = time.perf_counter()
+            loaded = preload_models()
+            print(f"📦 Loaded and warmed {', '.join(loaded) or 'no models'} in {time.perf_counter() - start:.1f} s")
+            if self.watch_interval > 0:
+                watcher = make_model_watcher(self.watch_interval)  # polled below, never started as a thread
+            gc.freeze()  # keep the collector from writing to the preloaded objects' pages in every worker
+
+        self.listener = self._listen()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        if self.workers > 1:
+            print("⚠️ Live camera streams (/stream) live in one worker; serve them with --workers 1")
+        print(f"🚀 Pre-fork server on {self.address[0]}:{self.address[1]} with {self.workers} worker(s), "
+              f"models {'preloaded' if self.load == 'preload' else 'loaded per worker'}")
+
+        next_check = time.monotonic() + self.watch_interval
+        while not self.stopping:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid in self.pids:
+                index = self.pids.pop(pid)
+                lifetime = time.monotonic() - self.started.pop(pid)
+                if os.waitstatus_to_exitcode(status) == PROBE_FAILED:
+                    return self._fall_back()
+                print(f"⚠️ Worker {pid} exited ({os.waitstatus_to_exitcode(status)}); starting a new one")
+                if lifetime < MIN_WORKER_SECONDS:
+                    time.sleep(MIN_WORKER_SECONDS)  # a worker that cannot start must not become a fork loop
+                self._spawn(index)
+                continue
+            if watcher is not None and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.watch_interval
+                gc.unfreeze()
+                if watcher.check_once():
+                    self._replace_all()
+                gc.freeze()
+            time.sleep(0.2)
+
+        self._terminate()
+        return 0
+
+    def _terminate(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.pids.clear()
+        self.started.clear()
+
+    def _fall_back(self):
+        print("⚠️ This TensorFlow build cannot run preloaded models after fork; restarting with --load per-worker")
+        self._terminate()
+        self.listener.close()
+        os.environ["MODEL_WATCH_INTERVAL"] = str(self.watch_interval)  # workers watch their own bundles again
+        argv = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--load", "per-worker"]
+        os.execv(sys.executable, argv)
+
+
+def _parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default="127.0.0.1:5000")
+    parser.add_argument("--workers", type=int, default=len(available_cpus()))
+    parser.add_argument("--load", choices=["preload", "per-worker"], default="preload",
+                        help="Load the models once in the master (shared copy-on-write) or in every worker")
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its own slice of cores")
+    parser.add_argument("--intra-op", type=int, help="TF intra-op threads (preload: 1; per-worker: TF_INTRA_OP_THREADS)")
+    parser.add_argument("--inter-op", type=int,
+                        help="TF inter-op threads, -1 for the calling thread (preload: -1; per-worker: TF_INTER_OP_THREADS)")
+    parser.add_argument("--watch-interval", type=float, default=float(os.getenv("MODEL_WATCH_INTERVAL", 10)),
+                        help="Seconds between checks for new bundle versions (0 disables hot reload)")
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        sys.exit("❌ The pre-fork server needs os.fork (Linux or macOS); on Windows run apps.py directly")
+
+    preload = args.load == "preload"
+    intra = args.intra_op if args.intra_op is not None else (1 if preload else TF_INTRA_OP_THREADS)
+    inter = args.inter_op if args.inter_op is not None else (-1 if preload else TF_INTER_OP_THREADS)
+    if preload:
+        # Read by model_watcher at import: the workers must not reload on their own, the master does it for them
+        os.environ["MODEL_WATCH_INTERVAL"] = "0"
+    server = PreforkServer(_parse_address(args.bind), args.workers, args.load, args.pin, intra, inter,
+                           args.watch_interval if preload else 0)
+    sys.exit(server.run())
+
+
+if __name__ == "__main__":
+    main()
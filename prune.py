@@ -0,0 +1,177 @@
+"""Structured channel pruning of the VGG16/VGG19 backbones, with a short fine-tune to recover accuracy.
+
+Usage:
+    python prune.py --model VGG16
+    python prune.py --model VGG19 --ratios 0.25,0.5,0.75 --criterion activation --epochs 2
+
+Every conv layer's output channels are ranked by the L1 norm of their
+filters ("magnitude") or by their mean ReLU activation over a calibration
+sample of the training split ("activation"). The lowest-ranked fraction is
+physically removed: the pruned model is rebuilt with thinner Conv2D layers
+(and a narrower input to the next conv / Dense layer), so it is smaller
+and faster on any backend, not just sparse. Each pruned model is
+fine-tuned briefly, saved as a bundle and profiled against the original:
+params, size, GFLOPs, batch-1 CPU latency and held-out accuracy.
+"""
+import argparse
+
+import numpy as np
+
+from disease_inference import MODEL_OPTIONS
+from distill import make_dataset
+from leaf_dataset import DATA_DIR, iter_batches, training_split, validation_split
+from model_bundle import load_bundle, save_bundle
+from model_profile import evaluate_accuracy, print_comparison, profile_bundle
+
+
+# === Channel ranking ===
+def conv_layers(model):
+    from tensorflow.keras.layers import Conv2D
+    return [layer for layer in model.layers if isinstance(layer, Conv2D)]
+
+
+def magnitude_scores(model):
+    """Per conv layer, the L1 norm of each output filter"""
+    return {layer.name: np.abs(layer.get_weights()[0]).sum(axis=(0, 1, 2)) for layer in conv_layers(model)}
+
+
+def activation_scores(model, paths, input_size, batch_size=8):
+    """Per conv layer, the mean post-ReLU activation of each channel over `paths`"""
+    from tensorflow.keras import Model
+
+    convs = conv_layers(model)
+    probe = Model(model.input, [layer.output for layer in convs])
+    totals = {layer.name: np.zeros(layer.filters, dtype=np.float64) for layer in convs}
+    for batch in iter_batches(paths, batch_size, input_size):
+        for layer, output in zip(convs, probe.predict_on_batch(batch)):
+            totals[layer.name] += np.asarray(output).mean(axis=(1, 2)).sum(axis=0)
+    return {name: total / len(paths) for name, total in totals.items()}
+
+
+def channels_to_keep(scores, ratio, round_to=8):
+    """Sorted indices of the channels that survive pruning `ratio` of them (count rounded to `round_to`)"""
+    keep = int(round(len(scores) * (1.0 - ratio) / round_to)) * round_to
+    keep = min(len(scores), max(round_to, keep))
+    return np.sort(np.argsort(-scores)[:keep])
+
+
+# === Surgery ===
+def prune_model(model, scores, ratio, round_to=8):
+    """Rebuild a single-chain conv model with the weakest `ratio` of every conv layer's channels removed"""
+    from tensorflow.keras import Input, Model
+    from tensorflow.keras.layers import Conv2D, Dense
+
+    inputs = Input(shape=model.input_shape[1:])
+    x = inputs
+    kept_in = np.arange(model.input_shape[-1])  # channels of the tensor flowing into the next layer
+    for layer in model.layers[1:]:
+        config = layer.get_config()
+        weights = layer.get_weights()
+        if isinstance(layer, Conv2D):
+            kept_out = channels_to_keep(scores[layer.name], ratio, round_to)
+            config["filters"] = len(kept_out)
+            weights = [weights[0][:, :, kept_in, :][..., kept_out]] + [w[kept_out] for w in weights[1:]]
+            kept_in = kept_out
+        elif isinstance(layer, Dense) and kept_in is not None:
+            # First Dense after the GAP: drop the rows of the removed channels
+            weights = [weights[0][kept_in, :]] + weights[1:]
+            kept_in = None
+        new_layer = layer.__class__.from_config(config)
+        x = new_layer(x)
+        if weights:
+            new_layer.set_weights(weights)
+    return Model(inputs, x, name=f"{model.name}_pruned{int(ratio * 100)}")
+
+
+# === Fine-tune ===
+def fine_tune(model, train_samples, val_samples, num_classes, input_size, epochs, batch_size, learning_rate):
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import Adam
+
+    def dataset(samples, training):
+        paths = [path for path, _ in samples]
+        targets = np.eye(num_classes, dtype=np.float32)[[label for _, label in samples]]
+        return make_dataset(paths, targets, input_size[0], batch_size, training)
+
+    for layer in model.layers:
+        layer.trainable = True
+    model.compile(optimizer=Adam(learning_rate), loss="categorical_crossentropy", metrics=["accuracy"])
+    history = model.fit(
+        dataset(train_samples, training=True),
+        validation_data=dataset(val_samples, training=False),
+        epochs=epochs,
+        callbacks=[EarlyStopping(monitor="val_accuracy", mode="max", patience=1, restore_best_weights=True)],
+    )
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="VGG16", help="A MODEL_OPTIONS name or a bundle dir")
+    parser.add_argument("--ratios", default="0.25,0.5,0.75", help="Fractions of each conv layer's channels to remove")
+    parser.add_argument("--criterion", choices=("magnitude", "activation"), default="magnitude")
+    parser.add_argument("--calibration-images", type=int, default=256,
+                        help="Training images used to rank channels by activation")
+    parser.add_argument("--round-to", type=int, default=8, help="Keep channel counts a multiple of this")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-5)
+    parser.add_argument("--output-prefix", help="Bundle dir prefix (default: <bundle dir>_pruned)")
+    args = parser.parse_args()
+
+    bundle = load_bundle(MODEL_OPTIONS.get(args.model, args.model))
+    train_samples, class_names = training_split(args.data_dir)
+    val_samples, _ = validation_split(args.data_dir)
+    if class_names != bundle.class_names:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match {args.data_dir}")
+    print(f"📂 {len(train_samples)} training / {len(val_samples)} held-out images, {len(class_names)} classes")
+
+    # === Rank channels once; every ratio reuses the same ranking ===
+    if args.criterion == "activation":
+        rng = np.random.default_rng(42)
+        picks = rng.choice(len(train_samples), min(args.calibration_images, len(train_samples)), replace=False)
+        print(f"📊 Ranking channels by mean activation over {len(picks)} training images...")
+        scores = activation_scores(bundle.model, [train_samples[i][0] for i in picks], bundle.input_size)
+    else:
+        scores = magnitude_scores(bundle.model)
+
+    rows = [profile_bundle(bundle, val_samples)]
+    output_prefix = args.output_prefix or f"{bundle.bundle_dir.rstrip('/')}_pruned"
+    for ratio in (float(r) for r in args.ratios.split(",")):
+        pruned = prune_model(bundle.model, scores, ratio, args.round_to)
+        before = evaluate_accuracy(pruned, val_samples, bundle.input_size, args.batch_size)
+        print(f"\n✂️ Pruned {ratio * 100:.0f}% of channels: {pruned.count_params() / 1e6:.2f}M params, "
+              f"accuracy before fine-tune {before * 100:.2f}%")
+        history = fine_tune(pruned, train_samples, val_samples, len(class_names), bundle.input_size,
+                            args.epochs, args.batch_size, args.learning_rate)
+
+        output = f"{output_prefix}{int(ratio * 100)}"
+        manifest = save_bundle(
+            pruned,
+            output,
+            name=f"{bundle.name}-pruned{int(ratio * 100)}",
+            class_names=class_names,
+            input_size=bundle.input_size,
+            preprocessing=bundle.manifest["preprocessing"],
+            training={
+                "architecture": f"{bundle.name} channel-pruned",
+                "source_bundle": {bundle.name: bundle.version},
+                "pruning_ratio": ratio,
+                "criterion": args.criterion,
+                "round_to": args.round_to,
+                "fine_tune_epochs": len(history.history["loss"]),
+                "learning_rate": args.learning_rate,
+                "accuracy_before_fine_tune": before,
+                "val_accuracy": float(max(history.history["val_accuracy"])),
+            },
+        )
+        print(f"✅ Bundle v{manifest['version']} saved to: {output}")
+        rows.append(profile_bundle(load_bundle(output), val_samples))
+
+    print_comparison(rows)
+    print(f"\nUse a pruned model by pointing a MODEL_OPTIONS entry at its bundle dir ({output_prefix}<pct>).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Shadow evaluation of a candidate disease model on sampled live traffic.
+
+A configurable fraction of uploads that were scored by the serving model
+are also queued for a candidate bundle. The candidate runs on one background
+thread; the user-facing request only does a non-blocking put on a bounded
+queue and never waits (when the queue is full the sample is dropped). Each
+comparison is stored as one small row in a SQLite file: which models,
+whether the top-1 classes agree, both confidences and both latencies.
+Both latencies cover the same span, forward passes plus calibration, and
+each row records the primary's TTA mode ("none", "flips" or "full"), since
+TTA multiplies the primary's views while the candidate scores one.
+Served confidences are calibrated, so the candidate's probabilities go
+through the candidate bundle's own calibration (when it has one) before
+they are compared.
+
+    SHADOW_MODEL=models/plant_disease_vgg16_e10_pruned50 SHADOW_FRACTION=0.1 streamlit run app.py
+    python shadow.py report
+"""
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from fast_preprocess import normalize_into
+
+SHADOW_MODEL = os.getenv("SHADOW_MODEL")  # bundle dir or MODEL_OPTIONS name; unset disables shadowing
+SHADOW_FRACTION = float(os.getenv("SHADOW_FRACTION", 0.05))
+SHADOW_DB = os.getenv("SHADOW_DB", "shadow.db")
+SHADOW_QUEUE_SIZE = 64
+FLUSH_EVERY = 20  # rows per SQLite transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_results (
+    ts REAL NOT NULL,
+    primary_model TEXT NOT NULL,
+    candidate_version TEXT NOT NULL,
+    agree INTEGER NOT NULL,
+    primary_class TEXT NOT NULL,
+    candidate_class TEXT NOT NULL,
+    primary_confidence REAL NOT NULL,
+    candidate_confidence REAL NOT NULL,
+    primary_ms REAL NOT NULL,
+    candidate_ms REAL NOT NULL,
+    primary_tta TEXT NOT NULL DEFAULT 'none'
+)
+"""
+
+
+def _open_db(db_path):
+    """Connection with the current schema; tables from before primary_tta get the column added"""
+    connection = sqlite3.connect(db_path)
+    connection.execute(_SCHEMA)
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(shadow_results)")}
+    if "primary_tta" not in columns:
+        with connection:
+            connection.execute("ALTER TABLE shadow_results ADD COLUMN primary_tta TEXT NOT NULL DEFAULT 'none'")
+    return connection
+
+
+class ShadowEvaluator:
+    """Samples requests and scores them with a candidate bundle on a background thread.
+
+    `load_candidate()` returns the candidate bundle; `calibrate(bundle)`
+    returns its Calibration or None.
+    """
+
+    def __init__(self, load_candidate, calibrate=None, fraction=SHADOW_FRACTION, db_path=SHADOW_DB,
+                 max_queue=SHADOW_QUEUE_SIZE):
+        self.fraction = fraction
+        self.db_path = db_path
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self._load_candidate = load_candidate
+        self._calibrate = calibrate or (lambda bundle: None)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="shadow-evaluator", daemon=True)
+        self._thread.start()
+
+    def maybe_submit(self, primary_model, img, predicted_class, confidence, latency_ms, tta="none"):
+        """Queue a comparison for a sampled fraction of requests; never blocks.
+
+        `latency_ms` is the primary's forward-pass plus calibration time.
+        """
+        if random.random() >= self.fraction:
+            return False
+        try:
+            self._queue.put_nowait((time.time(), primary_model, img, predicted_class, confidence, latency_ms, tta))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _score(self, candidate, calibration, img):
+        width, height = candidate.input_size
+        if img.size != (width, height):
+            img = img.resize((width, height))
+        batch = np.empty((1, height, width, 3), dtype=np.float32)
+        normalize_into(img, batch[0])
+        start = time.perf_counter()
+        probabilities = np.asarray(candidate.model.predict_on_batch(batch))[0]
+        if calibration is not None:
+            probabilities = calibration.apply(probabilities)
+        latency_ms = (time.perf_counter() - start) * 1000
+        index = int(np.argmax(probabilities))
+        return candidate.class_names[index], float(probabilities[index]) * 100, latency_ms
+
+    def _run(self):
+        try:
+            candidate = self._load_candidate()  # loaded here so startup and requests never wait on it
+            calibration = self._calibrate(candidate)
+        except Exception as e:
+            print(f"⚠️ Shadow model unavailable, shadow evaluation disabled: {e}")
+            self.fraction = 0.0
+            return
+        connection = _open_db(self.db_path)
+        rows = []
+        while True:
+            try:
+                item = self._queue.get(timeout=5.0)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                ts, primary_model, img, primary_class, primary_confidence, primary_ms, primary_tta = item
+                try:
+                    candidate_class, candidate_confidence, candidate_ms = self._score(candidate, calibration, img)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"⚠️ Shadow prediction failed: {e}")
+                    continue
+                rows.append((ts, primary_model, candidate.version, int(candidate_class == primary_class),
+                             primary_class, candidate_class, primary_confidence, candidate_confidence,
+                             primary_ms, candidate_ms, primary_tta))
+            if rows and (item is None or len(rows) >= FLUSH_EVERY):
+                with connection:
+                    connection.executemany("INSERT INTO shadow_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+
+
+def summarize(db_path=SHADOW_DB):
+    """Per (primary model, primary TTA mode, candidate version): samples, agreement, confidence delta, latencies"""
+    connection = _open_db(db_path)
+    try:
+        records = connection.execute(
+            "SELECT primary_model, primary_tta, candidate_version, agree, "
+            "candidate_confidence - primary_confidence, primary_ms, candidate_ms FROM shadow_results").fetchall()
+    finally:
+        connection.close()
+    groups = {}
+    for primary_model, tta, version, agree, delta, primary_ms, candidate_ms in records:
+        groups.setdefault((primary_model, tta, version), []).append((agree, delta, primary_ms, candidate_ms))
+    summary = []
+    for (primary_model, tta, version), values in sorted(groups.items()):
+        agree, delta, primary_ms, candidate_ms = (np.array(column) for column in zip(*values))
+        summary.append({
+            "primary_model": primary_model,
+            "primary_tta": tta,
+            "candidate_version": version,
+            "samples": len(values),
+            "agreement": float(agree.mean()),
+            "mean_confidence_delta": float(delta.mean()),
+            "mean_abs_confidence_delta": float(np.abs(delta).mean()),
+            "primary_ms_p50": float(np.percentile(primary_ms, 50)),
+            "candidate_ms_p50": float(np.percentile(candidate_ms, 50)),
+            "candidate_ms_p95": float(np.percentile(candidate_ms, 95)),
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Agreement, confidence delta and latency per candidate version")
+    report.add_argument("--db", default=SHADOW_DB)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"❌ No shadow results at {args.db}")
+    rows = summarize(args.db)
+    print(f"{'primary':<26} {'tta':<6} {'candidate':<14} {'samples':>8} {'agree':>7} {'Δconf':>7} {'|Δconf|':>8} "
+          f"{'primary ms':>11} {'cand. ms p50/p95':>17}")
+    for row in rows:
+        print(f"{row['primary_model']:<26} {row['primary_tta']:<6} {row['candidate_version']:<14} {row['samples']:>8} "
+              f"{row['agreement'] * 100:>6.1f}% {row['mean_confidence_delta']:>+7.2f} "
+              f"{row['mean_abs_confidence_delta']:>8.2f} {row['primary_ms_p50']:>11.1f} "
+              f"{row['candidate_ms_p50']:>8.1f}/{row['candidate_ms_p95']:<8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Key-value store in the app's SQLite database, shared by every worker process.
+
+apps.py keeps e-mail verification codes, password-reset OTPs and generated
+chatbot audio between requests. In a process-local dict, the follow-up
+request fails whenever it lands on another pre-fork worker
+(prefork_server.py). Values are JSON; datetimes round-trip as ISO strings.
+"""
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+SQLITE_TIMEOUT = 10.0  # seconds to wait for another process's write lock
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    return datetime.fromisoformat(obj["__datetime__"]) if set(obj) == {"__datetime__"} else obj
+
+
+class SharedStore:
+    """Dict-like view of one namespace of the shared_store table"""
+
+    def __init__(self, db_path, namespace):
+        self.db_path = db_path
+        self.namespace = namespace
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shared_store (
+                    namespace TEXT,
+                    key TEXT,
+                    value TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=SQLITE_TIMEOUT)
+
+    def get(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM shared_store WHERE namespace = ? AND key = ?",
+                               (self.namespace, key)).fetchone()
+        return json.loads(row[0], object_hook=_decode) if row else default
+
+    def __setitem__(self, key, value):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO shared_store (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                         (self.namespace, key, json.dumps(value, default=_encode), time.time()))
+
+    def pop(self, key, default=None):
+        """Remove and return a value; read and delete are one write transaction, so only one worker gets it"""
+        conn = self._connect()
+        conn.isolation_level = None  # explicit transaction below
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM shared_store WHERE namespace = ? AND key = ?",
+                               (self.namespace, key)).fetchone()
+            if row:
+                conn.execute("DELETE FROM shared_store WHERE namespace = ? AND key = ?", (self.namespace, key))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return json.loads(row[0], object_hook=_decode) if row else default
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def prune(self, max_age_seconds):
+        """Drop entries not written for `max_age_seconds`"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM shared_store WHERE namespace = ? AND updated_at < ?",
+                         (self.namespace, time.time() - max_age_seconds))
@@ -0,0 +1,289 @@
+"""Similar-case retrieval: the labelled images in new/ closest to an upload in embedding space.
+
+`build` embeds every dataset image with a bundle's penultimate layer (the
+same embedding ood.py uses). The L2-normalised vectors are stored as a
+float16 .npy matrix that search memory-maps, so the index costs no RAM
+until it is touched. Search modes:
+- exact: blocked matmul over the memory map, one float32 block at a time;
+- ivf: spherical k-means inverted lists, scanning only the `nprobe`
+  nearest lists;
+- hnsw: an optional graph index, when hnswlib is installed.
+
+At serve time the query is the embedding from the prediction's own forward
+pass, so retrieval adds no model call.
+
+A rebuild writes its data files under new names and replaces meta.json
+last; meta.json names the files it belongs to. Running servers keep
+reading their own, memory-mapped files, and the vectors, paths and labels
+they see always come from one build.
+
+    python similar_cases.py build VGG16 --ivf
+    python similar_cases.py bench VGG16
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+INDEX_DIR = "similar_cases"
+EMBEDDINGS_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+IVF_FILE = "ivf.npz"
+HNSW_FILE = "hnsw.bin"
+BLOCK_ROWS = 8192
+DEFAULT_NPROBE = 8
+
+logger = logging.getLogger(__name__)
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-8)
+
+
+def _index_files(meta):
+    """name -> file in the index dir; indexes built before meta.json listed its files use the fixed names"""
+    if "files" in meta:
+        return meta["files"]
+    return {"embeddings": EMBEDDINGS_FILE, "ivf": IVF_FILE, "hnsw": HNSW_FILE}
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class SimilarCaseIndex:
+    """Memory-mapped float16 embedding matrix plus optional IVF / HNSW structures"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.files = _index_files(self.meta)
+        self.embeddings = np.load(self.path("embeddings"), mmap_mode="r")
+        self._ivf = None
+        self._hnsw = None
+
+    def path(self, name):
+        return os.path.join(self.index_dir, self.files[name])
+
+    def has(self, name):
+        return name in self.files and os.path.exists(self.path(name))
+
+    @property
+    def version(self):
+        return self.meta["version"]
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    # === Search ===
+    def search_exact(self, query, k=5):
+        """(indices, scores) by cosine similarity, scanning the matrix in float32 blocks"""
+        best_index = np.empty(0, dtype=np.int64)
+        best_score = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            scores = self.embeddings[start:start + BLOCK_ROWS].astype(np.float32) @ query
+            top = _top_k(scores, k)
+            best_index = np.concatenate([best_index, top + start])
+            best_score = np.concatenate([best_score, scores[top]])
+        keep = _top_k(best_score, k)
+        return best_index[keep], best_score[keep]
+
+    def search_ivf(self, query, k=5, nprobe=DEFAULT_NPROBE):
+        if self._ivf is None:
+            ivf = np.load(self.path("ivf"))
+            self._ivf = (ivf["centroids"], ivf["order"], ivf["offsets"])
+        centroids, order, offsets = self._ivf
+        lists = _top_k(centroids @ query, min(nprobe, len(centroids)))
+        candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists])
+        candidates.sort()  # sequential reads from the memory map
+        scores = self.embeddings[candidates].astype(np.float32) @ query
+        top = _top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def search_hnsw(self, query, k=5):
+        if self._hnsw is None:
+            import hnswlib
+            self._hnsw = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+            self._hnsw.load_index(self.path("hnsw"))
+            self._hnsw.set_ef(max(64, 4 * k))
+        labels, distances = self._hnsw.knn_query(query[np.newaxis], k=k)
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def search(self, embedding, k=5, method="exact", nprobe=DEFAULT_NPROBE):
+        """Top-k dataset images for one embedding as [{"path", "class", "score"}]"""
+        query = _normalise(np.asarray(embedding).ravel())
+        if method == "ivf" and self.has("ivf"):
+            indices, scores = self.search_ivf(query, k, nprobe)
+        elif method == "hnsw" and self.has("hnsw"):
+            indices, scores = self.search_hnsw(query, k)
+        else:
+            indices, scores = self.search_exact(query, k)
+        paths, labels, class_names = self.meta["paths"], self.meta["labels"], self.meta["class_names"]
+        return [{"path": os.path.join(self.meta["data_dir"], paths[i]), "class": class_names[labels[i]],
+                 "score": float(score)} for i, score in zip(indices, scores)]
+
+
+def load_index(bundle_dir, bundle_version=None):
+    """SimilarCaseIndex built for a bundle, or None when none was built or it was built for another `bundle_version`"""
+    index_dir = os.path.join(bundle_dir, INDEX_DIR)
+    if not os.path.exists(os.path.join(index_dir, META_FILE)):
+        return None
+    try:
+        index = SimilarCaseIndex(index_dir)
+    except FileNotFoundError:  # rebuilt between reading meta.json and opening the files it names
+        index = SimilarCaseIndex(index_dir)
+    if bundle_version is not None and index.meta["bundle_version"] != bundle_version:
+        logger.warning("Ignoring %s: built with bundle v%s, the model is v%s; rebuild it with similar_cases.py build",
+                       index_dir, index.meta["bundle_version"], bundle_version)
+        return None
+    return index
+
+
+# === Build ===
+def build_ivf(embeddings, nlist, iterations=15, seed=0):
+    """Spherical k-means; returns (centroids, order, offsets) with list c = order[offsets[c]:offsets[c + 1]]"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(embeddings, dtype=np.float32)
+    nlist = min(nlist, len(data))  # small datasets: at most one list per vector
+    centroids = data[rng.choice(len(data), nlist, replace=False)]
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalise(centroids)
+    assign = np.argmax(data @ centroids.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+    return centroids, order, offsets
+
+
+def build_index(bundle, data_dir, batch_size=32, ivf=False, hnsw=False):
+    from leaf_dataset import list_class_files
+    from ood import embed
+
+    class_names, files = list_class_files(data_dir)
+    if class_names != bundle.class_names:
+        raise SystemExit(f"❌ {bundle.name}'s classes do not match {data_dir}")
+    paths = [path for name in class_names for path in files[name]]
+    labels = [label for label, name in enumerate(class_names) for _ in files[name]]
+
+    print(f"🧠 Embedding {len(paths)} images with {bundle.name}...")
+    embeddings = _normalise(embed(bundle.model, paths, bundle.input_size, batch_size))
+    index_dir = os.path.join(bundle.bundle_dir, INDEX_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    # Fresh names per build: servers memory-map the previous files, so those are never written over
+    build_id = int(time.time())
+    stem, ext = os.path.splitext(EMBEDDINGS_FILE)
+    files = {"embeddings": f"{stem}-{build_id}{ext}"}
+    np.save(os.path.join(index_dir, files["embeddings"]), embeddings.astype(np.float16))
+    if ivf:
+        nlist = max(1, int(4 * np.sqrt(len(paths))))
+        centroids, order, offsets = build_ivf(embeddings, nlist)
+        stem, ext = os.path.splitext(IVF_FILE)
+        files["ivf"] = f"{stem}-{build_id}{ext}"
+        np.savez(os.path.join(index_dir, files["ivf"]), centroids=centroids, order=order, offsets=offsets)
+        print(f"✅ IVF index with {len(centroids)} lists")
+    if hnsw:
+        import hnswlib
+        graph = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+        graph.init_index(max_elements=len(paths), ef_construction=200, M=16)
+        graph.add_items(embeddings, np.arange(len(paths)))
+        stem, ext = os.path.splitext(HNSW_FILE)
+        files["hnsw"] = f"{stem}-{build_id}{ext}"
+        graph.save_index(os.path.join(index_dir, files["hnsw"]))
+        print("✅ HNSW index built")
+
+    meta = {
+        "version": f"{bundle.version}-{build_id}",
+        "files": files,
+        "bundle_version": bundle.version,
+        "data_dir": data_dir,
+        "class_names": class_names,
+        "paths": [os.path.relpath(path, data_dir) for path in paths],
+        "labels": labels,
+        "dim": int(embeddings.shape[1]),
+    }
+    tmp_path = os.path.join(index_dir, META_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(index_dir, META_FILE))  # written last: the index is complete
+    for name in os.listdir(index_dir):
+        if name not in (META_FILE, *files.values()):
+            try:
+                os.remove(os.path.join(index_dir, name))  # an earlier build; servers' memory maps stay valid
+            except OSError as e:
+                logger.warning("Could not remove %s: %s", name, e)
+    size_mb = os.path.getsize(os.path.join(index_dir, files["embeddings"])) / 2**20
+    print(f"✅ {len(paths)} x {embeddings.shape[1]} float16 embeddings ({size_mb:.1f} MB) in {index_dir}")
+
+
+def bench(index, k=5, queries=200, nprobe=DEFAULT_NPROBE):
+    """Latency of each search mode and its recall@k against exact search, using dataset rows as queries"""
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(index), min(queries, len(index)), replace=False)
+    vectors = [index.embeddings[i].astype(np.float32) for i in picks]
+    exact = [set(index.search_exact(q, k)[0]) for q in vectors]
+    modes = {"exact": lambda q: index.search_exact(q, k)}
+    if index.has("ivf"):
+        modes[f"ivf (nprobe={nprobe})"] = lambda q: index.search_ivf(q, k, nprobe)
+    if index.has("hnsw"):
+        modes["hnsw"] = lambda q: index.search_hnsw(q, k)
+
+    print(f"\n{len(index)} vectors, {len(vectors)} queries, k={k}")
+    print(f"{'mode':<20} {'ms/query':>9} {'recall@k':>9}")
+    for name, search in modes.items():
+        search(vectors[0])  # load lazily-built structures before timing
+        start = time.perf_counter()
+        found = [set(search(q)[0]) for q in vectors]
+        ms = (time.perf_counter() - start) * 1000 / len(vectors)
+        recall = np.mean([len(f & e) / len(e) for f, e in zip(found, exact)])
+        print(f"{name:<20} {ms:>9.3f} {recall * 100:>8.1f}%")
+
+
+def main():
+    from disease_inference import MODEL_OPTIONS
+    from leaf_dataset import DATA_DIR
+    from model_bundle import load_bundle, read_manifest
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Embed the dataset and write the index into the bundle")
+    build.add_argument("model", help="A MODEL_OPTIONS name or a bundle dir")
+    build.add_argument("--data-dir", default=DATA_DIR)
+    build.add_argument("--batch-size", type=int, default=32)
+    build.add_argument("--ivf", action="store_true", help="Also build IVF inverted lists")
+    build.add_argument("--hnsw", action="store_true", help="Also build an HNSW graph (needs hnswlib)")
+    bench_parser = sub.add_parser("bench", help="Search latency and recall per mode")
+    bench_parser.add_argument("model")
+    bench_parser.add_argument("--k", type=int, default=5)
+    bench_parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    args = parser.parse_args()
+
+    bundle_dir = MODEL_OPTIONS.get(args.model, args.model)
+    if args.command == "build":
+        if args.hnsw:
+            try:
+                import hnswlib  # noqa: F401
+            except ImportError:
+                raise SystemExit("❌ --hnsw needs hnswlib (pip install hnswlib)")
+        build_index(load_bundle(bundle_dir), args.data_dir, args.batch_size, args.ivf, args.hnsw)
+    else:
+        index = load_index(bundle_dir)
+        if index is None:
+            raise SystemExit(f"❌ No similar-case index in {bundle_dir}; run 'build' first")
+        if index.meta["bundle_version"] != read_manifest(bundle_dir)["version"]:
+            print("⚠️ The index was built for an older version of this bundle; rebuild it")
+        bench(index, args.k, nprobe=args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Continuous diagnosis from a live camera stream.
+
+Browsers send camera frames as JPEGs (the /stream page in apps.py); each
+frame goes through three cheap checks before it can reach the model:
+- frames closer than 1 / STREAM_TARGET_FPS to the last accepted one are
+  skipped;
+- frames whose 32x32 grayscale signature barely differs from the last
+  scored frame (mean absolute difference below STREAM_DIFF_THRESHOLD) are
+  skipped, because a steady camera repeats the same diagnosis;
+- frames that fail the non-leaf gate are reported as such and not scored.
+
+Each stream holds at most one pending frame: a newer frame replaces an
+older one that is still waiting (counted as dropped), so queue depth and
+latency stay bounded however fast frames arrive. One scorer thread
+collects the pending frames of all streams, groups them by model and
+scores each group with one predict_on_batch of up to STREAM_BATCH_SIZE.
+Per stream the calibrated probabilities are averaged over the last
+STREAM_WINDOW scored frames, so the reported class does not flicker.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from io import BytesIO
+
+import numpy as np
+
+from fast_preprocess import decode_resized, normalize_into
+from leaf_gate import NotALeafImage, require_leaf
+
+STREAM_TARGET_FPS = float(os.getenv("STREAM_TARGET_FPS", 4))
+STREAM_DIFF_THRESHOLD = float(os.getenv("STREAM_DIFF_THRESHOLD", 4.0))  # grey levels, 0-255
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 8))
+STREAM_WINDOW = int(os.getenv("STREAM_WINDOW", 5))
+STREAM_IDLE_SECONDS = 60.0  # streams without frames for this long are closed
+STREAM_EXPIRE_INTERVAL = 10.0  # how often the idle scorer thread looks for abandoned streams
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", 32))
+SIGNATURE_SIZE = (32, 32)
+
+
+def frame_signature(img):
+    """(32, 32) float32 grayscale thumbnail used to detect near-duplicate frames"""
+    return np.asarray(img.convert("L").resize(SIGNATURE_SIZE), dtype=np.float32)
+
+
+class StreamSession:
+    """Per-stream state: the pending frame, the smoothing window and counters"""
+
+    def __init__(self, model_name, window=STREAM_WINDOW):
+        self.id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.pending = None  # (PIL image, received timestamp)
+        self.window = deque(maxlen=window)
+        self.last_signature = None
+        self.last_accepted = 0.0
+        self.last_seen = time.time()
+        self.result = None
+        self.sequence = 0  # bumped on every new result
+        self.received = self.skipped = self.dropped = self.scored = self.not_leaf = 0
+        self.started = time.time()
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {"received": self.received, "skipped": self.skipped, "dropped": self.dropped,
+                "not_leaf": self.not_leaf, "scored": self.scored, "scored_fps": self.scored / elapsed}
+
+
+class StreamScorer:
+    """Accepts frames for many streams and scores them in batches on one background thread.
+
+    `load_bundle(model_name)` returns the current bundle (taken once per
+    batch, so hot reloads apply between batches); `calibrate(bundle)`
+    returns its Calibration or None.
+    """
+
+    def __init__(self, load_bundle, calibrate=None, target_fps=STREAM_TARGET_FPS, batch_size=STREAM_BATCH_SIZE,
+                 diff_threshold=STREAM_DIFF_THRESHOLD, max_streams=MAX_STREAMS):
+        self.min_interval = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.batch_size = batch_size
+        self.diff_threshold = diff_threshold
+        self.max_streams = max_streams
+        self._load_bundle = load_bundle
+        self._calibrate = calibrate or (lambda bundle: None)
+        self._sessions = {}
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="stream-scorer", daemon=True)
+        self._thread.start()
+
+    # === Streams ===
+    def open(self, model_name):
+        with self._condition:
+            self._expire_idle()
+            if len(self._sessions) >= self.max_streams:
+                return None
+            session = StreamSession(model_name)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, stream_id):
+        return self._sessions.get(stream_id)
+
+    def close(self, stream_id):
+        with self._condition:
+            session = self._sessions.pop(stream_id, None)
+            self._condition.notify_all()  # wake event listeners so they can end
+            return session
+
+    def _expire_idle(self):
+        """Drop streams without frames for STREAM_IDLE_SECONDS; call with the condition held"""
+        now = time.time()
+        expired = [s.id for s in self._sessions.values() if now - s.last_seen > STREAM_IDLE_SECONDS]
+        for stream_id in expired:
+            del self._sessions[stream_id]
+        if expired:
+            self._condition.notify_all()  # wake their event listeners so they can end
+
+    # === Frames ===
+    def submit(self, session, image_bytes, input_size):
+        """Accept or skip one frame; returns "queued", "skipped", "too_fast" or "not_leaf".
+
+        Frames of one stream may arrive concurrently, so the session state is
+        only read and written under the condition; decoding and the leaf
+        gate run outside it.
+        """
+        now = time.time()
+        with self._condition:
+            session.last_seen = now
+            session.received += 1
+            if now - session.last_accepted < self.min_interval:
+                session.skipped += 1
+                return "too_fast"
+        img = decode_resized(BytesIO(image_bytes), input_size)
+        signature = frame_signature(img)
+        with self._condition:
+            if session.last_signature is not None and session.result is not None and \
+                    np.abs(signature - session.last_signature).mean() < self.diff_threshold:
+                session.skipped += 1
+                return "skipped"
+        try:
+            require_leaf(img)
+        except NotALeafImage:
+            with self._condition:
+                session.not_leaf += 1
+                session.last_signature = None
+            return "not_leaf"
+        with self._condition:
+            if now - session.last_accepted < self.min_interval:
+                session.skipped += 1  # a concurrent frame was accepted while this one decoded
+                return "too_fast"
+            session.last_accepted = now
+            session.last_signature = signature
+            if session.pending is not None:
+                session.dropped += 1  # the scorer fell behind: the newest frame wins
+            session.pending = (img, now)
+            self._condition.notify_all()
+        return "queued"
+
+    def wait_for_result(self, session, after_sequence, timeout):
+        """Block until the session has a result newer than `after_sequence`, it closes, or `timeout` passes"""
+        with self._condition:
+            self._condition.wait_for(lambda: session.sequence > after_sequence or session.id not in self._sessions,
+                                     timeout)
+            return session.result if session.sequence > after_sequence else None
+
+    # === Scoring ===
+    def _take_batch(self):
+        """Pending frames of one model, up to batch_size, oldest first"""
+        pending = sorted((s for s in self._sessions.values() if s.pending is not None),
+                         key=lambda s: s.pending[1])
+        model_name = pending[0].model_name
+        chosen = [s for s in pending if s.model_name == model_name][:self.batch_size]
+        frames = [s.pending for s in chosen]
+        for s in chosen:
+            s.pending = None
+        return model_name, chosen, frames
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Wake up periodically even without frames, so abandoned streams are released
+                ready = self._condition.wait_for(lambda: any(s.pending is not None for s in self._sessions.values()),
+                                                 STREAM_EXPIRE_INTERVAL)
+                self._expire_idle()
+                if not ready or not any(s.pending is not None for s in self._sessions.values()):
+                    continue
+                model_name, sessions, frames = self._take_batch()
+            try:
+                self._score(model_name, sessions, frames)
+            except Exception as e:
+                print(f"⚠️ Stream scoring failed: {e}")
+
+    def _score(self, model_name, sessions, frames):
+        bundle = self._load_bundle(model_name)
+        calibration = self._calibrate(bundle)
+        width, height = bundle.input_size
+        batch = np.empty((len(frames), height, width, 3), dtype=np.float32)
+        for i, (img, _) in enumerate(frames):
+            normalize_into(img if img.size == (width, height) else img.resize((width, height)), batch[i])
+        start = time.perf_counter()
+        probabilities = np.asarray(bundle.model.predict_on_batch(batch))
+        if calibration is not None:
+            probabilities = calibration.apply(probabilities)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        done = time.time()
+        with self._condition:
+            for session, row, (_, received) in zip(sessions, probabilities, frames):
+                session.window.append(row)
+                smoothed = np.mean(session.window, axis=0)
+                index = int(np.argmax(smoothed))
+                session.scored += 1
+                session.sequence += 1
+                session.result = {
+                    "sequence": session.sequence,
+                    "class": bundle.class_names[index],
+                    "confidence": float(smoothed[index]) * 100,
+                    "frame_class": bundle.class_names[int(np.argmax(row))],
+                    "frame_confidence": float(row.max()) * 100,
+                    "window": len(session.window),
+                    "latency_ms": (done - received) * 1000,
+                    "batch_size": len(frames),
+                    "batch_ms": batch_ms,
+                    "stats": session.stats(),
+                }
+            self._condition.notify_all()
@@ -0,0 +1,119 @@
+"""TensorFlow thread-pool sizes and CPU pinning for serving processes.
+
+By default every TF process sizes its intra-op pool (the threads that
+split one conv across cores) and its inter-op pool (independent ops run
+side by side) to all cores of the host. With a Streamlit server, Flask
+workers and inference workers on one machine, that is several times more
+busy threads than cores, and throughput collapses from context switching
+and cache thrashing. Set per process, before the first model loads:
+
+    TF_INTRA_OP_THREADS=4    threads per op (0: TF default)
+    TF_INTER_OP_THREADS=1    ops in parallel (0: TF default, -1: in the calling thread)
+    INFERENCE_CPUS=0-3       pin the process to these cores (Linux; "" leaves it unpinned)
+
+`python bench_threads.py` sweeps these settings under concurrent load.
+"""
+import os
+import threading
+
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", 0))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", 0))
+INFERENCE_CPUS = os.getenv("INFERENCE_CPUS", "")
+
+_applied = None
+_lock = threading.Lock()
+
+
+def parse_cpus(spec):
+    """Sorted core ids from "0-3,6,8-9"; [] for an empty spec"""
+    cpus = set()
+    for part in str(spec).replace(" ", "").split(","):
+        if not part:
+            continue
+        low, _, high = part.partition("-")
+        cpus.update(range(int(low), int(high or low) + 1))
+    return sorted(cpus)
+
+
+def format_cpus(cpus):
+    return ",".join(str(cpu) for cpu in cpus)
+
+
+def available_cpus():
+    """Cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(workers, cpus=None):
+    """Split the available cores into `workers` disjoint, near-equal slices"""
+    cpus = cpus or available_cpus()
+    size, extra = divmod(len(cpus), workers)
+    slices, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(cpus[start:end] or cpus[i % len(cpus):i % len(cpus) + 1])
+        start = end
+    return slices
+
+
+def pin_cpus(cpus):
+    """Restrict every thread of this process to `cpus`; threads started afterwards inherit it. False where unsupported.
+
+    On Linux sched_setaffinity(0, ...) only pins the calling thread, so each
+    thread id in /proc/self/task is pinned.
+    """
+    if not cpus:
+        return False
+    if not hasattr(os, "sched_setaffinity"):
+        print("⚠️ CPU pinning is only supported on Linux; running unpinned")
+        return False
+    tids = [int(tid) for tid in os.listdir("/proc/self/task")] if os.path.isdir("/proc/self/task") else [0]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass  # the thread ended meanwhile
+    return True
+
+
+def configure_tensorflow(intra=0, inter=0):
+    """Set TF's pool sizes; they must be set before TF runs its first op"""
+    import tensorflow as tf
+
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        print(f"⚠️ TensorFlow is already initialised; thread settings not applied: {e}")
+        return False
+    return True
+
+
+def apply_serving_config(intra=None, inter=None, cpus=None):
+    """Apply pinning and pool sizes once per process, before the first model load.
+
+    Arguments default to the environment. When pinned without an explicit
+    intra-op size, the pool is sized to the pinned cores. Returns the
+    applied (intra, inter, cpus); TF is not imported when nothing is set.
+    """
+    global _applied
+    with _lock:
+        if _applied is not None:
+            return _applied
+        intra = TF_INTRA_OP_THREADS if intra is None else intra
+        inter = TF_INTER_OP_THREADS if inter is None else inter
+        cpus = INFERENCE_CPUS if cpus is None else cpus
+        cpus = parse_cpus(cpus) if isinstance(cpus, str) else list(cpus)
+        if pin_cpus(cpus) and not intra:
+            intra = len(cpus)
+        if intra or inter:
+            configure_tensorflow(intra, inter)
+        _applied = (intra, inter, cpus)
+        if intra or inter or cpus:
+            print(f"🧵 TF threads: intra-op {intra or 'default'}, inter-op {inter or 'default'}, "
+                  f"CPUs {format_cpus(cpus) or 'all'}")
+        return _applied
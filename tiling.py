@@ -0,0 +1,138 @@
+"""Tiled inference for wide, high-resolution field photos with many leaves.
+
+Squashing a photo of a whole plant row to 224x224 destroys the lesions the
+models look for. In tiled mode the photo is decoded at a bounded
+resolution and covered with overlapping 224 px tiles. Tiles with too few
+leaf-coloured pixels are skipped. The rest are scored in fixed-size batches
+written into one reusable buffer, so memory stays flat however many tiles
+there are.
+"""
+import numpy as np
+from PIL import ImageDraw
+
+from fast_preprocess import normalize_into
+from leaf_gate import MIN_SATURATION, MIN_VALUE, NotALeafImage, PLANT_HUE_RANGE
+from upload_guard import open_bounded
+
+TILE_SIZE = 224
+TILE_OVERLAP = 0.25
+TILE_BATCH_SIZE = 16
+MAX_SIDE = 2048  # longest side the photo is decoded at; bounds tile count and memory
+MIN_TILE_PLANT_RATIO = 0.2
+
+
+def decode_bounded(source, max_side=MAX_SIDE):
+    """RGB image with its longest side at most `max_side`, using JPEG draft mode where possible"""
+    img = open_bounded(source, None)
+    scale = max_side / max(img.size)
+    if scale < 1 and img.format in ("JPEG", "MPO"):
+        # Draft keeps both sides at or above the request, so ask for the aspect-preserving target:
+        # (max_side, max_side) would leave a wide panorama's short side, and the whole photo, at full scale
+        img.draft("RGB", (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    return img
+
+
+def _starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    return starts + [length - tile]  # last tile flush with the edge
+
+
+def tile_boxes(width, height, tile=(TILE_SIZE, TILE_SIZE), overlap=TILE_OVERLAP):
+    """Row-major (left, top, right, bottom) boxes of `tile` (W, H) covering the image; returns (boxes, rows, cols)"""
+    tile_width, tile_height = tile
+    xs = _starts(width, tile_width, max(1, int(tile_width * (1 - overlap))))
+    ys = _starts(height, tile_height, max(1, int(tile_height * (1 - overlap))))
+    boxes = [(x, y, min(x + tile_width, width), min(y + tile_height, height)) for y in ys for x in xs]
+    return boxes, len(ys), len(xs)
+
+
+def plant_mask(img):
+    """Boolean HxW mask of saturated green-to-brown pixels (same definition as the leaf gate)"""
+    hsv = np.asarray(img.convert("HSV"))
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    return ((saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+            & (hue >= PLANT_HUE_RANGE[0]) & (hue <= PLANT_HUE_RANGE[1]))
+
+
+def predict_tiles(model, img, class_names, input_size=(TILE_SIZE, TILE_SIZE), overlap=TILE_OVERLAP,
+                  batch_size=TILE_BATCH_SIZE, min_plant_ratio=MIN_TILE_PLANT_RATIO):
+    """Score every non-empty tile of a PIL image in fixed-size batches.
+
+    Tiles are cut at the model's `input_size` (W, H), so a bundle trained at
+    another resolution sees crops at its own scale. Returns a dict with:
+    - "class", "confidence" and "probabilities": the aggregate, a mean of
+      the tile probabilities weighted by each tile's leaf coverage;
+    - "tiles": [{box, class, confidence, plant_ratio}], boxes in the
+      coordinates of the decoded image ("image_size");
+    - "grid": a rows x cols list of class names, None for skipped tiles;
+    - "tiles_scored" / "tiles_skipped";
+    - "disease_share": the fraction of scored tiles predicted as a disease.
+    """
+    boxes, rows, cols = tile_boxes(img.width, img.height, input_size, overlap)
+    integral = np.pad(plant_mask(img).cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32), ((1, 0), (1, 0)))
+    coverage = []
+    for left, top, right, bottom in boxes:
+        area = (right - left) * (bottom - top)
+        plant = integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+        coverage.append(plant / area)
+    keep = [i for i, ratio in enumerate(coverage) if ratio >= min_plant_ratio]
+    if not keep:
+        raise NotALeafImage("no leaf-coloured region found in the photo")
+
+    width, height = input_size
+    buffer = np.empty((batch_size, height, width, 3), dtype=np.float32)
+    probabilities = np.empty((len(keep), len(class_names)), dtype=np.float32)
+    for start in range(0, len(keep), batch_size):
+        chunk = keep[start:start + batch_size]
+        for slot, index in enumerate(chunk):
+            tile = img.crop(boxes[index])
+            if tile.size != (width, height):
+                tile = tile.resize((width, height))
+            normalize_into(tile, buffer[slot])
+        probabilities[start:start + len(chunk)] = np.asarray(model.predict_on_batch(buffer[:len(chunk)]))
+
+    weights = np.array([coverage[i] for i in keep], dtype=np.float32)
+    aggregate = (probabilities * weights[:, None]).sum(axis=0) / weights.sum()
+    predicted = probabilities.argmax(axis=1)
+    grid = [[None] * cols for _ in range(rows)]
+    tiles = []
+    for row, index in enumerate(keep):
+        label = class_names[predicted[row]]
+        grid[index // cols][index % cols] = label
+        tiles.append({
+            "box": boxes[index],
+            "class": label,
+            "confidence": float(probabilities[row, predicted[row]]) * 100,
+            "plant_ratio": float(coverage[index]),
+        })
+    top = int(np.argmax(aggregate))
+    return {
+        "class": class_names[top],
+        "confidence": float(aggregate[top]) * 100,
+        "probabilities": aggregate,
+        "tiles": tiles,
+        "grid": grid,
+        "image_size": img.size,
+        "tiles_scored": len(keep),
+        "tiles_skipped": len(boxes) - len(keep),
+        "disease_share": float(np.mean(["healthy" not in tile["class"].lower() for tile in tiles])),
+    }
+
+
+def draw_tile_map(img, tiles, max_side=1024):
+    """Copy of `img` (downscaled to `max_side`) with healthy tiles outlined green and diseased ones red"""
+    overlay = img.copy()
+    overlay.thumbnail((max_side, max_side))
+    scale = overlay.width / img.width
+    draw = ImageDraw.Draw(overlay)
+    for tile in tiles:
+        box = tuple(int(v * scale) for v in tile["box"])
+        colour = (40, 200, 60) if "healthy" in tile["class"].lower() else (230, 40, 40)
+        draw.rectangle(box, outline=colour, width=max(2, int(3 * scale)))
+    return overlay
@@ -0,0 +1,87 @@
+"""Batched test-time augmentation (TTA) for hard cases.
+
+All augmented views of an image are built with vectorised array ops (flips
+are reversed-stride views; crops are one bilinear gather for all crops at
+once) and scored in a single predict_on_batch call. Their probabilities are
+then averaged. Modes:
+
+- "none":  the image as is (1 view)
+- "flips": identity, horizontal, vertical and both flips (4 views)
+- "full":  the 4 flips plus a centre crop and 3 corner crops at 87.5% (8 views)
+- "auto":  a plain pass first; "full" only when its confidence is below TTA_AUTO_THRESHOLD
+"""
+import os
+
+import numpy as np
+
+TTA_MODES = ("none", "flips", "full", "auto")
+TTA_MODE = os.getenv("TTA_MODE", "none")
+TTA_AUTO_THRESHOLD = float(os.getenv("TTA_AUTO_THRESHOLD", 0.8))
+CROP_FRACTION = 0.875
+
+
+def _flips(batch):
+    """(N, 4, H, W, C): identity, horizontal, vertical, both"""
+    return np.stack([batch, batch[:, :, ::-1], batch[:, ::-1], batch[:, ::-1, ::-1]], axis=1)
+
+
+def _crop_boxes(height, width, fraction=CROP_FRACTION):
+    """(top, left) of the centre crop and three corner crops"""
+    crop_h, crop_w = int(round(height * fraction)), int(round(width * fraction))
+    dy, dx = height - crop_h, width - crop_w
+    return [(dy // 2, dx // 2), (0, 0), (0, dx), (dy, 0)], (crop_h, crop_w)
+
+
+def _crops(batch, fraction=CROP_FRACTION):
+    """(N, 4, H, W, C): crops resized back to H x W with one bilinear gather"""
+    n, height, width, _ = batch.shape
+    corners, (crop_h, crop_w) = _crop_boxes(height, width, fraction)
+    tops = np.array([top for top, _ in corners], dtype=np.float32)[:, None]
+    lefts = np.array([left for _, left in corners], dtype=np.float32)[:, None]
+    ys = tops + (np.arange(height, dtype=np.float32) + 0.5) * (crop_h / height) - 0.5  # (V, H)
+    xs = lefts + (np.arange(width, dtype=np.float32) + 0.5) * (crop_w / width) - 0.5  # (V, W)
+    y0 = np.clip(np.floor(ys).astype(np.int64), 0, height - 1)
+    x0 = np.clip(np.floor(xs).astype(np.int64), 0, width - 1)
+    y1, x1 = np.minimum(y0 + 1, height - 1), np.minimum(x0 + 1, width - 1)
+    wy = np.clip(ys - y0, 0, 1).astype(np.float32)[None, :, :, None, None]
+    wx = np.clip(xs - x0, 0, 1).astype(np.float32)[None, :, None, :, None]
+
+    def gather(rows, cols):  # (N, V, H, W, C)
+        return batch[:, rows[:, :, None], cols[:, None, :]]
+
+    top = gather(y0, x0) * (1 - wx) + gather(y0, x1) * wx
+    bottom = gather(y1, x0) * (1 - wx) + gather(y1, x1) * wx
+    return top * (1 - wy) + bottom * wy
+
+
+def augment_views(batch, mode="full"):
+    """(N * V, H, W, C) float32 views of an (N, H, W, C) batch, image-major"""
+    batch = np.asarray(batch, dtype=np.float32)
+    if mode == "none":
+        return batch
+    views = _flips(batch)
+    if mode == "full":
+        views = np.concatenate([views, _crops(batch)], axis=1)
+    return np.ascontiguousarray(views.reshape((-1,) + batch.shape[1:]))
+
+
+def view_count(mode):
+    return {"none": 1, "flips": 4, "full": 8}[mode]
+
+
+def average_views(outputs, n):
+    """Mean over each image's consecutive views: (N * V, ...) -> (N, ...)"""
+    outputs = np.asarray(outputs)
+    return outputs.reshape((n, -1) + outputs.shape[1:]).mean(axis=1)
+
+
+def predict_tta(model, batch, mode="full"):
+    """(N, classes) probabilities averaged over the views of each image, in one forward pass"""
+    if mode == "auto":
+        probabilities = np.array(model.predict_on_batch(batch))  # a copy: RemoteModel outputs are read-only
+        hard = probabilities.max(axis=1) < TTA_AUTO_THRESHOLD
+        if hard.any():
+            probabilities[hard] = predict_tta(model, batch[hard], "full")
+        return probabilities
+    n = len(batch)
+    return average_views(model.predict_on_batch(augment_views(batch, mode)), n)
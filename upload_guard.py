@@ -0,0 +1,74 @@
+"""Size limits for uploaded images, checked before any pixel is decoded.
+
+Opening an image with PIL only parses its header, so the dimensions it
+declares are known before decoding starts. `open_bounded` rejects:
+- uploads above MAX_UPLOAD_BYTES;
+- formats outside ALLOWED_FORMATS;
+- images declaring more than MAX_IMAGE_PIXELS or a side above MAX_IMAGE_SIDE.
+
+Images that pass are downsampled while they decode. JPEGs use draft mode:
+libjpeg scales by 1/2, 1/4 or 1/8 in the DCT domain, so a 48 MP photo
+decodes as at most about 1.5 MP for a 224 px model. Other formats cannot
+be scaled during decode, so they have the tighter MAX_FULL_DECODE_PIXELS
+limit. Peak preprocessing memory per request is therefore at most about
+MAX_FULL_DECODE_PIXELS x 4 bytes, whatever is uploaded.
+"""
+import os
+import warnings
+from io import BytesIO
+
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))  # JPEGs, decoded at a reduced scale
+MAX_FULL_DECODE_PIXELS = int(os.getenv("MAX_FULL_DECODE_PIXELS", 16_000_000))  # PNG, WebP, ... decode in full
+MAX_IMAGE_SIDE = 20_000
+ALLOWED_FORMATS = ("JPEG", "MPO", "PNG", "WEBP", "BMP", "TIFF", "PPM")  # everything leaf_dataset lists, too
+
+# Any other Image.open in the process (st.image, thumbnails, ...) refuses bombs too. PIL's warning
+# between 1x and 2x this limit is silenced: check_dimensions rejects those images with a clear reason.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+warnings.filterwarnings("ignore", category=Image.DecompressionBombWarning)
+
+
+class UploadRejected(ValueError):
+    """An upload refused before decoding; `too_large` tells size limits apart from unsupported files"""
+
+    def __init__(self, reason, too_large=False):
+        super().__init__(reason)
+        self.reason = reason
+        self.too_large = too_large
+
+
+def check_upload_bytes(image_bytes, limit=MAX_UPLOAD_BYTES):
+    if len(image_bytes) > limit:
+        raise UploadRejected(f"upload is {len(image_bytes)} bytes, the limit is {limit}", too_large=True)
+
+
+def check_dimensions(img):
+    """Validate the header-declared size and format of an opened, not yet decoded, image"""
+    if img.format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"unsupported image format {img.format}")
+    width, height = img.size
+    if width < 1 or height < 1:
+        raise UploadRejected("image declares no pixels")
+    limit = MAX_IMAGE_PIXELS if img.format in ("JPEG", "MPO") else MAX_FULL_DECODE_PIXELS
+    if max(width, height) > MAX_IMAGE_SIDE or width * height > limit:
+        raise UploadRejected(f"{width}x{height} {img.format} exceeds the {limit / 1e6:.0f} MP limit", too_large=True)
+
+
+def open_bounded(source, decode_size):
+    """Image.open with the limits above enforced and JPEG draft mode set so decoding stops near `decode_size` (W, H).
+
+    Pass None as `decode_size` to set the draft yourself from the declared `img.size`.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError:
+        raise UploadRejected(f"image declares more than {2 * MAX_IMAGE_PIXELS / 1e6:.0f} MP", too_large=True)
+    check_dimensions(img)
+    if decode_size is not None and img.format in ("JPEG", "MPO"):
+        img.draft("RGB", tuple(decode_size))
+    return img
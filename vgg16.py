@@ -7,6 +7,7 @@ from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, Dropout, GlobalAveragePooling2D
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import ModelCheckpoint
+from model_bundle import save_bundle
 
 # === Path to dataset ===
 data_dir = r"E:\plant detection\new"
@@ -17,6 +18,7 @@ batch_size = 32
 epochs = 10
 learning_rate = 1e-4
 model_save_path = "plant_disease_vgg16_e10.keras"
+bundle_dir = "models/plant_disease_vgg16_e10"
 
 # === Data Augmentation ===
 datagen = ImageDataGenerator(
@@ -84,6 +86,26 @@ print(f"\n✅ Validation Accuracy: {accuracy * 100:.2f}%")
 model.save(model_save_path)
 print(f"✅ Model saved to: {model_save_path}")
 
+# === Save Model Bundle (weights + class manifest for inference hosts) ===
+class_names = [name for name, _ in sorted(train_data.class_indices.items(), key=lambda item: item[1])]
+manifest = save_bundle(
+    model,
+    bundle_dir,
+    name="VGG16",
+    class_names=class_names,
+    input_size=img_size,
+    training={
+        "architecture": "VGG16",
+        "epochs": epochs,
+        "batch_size": batch_size,
+        "learning_rate": learning_rate,
+        "train_samples": train_data.samples,
+        "val_samples": val_data.samples,
+        "val_accuracy": float(accuracy),
+    },
+)
+print(f"✅ Bundle v{manifest['version']} saved to: {bundle_dir}")
+
 # === Accuracy Plot ===
 plt.plot(history.history['accuracy'], label='Train Accuracy')
 plt.plot(history.history['val_accuracy'], label='Validation Accuracy')